@@ -0,0 +1,133 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import duckdb
+
+# Make the pipeline scripts importable when run from anywhere
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import pipeline_metrics
+import step5_added_features
+from bench_feature_materialization import create_synthetic_deliveries
+
+# The three-statement deliveries path that the single windowed UPDATE replaced
+THREE_STATEMENT_UPDATES = [
+    "ALTER TABLE deliveries ADD COLUMN IF NOT EXISTS boundary_type VARCHAR;",
+    "ALTER TABLE deliveries ADD COLUMN IF NOT EXISTS is_dot_ball BOOLEAN;",
+    "ALTER TABLE deliveries ADD COLUMN IF NOT EXISTS cumulative_runs_in_innings INTEGER;",
+    "ALTER TABLE deliveries ADD COLUMN IF NOT EXISTS ball_in_over INTEGER;",
+    """
+    UPDATE deliveries SET
+      boundary_type = CASE
+        WHEN batter_runs = 4 THEN 'four'
+        WHEN batter_runs = 6 THEN 'six'
+        ELSE NULL
+      END,
+      is_dot_ball = CASE
+        WHEN total_runs = 0 THEN TRUE
+        ELSE FALSE
+      END;
+    """,
+    """
+    UPDATE deliveries SET
+      cumulative_runs_in_innings = t.cum_runs
+    FROM (
+      SELECT
+        delivery_id,
+        SUM(total_runs) OVER (
+          PARTITION BY innings_id
+          ORDER BY over_number, ball_number
+        ) AS cum_runs
+      FROM deliveries
+    ) t
+    WHERE deliveries.delivery_id = t.delivery_id;
+    """,
+    """
+    UPDATE deliveries SET
+      ball_in_over = t.ball_num
+    FROM (
+      SELECT
+        delivery_id,
+        ROW_NUMBER() OVER (
+          PARTITION BY over_id
+          ORDER BY ball_number
+        ) AS ball_num
+      FROM deliveries
+    ) t
+    WHERE deliveries.delivery_id = t.delivery_id;
+    """
+]
+
+FEATURE_COLUMNS = ['boundary_type', 'is_dot_ball', 'cumulative_runs_in_innings', 'ball_in_over']
+
+def run_path(db_path, path):
+    """Add deliveries features with one path and return the elapsed seconds"""
+    conn = duckdb.connect(db_path)
+    try:
+        start = time.perf_counter()
+        if path == 'three_statement':
+            for sql in THREE_STATEMENT_UPDATES:
+                conn.execute(sql)
+        else:
+            step5_added_features.add_deliveries_features(conn)
+        conn.execute("CHECKPOINT")
+        return time.perf_counter() - start
+    finally:
+        conn.close()
+
+def main():
+    """Benchmark the single windowed deliveries UPDATE against the three-statement path"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--db', help="Existing post-step4 database to copy (default: synthetic deliveries)")
+    parser.add_argument('--rows', type=int, default=1_000_000, help="Synthetic deliveries rows")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_deliveries_')
+    # Keep the metrics of the benchmarked calls out of the pipeline's data directory
+    pipeline_metrics.METRICS_PATH = os.path.join(work_dir, 'pipeline_metrics.jsonl')
+    source_db = os.path.join(work_dir, 'source.duckdb')
+
+    try:
+        if args.db:
+            shutil.copyfile(args.db, source_db)
+        else:
+            conn = duckdb.connect(source_db)
+            create_synthetic_deliveries(conn, args.rows)
+            conn.execute("CHECKPOINT")
+            conn.close()
+
+        results = {}
+        for path in ['three_statement', 'single_pass']:
+            path_db = os.path.join(work_dir, f"{path}.duckdb")
+            shutil.copyfile(source_db, path_db)
+            results[path] = run_path(path_db, path)
+            print(f"- {path}: {results[path]:.2f}s")
+
+        # Both paths must produce the same columns
+        conn = duckdb.connect(os.path.join(work_dir, 'three_statement.duckdb'))
+        conn.execute(f"ATTACH '{os.path.join(work_dir, 'single_pass.duckdb')}' AS single_pass (READ_ONLY)")
+        columns = ", ".join(['delivery_id'] + FEATURE_COLUMNS)
+        mismatches = conn.execute(f"""
+        SELECT COUNT(*) FROM (
+            SELECT {columns} FROM deliveries
+            EXCEPT ALL
+            SELECT {columns} FROM single_pass.deliveries
+        )
+        """).fetchone()[0]
+        conn.close()
+        print(f"Rows that differ between paths: {mismatches}")
+
+        print(f"Single pass/three statements time ratio: "
+              f"{results['single_pass'] / results['three_statement']:.2f}")
+
+        return results
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import duckdb
+
+# Make the pipeline scripts importable when run from anywhere
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import pipeline_metrics
+import step5_added_features
+
+def create_synthetic_deliveries(conn, rows):
+    """Create a deliveries table with the post-step4 schema and `rows` rows"""
+    # 6 balls an over, 20 overs an innings, 2 innings a match
+    conn.execute(f"""
+    CREATE TABLE deliveries AS
+    WITH numbered AS (
+        SELECT
+            i,
+            CAST(i // 240 AS VARCHAR) AS match_id,
+            (i // 120) % 2 + 1 AS innings_number,
+            (i // 6) % 20 AS over_number,
+            i % 6 + 1 AS ball_number
+        FROM range({rows}) t(i)
+    )
+    SELECT
+        match_id || '_' || innings_number || '_' || over_number || '_' || ball_number AS delivery_id,
+        match_id || '_' || innings_number || '_' || over_number AS over_id,
+        match_id || '_' || innings_number AS innings_id,
+        match_id,
+        CAST(over_number AS SMALLINT) AS over_number,
+        CAST(ball_number AS TINYINT) AS ball_number,
+        'Batter ' || (i % 11) AS batter,
+        'B' || (i % 11) AS batter_id,
+        'Bowler ' || (i % 5) AS bowler,
+        'W' || (i % 5) AS bowler_id,
+        'Batter ' || ((i + 1) % 11) AS non_striker,
+        'B' || ((i + 1) % 11) AS non_striker_id,
+        CAST([0, 0, 1, 1, 2, 4, 6, 0][i % 8 + 1] AS TINYINT) AS batter_runs,
+        CAST(CASE WHEN i % 29 = 0 THEN 1 ELSE 0 END AS TINYINT) AS extras,
+        CAST([0, 0, 1, 1, 2, 4, 6, 0][i % 8 + 1] + CASE WHEN i % 29 = 0 THEN 1 ELSE 0 END AS TINYINT) AS total_runs,
+        CASE WHEN i % 29 = 0 THEN 'wides' END AS extras_type,
+        CAST(CASE WHEN i % 29 = 0 THEN 1 ELSE 0 END AS TINYINT) AS extras_value,
+        i % 23 = 0 AS is_wicket,
+        CASE WHEN i % 23 = 0 THEN 'Batter ' || (i % 11) END AS wicket_player_out,
+        CASE WHEN i % 23 = 0 THEN 'B' || (i % 11) END AS wicket_player_out_id,
+        CASE WHEN i % 23 = 0 THEN 'caught' END AS wicket_kind,
+        CAST(NULL AS VARCHAR) AS wicket_fielder,
+        CAST(NULL AS VARCHAR) AS wicket_fielder_id
+    FROM numbered
+    """)
+
+def run_materialization(db_path, mode):
+    """Add deliveries features with one mode and return (seconds, file bytes)"""
+    conn = duckdb.connect(db_path)
+    try:
+        start = time.perf_counter()
+        if mode == 'ctas':
+            step5_added_features.materialize_features_ctas(conn, 'deliveries')
+        else:
+            step5_added_features.add_deliveries_features(conn)
+        conn.execute("CHECKPOINT")
+        elapsed = time.perf_counter() - start
+    finally:
+        conn.close()
+
+    return elapsed, os.path.getsize(db_path)
+
+def main():
+    """Benchmark UPDATE vs CTAS-swap feature materialization on deliveries"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--db', help="Existing post-step4 database to copy (default: synthetic deliveries)")
+    parser.add_argument('--rows', type=int, default=1_000_000, help="Synthetic deliveries rows")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_materialization_')
+    # Keep the metrics of the benchmarked calls out of the pipeline's data directory
+    pipeline_metrics.METRICS_PATH = os.path.join(work_dir, 'pipeline_metrics.jsonl')
+    source_db = os.path.join(work_dir, 'source.duckdb')
+
+    try:
+        if args.db:
+            shutil.copyfile(args.db, source_db)
+        else:
+            conn = duckdb.connect(source_db)
+            create_synthetic_deliveries(conn, args.rows)
+            conn.execute("CHECKPOINT")
+            conn.close()
+
+        conn = duckdb.connect(source_db, read_only=True)
+        rows = conn.execute("SELECT COUNT(*) FROM deliveries").fetchone()[0]
+        conn.close()
+        base_size = os.path.getsize(source_db)
+        print(f"deliveries rows: {rows}, database size before features: {base_size / 1e6:.1f} MB")
+
+        results = {}
+        for mode in ['update', 'ctas']:
+            mode_db = os.path.join(work_dir, f"{mode}.duckdb")
+            shutil.copyfile(source_db, mode_db)
+            results[mode] = run_materialization(mode_db, mode)
+            print(f"- {mode}: {results[mode][0]:.2f}s, database size {results[mode][1] / 1e6:.1f} MB")
+
+        update_time, update_size = results['update']
+        ctas_time, ctas_size = results['ctas']
+        print(f"CTAS/UPDATE time ratio: {ctas_time / update_time:.2f}, "
+              f"size delta (CTAS - UPDATE): {(ctas_size - update_size) / 1e6:+.1f} MB")
+
+        return results
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
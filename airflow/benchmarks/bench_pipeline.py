@@ -0,0 +1,241 @@
+import argparse
+import importlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import duckdb
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Make the pipeline scripts importable when run from anywhere
+sys.path.insert(0, SCRIPTS_DIR)
+
+from generate_corpus import generate_corpus
+
+STEPS = {
+    'step1': 'step1_unzipping',
+    'step2': 'step2_quality_assessment_pre',
+    'step3': 'step3_unnesting',
+    'step4': 'step4_quality_assessment_post',
+    'step5': 'step5_added_features'
+}
+
+DEFAULT_SCALES = [1000, 10000, 100000]
+DEFAULT_BASELINE_PATH = os.path.join(BENCHMARKS_DIR, 'pipeline_baseline.json')
+
+# Allowed regression against the baseline before the suite fails
+DEFAULT_TOLERANCE = 0.25
+
+# Functions faster than this in the baseline are too noisy to compare
+MIN_COMPARED_SECONDS = 1.0
+
+def run_step(step, result_path):
+    """Run one step's main() in this process and write its timing and peak RSS"""
+    from pipeline_metrics import peak_rss_mb
+
+    module = importlib.import_module(STEPS[step])
+    start = time.perf_counter()
+    status = 'success'
+    try:
+        result = module.main()
+        # Steps 4 and 5 report errors instead of raising them
+        if isinstance(result, dict) and result.get('status') == 'error':
+            status = 'error'
+    except Exception as e:
+        print(f"Error in {step}: {e}")
+        status = 'error'
+    seconds = time.perf_counter() - start
+
+    with open(result_path, 'w') as f:
+        json.dump({'status': status, 'seconds': seconds, 'peak_rss_mb': peak_rss_mb()}, f)
+
+def metrics_path_for(data_dir):
+    """Metrics file of the timed steps, kept in the benchmark's own data directory"""
+    return os.path.join(data_dir, 'pipeline_metrics.jsonl')
+
+def run_step_process(step, data_dir):
+    """Run a step in a fresh process against data_dir, as an Airflow task would"""
+    result_path = os.path.join(data_dir, f"bench_{step}.json")
+    log_path = os.path.join(data_dir, f"bench_{step}.log")
+    env = dict(os.environ, CRICKET_DATA_DIR=data_dir, CRICKET_METRICS_PATH=metrics_path_for(data_dir))
+
+    with open(log_path, 'w') as log:
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--step', step, '--result', result_path],
+            env=env, stdout=log, stderr=subprocess.STDOUT, check=False
+        )
+
+    if not os.path.exists(result_path):
+        return {'status': 'error', 'seconds': None, 'peak_rss_mb': None}
+    with open(result_path, 'r') as f:
+        return json.load(f)
+
+def function_timings(metrics_path):
+    """Total wall seconds per instrumented function from the pipeline metrics file"""
+    timings = defaultdict(float)
+    if os.path.exists(metrics_path):
+        with open(metrics_path, 'r') as f:
+            for line in f:
+                record = json.loads(line)
+                timings[record['stage']] += record['wall_seconds']
+    return dict(sorted(timings.items()))
+
+def corpus_path(corpus_dir, matches, seed):
+    """Generated corpus for a scale, reused across runs"""
+    path = os.path.join(corpus_dir, f"corpus_{matches}_{seed}.zip")
+    if not os.path.exists(path):
+        print(f"Generating {matches} matches...")
+        partial_path = os.path.join(corpus_dir, f"corpus_{matches}_{seed}.partial.zip")
+        generate_corpus(partial_path, matches, {'seed': seed})
+        os.replace(partial_path, path)
+    return path
+
+def bench_scale(matches, corpus_dir, work_dir, seed):
+    """Run steps 1-5 on a generated corpus and return the scale's metrics"""
+    data_dir = os.path.join(work_dir, f"data_{matches}")
+    shutil.rmtree(data_dir, ignore_errors=True)
+    os.makedirs(data_dir)
+    # Step 1 reads all_json.zip from the data directory
+    os.symlink(os.path.abspath(corpus_path(corpus_dir, matches, seed)), os.path.join(data_dir, 'all_json.zip'))
+    db_path = os.path.join(data_dir, 'cricket_analytics.db')
+
+    results = {'matches': matches, 'steps': {}}
+    deliveries = None
+    for step in STEPS:
+        step_result = run_step_process(step, data_dir)
+        print(f"- {matches} matches, {step}: {step_result['status']} in {step_result['seconds'] or 0:.2f}s, "
+              f"peak RSS {step_result['peak_rss_mb'] or 0:.0f} MB")
+        if step_result['status'] != 'success':
+            raise RuntimeError(f"{step} failed at {matches} matches, see {os.path.join(data_dir, f'bench_{step}.log')}")
+
+        if step == 'step3':
+            conn = duckdb.connect(db_path, read_only=True)
+            deliveries = conn.execute("SELECT COUNT(*) FROM deliveries").fetchone()[0]
+            conn.close()
+            results['db_bytes_step3'] = os.path.getsize(db_path)
+
+        seconds = step_result['seconds']
+        step_result['files_per_second'] = matches / seconds
+        if deliveries is not None:
+            step_result['deliveries_per_second'] = deliveries / seconds
+        results['steps'][step] = step_result
+
+    results['deliveries'] = deliveries
+    results['db_bytes'] = os.path.getsize(db_path)
+    results['functions'] = function_timings(metrics_path_for(data_dir))
+    return results
+
+def flat_metrics(results):
+    """Comparable metrics of one scale as {name: value}"""
+    metrics = {'db_bytes': results['db_bytes'], 'db_bytes_step3': results['db_bytes_step3']}
+    for step, step_result in results['steps'].items():
+        for name in ['seconds', 'peak_rss_mb', 'files_per_second', 'deliveries_per_second']:
+            if step_result.get(name) is not None:
+                metrics[f"{step}.{name}"] = step_result[name]
+    for function, seconds in results['functions'].items():
+        metrics[f"function.{function}.seconds"] = seconds
+    return metrics
+
+def find_regressions(results, baseline, tolerance=DEFAULT_TOLERANCE, min_seconds=MIN_COMPARED_SECONDS):
+    """Metrics worse than the baseline by more than tolerance, as readable lines"""
+    current = flat_metrics(results)
+    previous = flat_metrics(baseline)
+    regressions = []
+
+    for name, before in previous.items():
+        after = current.get(name)
+        if after is None or not before:
+            continue
+        if name.endswith('.seconds') and before < min_seconds:
+            continue
+
+        # Throughput should not drop; time, memory and size should not grow
+        if name.endswith('_per_second'):
+            change = (before - after) / before
+        else:
+            change = (after - before) / before
+        if change > tolerance:
+            regressions.append(f"{name}: {before:.4g} -> {after:.4g} ({change:+.0%} worse)")
+
+    return regressions
+
+def main():
+    """Benchmark steps 1-5 end to end on generated corpora and compare with a baseline"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--scales', default=','.join(str(scale) for scale in DEFAULT_SCALES),
+                        help="Comma separated numbers of matches")
+    parser.add_argument('--seed', type=int, default=42, help="Corpus generator seed")
+    parser.add_argument('--corpus-dir', help="Where generated corpora are kept between runs (default: work dir)")
+    parser.add_argument('--work-dir', help="Where the pipeline data of each scale is written (default: temporary)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help="Baseline results file")
+    parser.add_argument('--save-baseline', action='store_true', help="Store these results as the baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="Allowed regression, 0.25 = 25%%")
+    parser.add_argument('--min-seconds', type=float, default=MIN_COMPARED_SECONDS,
+                        help="Skip timings below this in the baseline")
+    parser.add_argument('--output', help="Also write the results to this file")
+    # Internal: run a single step in a child process
+    parser.add_argument('--step', choices=list(STEPS), help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.step:
+        run_step(args.step, args.result)
+        return None
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='bench_pipeline_')
+    corpus_dir = args.corpus_dir or work_dir
+    os.makedirs(work_dir, exist_ok=True)
+    os.makedirs(corpus_dir, exist_ok=True)
+
+    # A failing scale keeps its data directory and step logs for inspection
+    results = {}
+    for scale in [int(scale) for scale in args.scales.split(',')]:
+        results[str(scale)] = bench_scale(scale, corpus_dir, work_dir, args.seed)
+        shutil.rmtree(os.path.join(work_dir, f"data_{scale}"), ignore_errors=True)
+    if not args.work_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+    regressions = []
+    for scale, scale_results in results.items():
+        steps = scale_results['steps']
+        print(f"{scale} matches: {scale_results['deliveries']} deliveries, "
+              f"database {scale_results['db_bytes'] / 1024 ** 2:.1f} MB, "
+              f"step3 {steps['step3']['deliveries_per_second']:.0f} deliveries/s, "
+              f"total {sum(step['seconds'] for step in steps.values()):.1f}s")
+        if scale in baseline:
+            regressions += [f"{scale} matches, {line}"
+                            for line in find_regressions(scale_results, baseline[scale], args.tolerance, args.min_seconds)]
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif regressions:
+        print("Regressions against the baseline:")
+        for line in regressions:
+            print(f"- {line}")
+        sys.exit(1)
+    elif baseline:
+        print(f"No regressions beyond {args.tolerance:.0%}")
+
+    return results
+
+if __name__ == "__main__":
+    main()
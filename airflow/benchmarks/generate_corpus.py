@@ -0,0 +1,315 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import zipfile
+from datetime import date, timedelta
+from multiprocessing import Pool
+
+# Generation settings; every one can be overridden from the command line
+DEFAULT_SETTINGS = {
+    'seed': 42,
+    'first_match_id': 1000001,
+    # Share of each match type in the corpus
+    'match_types': {'T20': 0.45, 'IT20': 0.2, 'ODI': 0.25, 'Test': 0.1},
+    # Overs per innings and innings per match; None keeps the match type's own
+    'overs_per_innings': None,
+    'innings_per_match': None,
+    # Share of players listed in info.registry.people
+    'registry_coverage': 0.95,
+    # Chance that a delivery has extras or a wicket
+    'extras_rate': 0.06,
+    'wicket_rate': 0.035,
+    # Share of files that are not valid JSON
+    'malformed_rate': 0.002
+}
+
+# Scheduled overs per innings and innings per match of each match type
+MATCH_FORMATS = {
+    'T20': (20, 2),
+    'IT20': (20, 2),
+    'ODI': (50, 2),
+    'ODM': (50, 2),
+    'Test': (90, 4),
+    'MDM': (90, 4)
+}
+
+TEAMS = [
+    'Afghanistan', 'Australia', 'Bangladesh', 'England', 'India', 'Ireland', 'Nepal',
+    'Netherlands', 'New Zealand', 'Pakistan', 'Scotland', 'South Africa', 'Sri Lanka',
+    'West Indies', 'Zimbabwe'
+]
+
+VENUES = [
+    ("Lord's", 'London'), ('Eden Gardens', 'Kolkata'), ('Melbourne Cricket Ground', 'Melbourne'),
+    ('Wankhede Stadium', 'Mumbai'), ('Newlands', 'Cape Town'), ('Gaddafi Stadium', 'Lahore'),
+    ('R Premadasa Stadium', 'Colombo'), ('Sharjah Cricket Stadium', 'Sharjah'),
+    ('Kensington Oval', 'Bridgetown'), ('Eden Park', 'Auckland'), ('Sylhet International Cricket Stadium', 'Sylhet'),
+    ('Harare Sports Club', 'Harare')
+]
+
+# Players in each team's pool, of whom 11 play a match
+SQUAD_SIZE = 30
+
+# Runs off the bat and how often they are scored
+BATTER_RUNS = [0, 1, 2, 3, 4, 6]
+BATTER_RUNS_WEIGHTS = [38, 35, 10, 2, 11, 4]
+
+EXTRAS_TYPES = ['wides', 'noballs', 'legbyes', 'byes']
+EXTRAS_WEIGHTS = [45, 15, 25, 15]
+
+WICKET_KINDS = ['caught', 'bowled', 'lbw', 'run out', 'stumped', 'caught and bowled']
+WICKET_WEIGHTS = [55, 18, 14, 7, 3, 3]
+
+FIRST_DATE = date(2005, 1, 1)
+
+def team_players(team):
+    """Player pool of a team"""
+    initials = ''.join(word[0] for word in team.split())
+    return [f"{initials} Player{number}" for number in range(SQUAD_SIZE)]
+
+def registry_id(name):
+    """Stable 8-character registry identifier of a player"""
+    return hashlib.md5(name.encode('utf-8')).hexdigest()[:8]
+
+def match_random(settings, match_id):
+    """Random generator of one match, so each match only depends on the seed and its id"""
+    return random.Random(f"{settings['seed']}:{match_id}")
+
+def generate_innings(rng, settings, batting, bowling, overs, target=None):
+    """Overs of one innings, ended by 10 wickets, the overs limit or a reached target"""
+    order = list(batting)
+    bowlers = bowling[-6:]
+    striker, non_striker, next_batter = order[0], order[1], 2
+    runs = wickets = 0
+    innings_overs = []
+    bowler = None
+
+    for over_number in range(overs):
+        bowler = rng.choice([player for player in bowlers if player != bowler])
+        deliveries = []
+        legal_balls = 0
+
+        while legal_balls < 6:
+            batter_runs = rng.choices(BATTER_RUNS, BATTER_RUNS_WEIGHTS)[0]
+            delivery = {'batter': striker, 'bowler': bowler, 'non_striker': non_striker}
+            extras = 0
+
+            if rng.random() < settings['extras_rate']:
+                extras_type = rng.choices(EXTRAS_TYPES, EXTRAS_WEIGHTS)[0]
+                extras = 1 if extras_type in ('wides', 'noballs') else rng.choice([1, 1, 2, 4])
+                if extras_type != 'noballs':
+                    batter_runs = 0
+                delivery['extras'] = {extras_type: extras}
+                if extras_type not in ('wides', 'noballs'):
+                    legal_balls += 1
+            else:
+                legal_balls += 1
+
+            delivery['runs'] = {'batter': batter_runs, 'extras': extras, 'total': batter_runs + extras}
+            runs += batter_runs + extras
+
+            if rng.random() < settings['wicket_rate']:
+                kind = rng.choices(WICKET_KINDS, WICKET_WEIGHTS)[0]
+                player_out = non_striker if kind == 'run out' and rng.random() < 0.3 else striker
+                wicket = {'player_out': player_out, 'kind': kind}
+                if kind in ('caught', 'run out', 'stumped'):
+                    wicket['fielders'] = [{'name': rng.choice(bowling)}]
+                delivery['wickets'] = [wicket]
+                wickets += 1
+
+                if wickets == 10:
+                    deliveries.append(delivery)
+                    break
+                if player_out == striker:
+                    striker = order[next_batter]
+                else:
+                    non_striker = order[next_batter]
+                next_batter += 1
+            elif (batter_runs + extras) % 2 == 1:
+                striker, non_striker = non_striker, striker
+
+            deliveries.append(delivery)
+            if target is not None and runs >= target:
+                break
+
+        innings_overs.append({'over': over_number, 'deliveries': deliveries})
+        if wickets == 10 or (target is not None and runs >= target):
+            break
+        striker, non_striker = non_striker, striker
+
+    return innings_overs, runs, wickets
+
+def generate_match(settings, match_id):
+    """One match as a Cricsheet JSON document"""
+    rng = match_random(settings, match_id)
+
+    types = list(settings['match_types'])
+    match_type = rng.choices(types, [settings['match_types'][name] for name in types])[0]
+    overs, innings_count = MATCH_FORMATS.get(match_type, MATCH_FORMATS['T20'])
+    overs = settings['overs_per_innings'] or overs
+    innings_count = settings['innings_per_match'] or innings_count
+    limited_overs = match_type not in ('Test', 'MDM')
+
+    teams = rng.sample(TEAMS, 2)
+    players = {team: rng.sample(team_players(team), 11) for team in teams}
+    toss_winner = rng.choice(teams)
+    toss_decision = rng.choice(['bat', 'field'])
+    batting_first = toss_winner if toss_decision == 'bat' else [team for team in teams if team != toss_winner][0]
+    batting_order = [batting_first, [team for team in teams if team != batting_first][0]]
+
+    innings = []
+    totals = {team: 0 for team in teams}
+    last_runs = last_wickets = 0
+    target = None
+    for number in range(innings_count):
+        batting = batting_order[number % 2]
+        bowling = batting_order[(number + 1) % 2]
+        # Only the last innings chases a target
+        if number == innings_count - 1 and number > 0:
+            target = totals[bowling] - totals[batting] + 1
+
+        innings_overs, last_runs, last_wickets = generate_innings(
+            rng, settings, players[batting], players[bowling], overs,
+            target if target is not None and target > 0 else None
+        )
+        totals[batting] += last_runs
+        inning = {'team': batting, 'overs': innings_overs}
+        if limited_overs:
+            inning['powerplays'] = [{'from': 0.1, 'to': 5.6 if overs <= 20 else 9.6, 'type': 'mandatory'}]
+        if target is not None and target > 0:
+            inning['target'] = {'runs': target, 'overs': overs}
+        innings.append(inning)
+
+    first, second = batting_order
+    if totals[second] > totals[first]:
+        outcome = {'winner': second, 'by': {'wickets': 10 - last_wickets}}
+    elif totals[first] > totals[second] and (limited_overs or last_wickets == 10):
+        outcome = {'winner': first, 'by': {'runs': totals[first] - totals[second]}}
+    elif totals[first] == totals[second]:
+        outcome = {'result': 'tie'}
+    else:
+        outcome = {'result': 'draw'}
+    if limited_overs and 'winner' in outcome and rng.random() < 0.03:
+        outcome['method'] = 'D/L'
+
+    everyone = players[teams[0]] + players[teams[1]]
+    match_date = FIRST_DATE + timedelta(days=rng.randrange(365 * 20))
+    venue, city = rng.choice(VENUES)
+
+    info = {
+        'balls_per_over': 6,
+        'city': city,
+        'dates': [match_date.isoformat()],
+        'event': {'name': f"{match_type} Series {match_date.year}", 'match_number': rng.randint(1, 5)},
+        'gender': 'male' if rng.random() < 0.85 else 'female',
+        'match_type': match_type,
+        'outcome': outcome,
+        'player_of_match': [rng.choice(everyone)],
+        'players': players,
+        'registry': {'people': {
+            name: registry_id(name) for name in everyone if rng.random() < settings['registry_coverage']
+        }},
+        'season': str(match_date.year),
+        'team_type': 'international',
+        'teams': teams,
+        'toss': {'winner': toss_winner, 'decision': toss_decision},
+        'venue': venue
+    }
+    if limited_overs:
+        info['overs'] = overs
+
+    return {
+        'meta': {'data_version': '1.1.0', 'created': match_date.isoformat(), 'revision': 1},
+        'info': info,
+        'innings': innings
+    }
+
+def match_file(settings, match_id):
+    """(file name, JSON text, delivery count) of one match; malformed files are cut short"""
+    match = generate_match(settings, match_id)
+    text = json.dumps(match)
+    deliveries = sum(len(over['deliveries']) for inning in match['innings'] for over in inning['overs'])
+
+    rng = match_random(settings, f"malformed:{match_id}")
+    if rng.random() < settings['malformed_rate']:
+        return f"{match_id}.json", text[:rng.randrange(len(text) // 2)], 0
+    return f"{match_id}.json", text, deliveries
+
+def _match_file(args):
+    return match_file(*args)
+
+def generate_corpus(output, matches, settings=None, workers=None):
+    """Write `matches` Cricsheet JSON files to a directory, or a zip when output ends in .zip
+
+    The same settings always give byte-identical files, whatever the number
+    of workers.
+    """
+    settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+    match_ids = range(settings['first_match_id'], settings['first_match_id'] + matches)
+    as_zip = output.endswith('.zip')
+
+    if as_zip:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        archive = zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED)
+    else:
+        os.makedirs(output, exist_ok=True)
+
+    summary = {'output': output, 'matches': matches, 'malformed': 0, 'deliveries': 0, 'bytes': 0}
+    try:
+        with Pool(workers or os.cpu_count()) as pool:
+            files = pool.imap(_match_file, ((settings, match_id) for match_id in match_ids), chunksize=64)
+            for count, (name, text, deliveries) in enumerate(files, 1):
+                if as_zip:
+                    # Fixed timestamps keep the archive reproducible
+                    archive.writestr(zipfile.ZipInfo(name, date_time=(2020, 1, 1, 0, 0, 0)), text,
+                                     compress_type=zipfile.ZIP_DEFLATED)
+                else:
+                    with open(os.path.join(output, name), 'w') as f:
+                        f.write(text)
+
+                summary['malformed'] += deliveries == 0
+                summary['deliveries'] += deliveries
+                summary['bytes'] += len(text)
+                if count % 10000 == 0:
+                    print(f"Generated {count}/{matches} matches")
+    finally:
+        if as_zip:
+            archive.close()
+
+    print(f"Generated {matches} matches ({summary['malformed']} malformed, "
+          f"{summary['deliveries']} deliveries) in {output}")
+    return summary
+
+def parse_match_types(value):
+    """'T20=0.5,ODI=0.3,Test=0.2' as a dict of weights"""
+    weights = {}
+    for item in value.split(','):
+        name, weight = item.split('=')
+        weights[name.strip()] = float(weight)
+    return weights
+
+def main():
+    """Generate a deterministic synthetic Cricsheet corpus for scale testing"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('output', help="Directory to write, or a .zip such as <data_dir>/all_json.zip for step 1")
+    parser.add_argument('--matches', type=int, default=1000, help="Number of matches")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SETTINGS['seed'])
+    parser.add_argument('--first-match-id', type=int, default=DEFAULT_SETTINGS['first_match_id'])
+    parser.add_argument('--match-types', type=parse_match_types,
+                        default=DEFAULT_SETTINGS['match_types'], help="Weights, e.g. T20=0.5,ODI=0.3,Test=0.2")
+    parser.add_argument('--overs-per-innings', type=int, help="Override the scheduled overs of every match type")
+    parser.add_argument('--innings-per-match', type=int, help="Override the innings of every match type")
+    parser.add_argument('--registry-coverage', type=float, default=DEFAULT_SETTINGS['registry_coverage'])
+    parser.add_argument('--extras-rate', type=float, default=DEFAULT_SETTINGS['extras_rate'])
+    parser.add_argument('--wicket-rate', type=float, default=DEFAULT_SETTINGS['wicket_rate'])
+    parser.add_argument('--malformed-rate', type=float, default=DEFAULT_SETTINGS['malformed_rate'])
+    parser.add_argument('--workers', type=int, help="Worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    settings = {key: getattr(args, key) for key in DEFAULT_SETTINGS}
+    return generate_corpus(args.output, args.matches, settings, args.workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+from airflow import DAG
+from airflow.operators.trigger_dagrun import TriggerDagRunOperator
+from airflow.sensors.python import PythonSensor
+from datetime import datetime, timedelta
+import sys
+import os
+
+# Add the scripts directory to Python path
+sys.path.append(os.environ.get('CRICKET_SCRIPTS_DIR',
+                               os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')))
+
+default_args = {
+    'owner': 'lohit',
+    'depends_on_past': False,
+    'start_date': datetime(2024, 1, 1),
+    'email_on_failure': False,
+    'email_on_retry': False,
+    'retries': 1,
+    'retry_delay': timedelta(minutes=5),
+}
+
+def check_archive_changed():
+    """Poke: has data/all_json.zip changed since it was last loaded?"""
+    import step1_unzipping
+    return step1_unzipping.archive_changed()
+
+with DAG(
+    'cricket_archive_watch',
+    default_args=default_args,
+    description='Start an incremental pipeline run when the archive changes',
+    schedule_interval=timedelta(hours=1),
+    catchup=False,
+    max_active_runs=1,
+    tags=['cricket', 'data-engineering']
+) as dag:
+
+    # Pokes every minute for most of the hour; an hour without changes is skipped
+    wait_task = PythonSensor(
+        task_id='wait_for_archive_change',
+        python_callable=check_archive_changed,
+        mode='reschedule',
+        poke_interval=60,
+        timeout=55 * 60,
+        soft_fail=True,
+        doc_md="""
+        ## Wait for Archive Change
+        Checks the mtime and size of data/all_json.zip, and its hash when they change
+        """
+    )
+
+    # The pipeline records the archive itself once it succeeds; waiting for it
+    # keeps this DAG from triggering again for the same archive meanwhile.
+    # A failed run is retried by the next hour's check, not by a retry here.
+    trigger_task = TriggerDagRunOperator(
+        task_id='trigger_incremental_run',
+        trigger_dag_id='cricket_data_pipeline',
+        conf={'incremental': True},
+        wait_for_completion=True,
+        poke_interval=60,
+        retries=0,
+        doc_md="""
+        ## Trigger Incremental Run
+        Starts cricket_data_pipeline for the changed archive members only and waits for it
+        """
+    )
+
+    wait_task >> trigger_task
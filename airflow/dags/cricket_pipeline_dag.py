@@ -5,7 +5,14 @@ import sys
 import os
 
 # Add the scripts directory to Python path
-sys.path.append('/home/lohit/airflow/scripts')
+sys.path.append(os.environ.get('CRICKET_SCRIPTS_DIR',
+                               os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')))
+
+from pipeline_config import CONFIG
+
+# Pre-quality gate: 'block' fails step 2 (and so steps 3 to 5) when the
+# pre-quality verdict is 'fail'; 'off' only reports the verdict
+PRE_QUALITY_GATE = CONFIG['pre_quality_gate']
 
 default_args = {
     'owner': 'lohit',
@@ -17,46 +24,102 @@ default_args = {
     'retry_delay': timedelta(minutes=5),
 }
 
-def run_step1():
+def delta_match_ids(dag_run, ti):
+    """match_ids changed in the archive for incremental runs, None for full runs"""
+    if not (dag_run.conf or {}).get('incremental'):
+        return None
+    delta = ti.xcom_pull(task_ids='step1_unzip_data')
+    return sorted(set(delta['added'] + delta['changed'] + delta['removed']))
+
+def run_step1(dag_run):
     """Unzip data files"""
     import step1_unzipping
+    # Incremental runs pass the delta manifest on to later tasks
+    if (dag_run.conf or {}).get('incremental'):
+        delta = step1_unzipping.extract_changed_members()
+        # No shards are planned, so the later tasks (and record_archive_loaded)
+        # are skipped; there is nothing to load, so record the archive now
+        if not any(delta.values()):
+            print("No changed matches, nothing to do")
+            step1_unzipping.commit_archive_state()
+        return delta
     # IMPORTANT: Actually call the main function!
     result = step1_unzipping.main()
     return f"Step 1 completed: {result}"
 
-def run_step2():
-    """Quality assessment pre-wrangling"""
+def run_plan_shards(dag_run, ti):
+    """Split the extracted JSON files into shards"""
+    import sharding
+    return sharding.plan_shards(match_ids=delta_match_ids(dag_run, ti))
+
+def run_step2_shard(shard_index, num_shards, match_ids=None):
+    """Quality assessment pre-wrangling of one shard"""
     import step2_quality_assessment_pre
-    # IMPORTANT: Actually call the main function!
-    result = step2_quality_assessment_pre.main()
+    return step2_quality_assessment_pre.profile_shard(shard_index, num_shards, match_ids)
+
+def run_step2_merge(dag_run, ti):
+    """Combine the step 2 shard profiles"""
+    import step2_quality_assessment_pre
+    shard_results = ti.xcom_pull(task_ids='step2_quality_check_pre_shard') or []
+    result = step2_quality_assessment_pre.merge_shard_profiles(list(shard_results), delta_match_ids(dag_run, ti))
+    if PRE_QUALITY_GATE == 'block' and result['verdict'] == 'fail':
+        raise ValueError(f"Step 2 pre-quality gate failed: {result}")
     return f"Step 2 completed: {result}"
 
-def run_step3():
-    """Data unnesting and processing"""
+def run_step3_shard(shard_index, num_shards, match_ids=None):
+    """Data unnesting of one shard"""
     import step3_unnesting
-    # IMPORTANT: Actually call the main function!
-    result = step3_unnesting.main()
+    return step3_unnesting.process_shard(shard_index, num_shards, match_ids)
+
+def run_step3_merge(dag_run, ti):
+    """Load the step 3 shard outputs into the database"""
+    import step3_unnesting
+    result = step3_unnesting.merge_shards(match_ids=delta_match_ids(dag_run, ti))
     return f"Step 3 completed: {result}"
 
-def run_step4():
+def run_step4(dag_run, ti):
     """Quality assessment post-wrangling"""
     import step4_quality_assessment_post
+    match_ids = delta_match_ids(dag_run, ti)
     # IMPORTANT: Actually call the main function!
-    result = step4_quality_assessment_post.main()
+    result = step4_quality_assessment_post.main(incremental=match_ids is not None, match_ids=match_ids)
+    # Stop the pipeline when a data-quality rule fails or the step itself does
+    if result.get('quality_gate') == 'fail' or result.get('status') == 'error':
+        raise ValueError(f"Step 4 quality gate failed: {result}")
     return f"Step 4 completed: {result}"
 
-def run_step5():
+def run_step5(dag_run, ti):
     """Add features to database"""
     import step5_added_features
+    match_ids = delta_match_ids(dag_run, ti)
     # IMPORTANT: Actually call the main function!
-    result = step5_added_features.main()
+    result = step5_added_features.main(incremental=match_ids is not None, match_ids=match_ids)
+    if result.get('status') == 'error':
+        raise RuntimeError(f"Step 5 failed: {result.get('message')}")
     return f"Step 5 completed: {result}"
 
+def run_record_archive():
+    """Record the extracted archive as loaded, so later runs start from it"""
+    import step1_unzipping
+    signature = step1_unzipping.commit_archive_state()
+    return f"Archive recorded: {signature}"
+
+def run_load_metrics():
+    """Load the stage metrics recorded so far into the pipeline_metrics table"""
+    import pipeline_metrics
+    from duckdb_connection import connect_duckdb
+    conn = connect_duckdb(CONFIG['db_path'])
+    try:
+        loaded = pipeline_metrics.load_metrics_table(conn)
+    finally:
+        conn.close()
+    return f"Loaded {loaded} metric records"
+
 with DAG(
     'cricket_data_pipeline',
     default_args=default_args,
     description='Cricket data processing pipeline',
-    schedule_interval=None,  # Manual trigger only
+    schedule_interval=None,  # Manual, or by cricket_archive_watch with {'incremental': true}
     catchup=False,
     max_active_runs=1,
     tags=['cricket', 'data-engineering']
@@ -71,21 +134,49 @@ with DAG(
         """
     )
 
+    plan_shards_task = PythonOperator(
+        task_id='plan_shards',
+        python_callable=run_plan_shards,
+        doc_md="""
+        ## Plan Shards
+        Splits the JSON files into shards by file name hash
+        """
+    )
+
+    # One mapped task instance per shard
+    step2_shard_tasks = PythonOperator.partial(
+        task_id='step2_quality_check_pre_shard',
+        python_callable=run_step2_shard,
+        doc_md="""
+        ## Step 2: Pre-wrangling Quality Assessment (per shard)
+        Analyzes data quality of one shard before processing
+        """
+    ).expand(op_kwargs=plan_shards_task.output)
+
     step2_task = PythonOperator(
         task_id='step2_quality_check_pre',
-        python_callable=run_step2,
+        python_callable=run_step2_merge,
         doc_md="""
         ## Step 2: Pre-wrangling Quality Assessment
-        Analyzes data quality before processing
+        Combines the shard profiles into the match metadata and summary
         """
     )
 
+    step3_shard_tasks = PythonOperator.partial(
+        task_id='step3_unnesting_shard',
+        python_callable=run_step3_shard,
+        doc_md="""
+        ## Step 3: Data Unnesting (per shard)
+        Processes the JSON data of one shard into Parquet tables
+        """
+    ).expand(op_kwargs=plan_shards_task.output)
+
     step3_task = PythonOperator(
         task_id='step3_unnesting_processing',
-        python_callable=run_step3,
+        python_callable=run_step3_merge,
         doc_md="""
         ## Step 3: Data Unnesting
-        Processes JSON data and creates normalized tables
+        Merges the shard tables into the normalized database tables
         """
     )
 
@@ -107,5 +198,30 @@ with DAG(
         """
     )
 
+    archive_task = PythonOperator(
+        task_id='record_archive_loaded',
+        python_callable=run_record_archive,
+        doc_md="""
+        ## Record Archive
+        Stores the manifest and signature of the archive once every step succeeded
+        """
+    )
+
+    # Runs after failed runs too, so their metrics are kept
+    metrics_task = PythonOperator(
+        task_id='load_pipeline_metrics',
+        python_callable=run_load_metrics,
+        trigger_rule='all_done',
+        doc_md="""
+        ## Load Pipeline Metrics
+        Copies the per-stage timing, memory and row metrics into pipeline_metrics
+        """
+    )
+
     # Define task dependencies
-    step1_task >> step2_task >> step3_task >> step4_task >> step5_task
\ No newline at end of file
+    # Pre-quality profiling runs beside the shard unnesting, which only writes
+    # Parquet files, and gates the load into the database
+    step1_task >> plan_shards_task
+    plan_shards_task >> step2_shard_tasks >> step2_task
+    plan_shards_task >> step3_shard_tasks >> step3_task
+    step2_task >> step3_task >> step4_task >> step5_task >> archive_task >> metrics_task
\ No newline at end of file
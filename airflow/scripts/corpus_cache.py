@@ -0,0 +1,34 @@
+import json
+import os
+
+# Parsed match JSON by file path, with the (mtime, size) it was read at.
+# None while caching is off, which is the default for Airflow tasks.
+parsed_matches = None
+
+def enable_cache():
+    """Keep parsed match files in memory for the rest of the process"""
+    global parsed_matches
+    if parsed_matches is None:
+        parsed_matches = {}
+
+def clear_cache():
+    """Drop the parsed match files and turn caching off"""
+    global parsed_matches
+    parsed_matches = None
+
+def load_match_json(file_path):
+    """Parsed JSON of one match file, from the cache when it is on and the file is unchanged"""
+    if parsed_matches is None:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    stat = os.stat(file_path)
+    version = (stat.st_mtime, stat.st_size)
+    cached = parsed_matches.get(file_path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    parsed_matches[file_path] = (version, data)
+    return data
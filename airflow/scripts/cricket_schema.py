@@ -0,0 +1,62 @@
+# Narrow column types for the normalized tables. step3 applies them when it
+# creates the tables; step4 verifies them.
+COLUMN_TYPES = {
+    'deliveries': {
+        'over_number': 'SMALLINT',
+        'ball_number': 'TINYINT',
+        'batter_runs': 'TINYINT',
+        'extras': 'TINYINT',
+        'total_runs': 'TINYINT',
+        'extras_value': 'TINYINT',
+        'is_wicket': 'BOOLEAN'
+    },
+    'innings': {
+        'innings_number': 'TINYINT'
+    },
+    'matches': {
+        'overs': 'DECIMAL(4,1)',
+        'outcome_by_runs': 'SMALLINT',
+        'outcome_by_wickets': 'TINYINT',
+        # All NULL in a corpus without rain-affected results
+        'outcome_method': 'VARCHAR'
+    },
+    'overs': {
+        'over_number': 'SMALLINT',
+        'total_runs': 'TINYINT',
+        'wickets': 'TINYINT',
+        'num_deliveries': 'TINYINT'
+    }
+}
+
+def typed_select_sql(table_name, column_names, source):
+    """SELECT column_names from source, casting those with a declared type"""
+    declared_types = COLUMN_TYPES.get(table_name, {})
+
+    column_clauses = []
+    for col in column_names:
+        if col in declared_types:
+            column_clauses.append(f"CAST({col} AS {declared_types[col]}) AS {col}")
+        else:
+            column_clauses.append(col)
+
+    return f"SELECT {', '.join(column_clauses)} FROM {source}"
+
+# Every (name, ID) pair a player appears under, counted over the loaded tables
+PLAYER_NAMES_SQL = """
+SELECT player_name, player_id, COUNT(*) AS occurrences
+FROM (
+    SELECT batter AS player_name, batter_id AS player_id FROM deliveries
+    UNION ALL
+    SELECT bowler, bowler_id FROM deliveries
+    UNION ALL
+    SELECT non_striker, non_striker_id FROM deliveries
+    UNION ALL
+    SELECT wicket_player_out, wicket_player_out_id FROM deliveries
+    UNION ALL
+    SELECT wicket_fielder, wicket_fielder_id FROM deliveries
+    UNION ALL
+    SELECT player_of_match, player_of_match_id FROM matches
+)
+WHERE player_name IS NOT NULL
+GROUP BY player_name, player_id
+"""
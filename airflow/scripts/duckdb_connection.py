@@ -0,0 +1,38 @@
+import duckdb
+
+from pipeline_config import duckdb_settings
+
+# Settings reported after every connection
+REPORTED_SETTINGS = ['threads', 'memory_limit', 'temp_directory', 'preserve_insertion_order']
+
+def sql_literal(value):
+    """SQL literal of a setting value"""
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, int):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+def configure_duckdb(conn, bulk_load=False, label=None):
+    """Apply the configured resource settings to a connection and print the effective ones
+
+    bulk_load turns off preserve_insertion_order, so large CREATE TABLE AS,
+    INSERT and COPY statements can stream without keeping row order.
+    """
+    settings = dict(duckdb_settings(), preserve_insertion_order=not bulk_load)
+    for name, value in settings.items():
+        conn.execute(f"SET {name} = {sql_literal(value)}")
+
+    effective = dict(conn.execute(
+        "SELECT name, value FROM duckdb_settings() WHERE name IN (SELECT UNNEST(?))",
+        [REPORTED_SETTINGS]
+    ).fetchall())
+    print(f"DuckDB settings for {label or 'connection'}: "
+          + ", ".join(f"{name}={effective.get(name)}" for name in REPORTED_SETTINGS))
+    return effective
+
+def connect_duckdb(database=':memory:', bulk_load=False, read_only=False):
+    """Open a DuckDB connection with the pipeline's resource settings"""
+    conn = duckdb.connect(database, read_only=read_only)
+    configure_duckdb(conn, bulk_load=bulk_load, label=database)
+    return conn
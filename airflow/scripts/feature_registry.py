@@ -0,0 +1,198 @@
+import hashlib
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Each feature is a dict:
+#   'name':       unique feature name
+#   'table':      table the feature adds columns to
+#   'columns':    {column: type} added to the table, in ALTER TABLE order
+#   'sql':        statements that fill the columns, run in order on one cursor
+#   'depends_on': 'table.column' inputs the statements read
+
+FEATURE_STATE_TABLE = 'feature_state'
+
+def feature_columns_by_table(features):
+    """Map each table to the {column: type} its features add, in registry order"""
+    columns_by_table = defaultdict(dict)
+    for feature in features:
+        columns_by_table[feature['table']].update(feature['columns'])
+    return dict(columns_by_table)
+
+def build_feature_graph(features):
+    """Map each feature name to the names of the features it depends on"""
+    producers = {}
+    for feature in features:
+        for column in feature['columns']:
+            producers[f"{feature['table']}.{column}"] = feature['name']
+
+    graph = {}
+    for feature in features:
+        graph[feature['name']] = {
+            producers[dep] for dep in feature['depends_on']
+            if dep in producers and producers[dep] != feature['name']
+        }
+    return graph
+
+def topological_levels(graph):
+    """Group feature names into levels; features in a level are independent"""
+    remaining = {name: set(deps) for name, deps in graph.items()}
+    levels = []
+
+    while remaining:
+        ready = sorted(name for name, deps in remaining.items() if not deps)
+        if not ready:
+            raise ValueError(f"Feature dependency cycle between: {sorted(remaining)}")
+        levels.append(ready)
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+    return levels
+
+def add_feature_columns(conn, features):
+    """Add every feature column; return names of features with a new column"""
+    features_with_new_columns = set()
+
+    for feature in features:
+        table_columns = conn.execute(f"PRAGMA table_info('{feature['table']}')").fetchall()
+        existing_columns = {col[1] for col in table_columns}
+
+        for column, column_type in feature['columns'].items():
+            if column not in existing_columns:
+                features_with_new_columns.add(feature['name'])
+            conn.execute(f"ALTER TABLE {feature['table']} ADD COLUMN IF NOT EXISTS {column} {column_type};")
+
+    return features_with_new_columns
+
+def run_feature(conn, feature):
+    """Execute a feature's statements in order"""
+    for sql in feature['sql']:
+        conn.execute(sql)
+
+def apply_features(conn, features):
+    """Add columns and run features one after another, without skipping"""
+    add_feature_columns(conn, features)
+    for feature in features:
+        run_feature(conn, feature)
+
+def feature_outputs(feature):
+    """'table.column' names of the columns a feature fills"""
+    return [f"{feature['table']}.{column}" for column in feature['columns']]
+
+def column_fingerprints(conn, features):
+    """Hash the input and output columns of the given features with one scan per table
+
+    Each value is hashed together with its rowid, so moving values between
+    rows, or reinserting rows with NULL feature columns, changes the hash.
+    """
+    columns_by_table = defaultdict(set)
+    for feature in features:
+        for dep in feature['depends_on'] + feature_outputs(feature):
+            table, column = dep.split('.', 1)
+            columns_by_table[table].add(column)
+
+    fingerprints = {}
+    for table, columns in columns_by_table.items():
+        columns = sorted(columns)
+        aggregates = ", ".join(f"SUM(HASH(rowid, {col}))" for col in columns)
+        row = conn.execute(f"SELECT COUNT(*), {aggregates} FROM {table}").fetchone()
+        for col, col_hash in zip(columns, row[1:]):
+            fingerprints[f"{table}.{col}"] = f"{row[0]}:{col_hash}"
+
+    return fingerprints
+
+def feature_fingerprint(feature, fingerprints):
+    """Fingerprint a feature's statements together with its input and output columns"""
+    digest = hashlib.sha256()
+    for sql in feature['sql']:
+        digest.update(sql.encode('utf-8'))
+    for column in sorted(feature['depends_on']) + feature_outputs(feature):
+        digest.update(f"{column}={fingerprints[column]}".encode('utf-8'))
+    return digest.hexdigest()
+
+def execute_feature_graph(conn, features, max_workers=4, skip_unchanged=True):
+    """Run features level by level in dependency order
+
+    Within a level, features for different tables run in parallel on separate
+    cursors, while features for the same table share a cursor and run in
+    registry order. With skip_unchanged, a feature is skipped when the
+    fingerprint of its inputs and outputs matches the one stored in
+    feature_state after its last run and none of its columns had to be added.
+
+    Returns {feature name: {'status': 'ran' or 'skipped', 'started_at', 'seconds'}}.
+    """
+    feature_by_name = {feature['name']: feature for feature in features}
+    levels = topological_levels(build_feature_graph(features))
+
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {FEATURE_STATE_TABLE} (
+        feature_name VARCHAR PRIMARY KEY,
+        fingerprint VARCHAR,
+        updated_at TIMESTAMP
+    )
+    """)
+    # State written before outputs were fingerprinted never matches, so those features rerun once
+    legacy_column = conn.execute(f"""
+    SELECT COUNT(*) FROM duckdb_columns()
+    WHERE table_name = '{FEATURE_STATE_TABLE}' AND column_name = 'input_fingerprint'
+    """).fetchone()[0]
+    if legacy_column:
+        conn.execute(f"ALTER TABLE {FEATURE_STATE_TABLE} RENAME COLUMN input_fingerprint TO fingerprint")
+    stored_fingerprints = dict(conn.execute(
+        f"SELECT feature_name, fingerprint FROM {FEATURE_STATE_TABLE}"
+    ).fetchall())
+
+    # Schema changes conflict with concurrent writers, so do them up front
+    features_with_new_columns = add_feature_columns(conn, features)
+
+    results = {}
+
+    for level in levels:
+        level_features = [feature_by_name[name] for name in level]
+        fingerprints = column_fingerprints(conn, level_features)
+
+        to_run = []
+        for feature in level_features:
+            unchanged = (stored_fingerprints.get(feature['name']) == feature_fingerprint(feature, fingerprints)
+                         and feature['name'] not in features_with_new_columns)
+            if skip_unchanged and unchanged:
+                results[feature['name']] = {'status': 'skipped', 'started_at': datetime.now(), 'seconds': 0.0}
+            else:
+                to_run.append(feature)
+
+        # Keep registry order within each table
+        groups = defaultdict(list)
+        for feature in sorted(to_run, key=features.index):
+            groups[feature['table']].append(feature)
+
+        def run_group(group):
+            cursor = conn.cursor()
+            timings = []
+            try:
+                for feature in group:
+                    started_at = datetime.now()
+                    start = time.perf_counter()
+                    run_feature(cursor, feature)
+                    timings.append((feature['name'], started_at, time.perf_counter() - start))
+            finally:
+                cursor.close()
+            return timings
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            group_timings = list(executor.map(run_group, groups.values()))
+
+        # Record state from this connection only, after the level succeeded,
+        # with the outputs the features just wrote
+        fingerprints = column_fingerprints(conn, to_run)
+        for timings in group_timings:
+            for name, started_at, seconds in timings:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {FEATURE_STATE_TABLE} VALUES (?, ?, current_timestamp)",
+                    [name, feature_fingerprint(feature_by_name[name], fingerprints)]
+                )
+                results[name] = {'status': 'ran', 'started_at': started_at, 'seconds': seconds}
+
+    return results
@@ -0,0 +1,211 @@
+import math
+import re
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+
+import pandas as pd
+
+# Resolution settings per kind of name:
+#   'threshold':    minimum similarity (0-100, as fuzz.ratio) to link two names
+#   'strip_suffix': compare venues without their ", City" suffix
+NAME_TYPES = {
+    'venue': {'threshold': 90, 'strip_suffix': True},
+    'city': {'threshold': 90, 'strip_suffix': False},
+    'team': {'threshold': 90, 'strip_suffix': False},
+    'player': {'threshold': 90, 'strip_suffix': False}
+}
+
+NGRAM_SIZE = 3
+
+# Pairs with a smaller n-gram Jaccard similarity are never scored. A single
+# edit in a 10-character name (ratio 90) still leaves a trigram Jaccard of
+# 7/13, so this only prunes pairs that could not reach the thresholds.
+MIN_NGRAM_JACCARD = 0.5
+
+MAPPING_COLUMNS = ['name_type', 'variant', 'canonical', 'similarity', 'approved']
+
+def normalize_name(name, strip_suffix=False):
+    """Lower-case a name, drop apostrophes and reduce other punctuation to spaces"""
+    text = str(name).lower()
+    if strip_suffix:
+        text = text.split(',')[0]
+    # "Lord's" and "Lords" are the same name, "Port-of-Spain" is three words
+    text = re.sub(r"['\u2019`]", '', text)
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return ' '.join(text.split())
+
+def name_ngrams(text, n=NGRAM_SIZE):
+    """Set of character n-grams of a space-padded name"""
+    padded = f" {text} "
+    return {padded[i:i + n] for i in range(max(1, len(padded) - n + 1))}
+
+def name_similarity(name1, name2):
+    """Similarity of two normalized names from 0 to 100, as fuzz.ratio"""
+    return round(100 * SequenceMatcher(None, name1, name2).ratio())
+
+def candidate_pairs(ngram_sets, min_jaccard=MIN_NGRAM_JACCARD):
+    """Yield index pairs whose n-gram sets reach min_jaccard
+
+    Names are visited from the smallest n-gram set up and looked up in an
+    inverted index over the rarest n-grams of the names visited before
+    (prefix filtering): two sets with Jaccard >= min_jaccard always share one
+    of those, so other pairs are never looked at. Index entries of sets too
+    small to reach min_jaccard with the current one are skipped for good.
+    """
+    frequency = Counter(gram for grams in ngram_sets for gram in grams)
+    order = sorted(range(len(ngram_sets)), key=lambda i: len(ngram_sets[i]))
+    # Overlap needed with any later (larger) set, relative to this set's size
+    index_overlap = 2 * min_jaccard / (1 + min_jaccard)
+
+    index = defaultdict(list)
+    index_start = defaultdict(int)
+
+    for i in order:
+        grams = ngram_sets[i]
+        size = len(grams)
+        ordered = sorted(grams, key=lambda gram: (frequency[gram], gram))
+        probe_length = size - math.ceil(min_jaccard * size) + 1
+        index_length = size - math.ceil(index_overlap * size) + 1
+
+        candidates = set()
+        for position, gram in enumerate(ordered[:probe_length]):
+            postings = index[gram]
+            start = index_start[gram]
+            while start < len(postings) and len(ngram_sets[postings[start]]) < min_jaccard * size:
+                start += 1
+            index_start[gram] = start
+            candidates.update(postings[start:])
+            if position < index_length:
+                postings.append(i)
+
+        for j in candidates:
+            other = ngram_sets[j]
+            if len(grams & other) >= min_jaccard * len(grams | other):
+                yield j, i
+
+def resolve_names(name_counts, name_type, keys=None):
+    """Map variants of one kind of name to a canonical name
+
+    name_counts: {name: occurrences}; the most frequent name of a group of
+                 similar names becomes its canonical name
+    keys:        optional {name: id}; names with different ids are never linked
+
+    Names that are equal after normalize_name are spellings of one name and
+    their mappings are approved. Other similar names may still be different
+    places or teams ("Western Province" and "Eastern Province"), so the
+    canonical of each spelling group is only proposed, unapproved, as a
+    variant of the canonical of the similar groups.
+
+    Returns a list of {'name_type', 'variant', 'canonical', 'similarity',
+    'approved'} rows, one per name that maps to a different canonical name.
+    """
+    settings = NAME_TYPES[name_type]
+    keys = keys or {}
+    names = sorted(name for name in name_counts if name)
+    normalized = [normalize_name(name, settings['strip_suffix']) for name in names]
+    ngram_sets = [name_ngrams(text) for text in normalized]
+
+    # Union-find over the linked names: spellings, and spellings or similar names
+    spelling_parent = list(range(len(names)))
+    similar_parent = list(range(len(names)))
+
+    def find(parent, i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def groups(parent):
+        members = defaultdict(list)
+        for i in range(len(names)):
+            members[find(parent, i)].append(i)
+        return [group for group in members.values() if len(group) > 1]
+
+    for i, j in candidate_pairs(ngram_sets):
+        key_i, key_j = keys.get(names[i]), keys.get(names[j])
+        if key_i is not None and key_j is not None and key_i != key_j:
+            continue
+
+        if normalized[i] == normalized[j]:
+            spelling_parent[find(spelling_parent, i)] = find(spelling_parent, j)
+            similar_parent[find(similar_parent, i)] = find(similar_parent, j)
+            continue
+
+        # "India" and "India A" are different teams, not spellings
+        tokens_i, tokens_j = Counter(normalized[i].split()), Counter(normalized[j].split())
+        if tokens_i != tokens_j and (not tokens_i - tokens_j or not tokens_j - tokens_i):
+            continue
+
+        if name_similarity(normalized[i], normalized[j]) >= settings['threshold']:
+            similar_parent[find(similar_parent, i)] = find(similar_parent, j)
+
+    def canonical_of(members):
+        return min(members, key=lambda i: (-name_counts[names[i]], len(names[i]), names[i]))
+
+    def mapping(i, canonical, approved):
+        return {
+            'name_type': name_type,
+            'variant': names[i],
+            'canonical': names[canonical],
+            'similarity': name_similarity(normalized[i], normalized[canonical]),
+            'approved': approved
+        }
+
+    mappings = []
+    spelling_canonical = list(range(len(names)))
+    for members in groups(spelling_parent):
+        canonical = canonical_of(members)
+        for i in members:
+            spelling_canonical[i] = canonical
+            if i != canonical:
+                mappings.append(mapping(i, canonical, True))
+
+    for members in groups(similar_parent):
+        heads = sorted({spelling_canonical[i] for i in members})
+        if len(heads) < 2:
+            continue
+        canonical = canonical_of(heads)
+        for i in heads:
+            if i != canonical:
+                mappings.append(mapping(i, canonical, False))
+
+    return mappings
+
+def build_name_mappings(name_counts_by_type, keys_by_type=None):
+    """Resolve every kind of name into one canonical-mapping DataFrame"""
+    keys_by_type = keys_by_type or {}
+    mappings = []
+    for name_type, name_counts in name_counts_by_type.items():
+        mappings.extend(resolve_names(name_counts, name_type, keys_by_type.get(name_type)))
+
+    return pd.DataFrame(mappings, columns=MAPPING_COLUMNS).astype({'approved': bool})
+
+def carry_over_approvals(previous, name_mappings):
+    """Approve the mappings that were approved in previous, e.g. after review"""
+    if previous.empty or 'approved' not in previous:
+        return name_mappings
+    approved = previous[previous['approved'].fillna(False).astype(bool)]
+    approved_keys = set(zip(approved['name_type'], approved['variant'], approved['canonical']))
+    keys = zip(name_mappings['name_type'], name_mappings['variant'], name_mappings['canonical'])
+    name_mappings = name_mappings.copy()
+    name_mappings['approved'] = [flag or key in approved_keys for flag, key in zip(name_mappings['approved'], keys)]
+    return name_mappings
+
+def mapping_for(name_mappings, name_type):
+    """{variant: canonical} of the approved mappings of one kind of name
+
+    A spelling whose canonical was approved as a variant of another name maps
+    to that name's canonical in turn.
+    """
+    rows = name_mappings[(name_mappings['name_type'] == name_type) & name_mappings['approved'].fillna(False).astype(bool)]
+    mapping = dict(zip(rows['variant'], rows['canonical']))
+
+    resolved = {}
+    for variant, canonical in mapping.items():
+        seen = {variant}
+        while canonical in mapping and canonical not in seen:
+            seen.add(canonical)
+            canonical = mapping[canonical]
+        if canonical != variant:
+            resolved[variant] = canonical
+    return resolved
@@ -0,0 +1,100 @@
+import os
+
+# Settings of the pipeline, in increasing precedence:
+#   1. the defaults below
+#   2. a YAML file: CRICKET_CONFIG, or pipeline_config.yaml in base_dir
+#   3. environment variables CRICKET_<SETTING>, e.g. CRICKET_DATA_DIR
+#
+# Paths left as None are derived from base_dir and data_dir. DuckDB
+# resource settings left as None keep DuckDB's own defaults.
+DEFAULTS = {
+    # Directory holding dags/, scripts/ and data/
+    'base_dir': os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'data_dir': None,
+    'extracted_dir': None,
+    'shard_dir': None,
+    'db_path': None,
+    'metrics_path': None,
+
+    # DuckDB resources
+    'threads': None,
+    'memory_limit': None,
+    'temp_directory': None,
+
+    # Step 3 JSON batches and step 4/5 worker threads
+    'batch_size': 500,
+    'max_workers': 4,
+
+    # Sharding of the corpus over Airflow tasks
+    'files_per_shard': 2000,
+    'max_shards': 16,
+
+    # 'block' or 'off'
+    'pre_quality_gate': 'block',
+
+    # Profile every step 4/5 statement and report the slowest ones
+    'query_profiling': False,
+    'profile_top_n': 20
+}
+
+INT_SETTINGS = {'threads', 'batch_size', 'max_workers', 'files_per_shard', 'max_shards', 'profile_top_n'}
+BOOL_SETTINGS = {'query_profiling'}
+
+ENV_PREFIX = 'CRICKET_'
+
+def read_yaml_settings(path):
+    """Settings dict from a YAML file"""
+    import yaml
+
+    with open(path, 'r') as f:
+        settings = yaml.safe_load(f) or {}
+
+    unknown = set(settings) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown settings in {path}: {sorted(unknown)}")
+    return settings
+
+def read_env_settings(environ):
+    """Settings given as CRICKET_<SETTING> environment variables"""
+    return {
+        key: environ[ENV_PREFIX + key.upper()]
+        for key in DEFAULTS if ENV_PREFIX + key.upper() in environ
+    }
+
+def load_config(environ=None):
+    """Resolve the pipeline settings from the defaults, YAML file and environment"""
+    environ = os.environ if environ is None else environ
+
+    config = dict(DEFAULTS)
+    env_settings = read_env_settings(environ)
+
+    base_dir = env_settings.get('base_dir', config['base_dir'])
+    config_path = environ.get(ENV_PREFIX + 'CONFIG', os.path.join(base_dir, 'pipeline_config.yaml'))
+    if os.path.exists(config_path):
+        config.update(read_yaml_settings(config_path))
+    config.update(env_settings)
+
+    for key in INT_SETTINGS:
+        if config[key] is not None:
+            config[key] = int(config[key])
+    for key in BOOL_SETTINGS:
+        if isinstance(config[key], str):
+            config[key] = config[key].strip().lower() in ('1', 'true', 'yes', 'on')
+
+    config['data_dir'] = config['data_dir'] or os.path.join(config['base_dir'], 'data')
+    config['extracted_dir'] = config['extracted_dir'] or os.path.join(config['data_dir'], 'extracted_data_json')
+    config['shard_dir'] = config['shard_dir'] or os.path.join(config['data_dir'], 'shards')
+    config['db_path'] = config['db_path'] or os.path.join(config['data_dir'], 'cricket_analytics.db')
+    config['metrics_path'] = config['metrics_path'] or os.path.join(config['data_dir'], 'pipeline_metrics.jsonl')
+
+    return config
+
+CONFIG = load_config()
+
+def duckdb_settings(config=None):
+    """DuckDB configuration options set in the pipeline config"""
+    config = config or CONFIG
+    return {
+        key: config[key]
+        for key in ['threads', 'memory_limit', 'temp_directory'] if config[key] is not None
+    }
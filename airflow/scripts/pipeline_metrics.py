@@ -0,0 +1,147 @@
+import functools
+import json
+import os
+import resource
+import sys
+import time
+import uuid
+from datetime import datetime
+
+import pandas as pd
+
+from pipeline_config import CONFIG
+
+METRICS_PATH = CONFIG['metrics_path']
+METRICS_TABLE = 'pipeline_metrics'
+
+# One record per instrumented call; the JSON lines and the table share this schema
+METRIC_COLUMNS = {
+    'metric_id': 'VARCHAR',
+    'run_id': 'VARCHAR',
+    'task_id': 'VARCHAR',
+    'stage': 'VARCHAR',
+    'status': 'VARCHAR',
+    'started_at': 'TIMESTAMP',
+    'wall_seconds': 'DOUBLE',
+    'cpu_seconds': 'DOUBLE',
+    'peak_rss_mb': 'DOUBLE',
+    'rows_in': 'BIGINT',
+    'rows_out': 'BIGINT',
+    'bytes_read': 'BIGINT'
+}
+
+# Airflow exports the run and task of a PythonOperator; other runs get a per-process id
+RUN_ID = os.environ.get('AIRFLOW_CTX_DAG_RUN_ID') or f"local_{datetime.now():%Y%m%dT%H%M%S}_{os.getpid()}"
+TASK_ID = os.environ.get('AIRFLOW_CTX_TASK_ID')
+
+def bytes_read_so_far():
+    """Bytes this process has read through read() calls, or None off Linux"""
+    try:
+        with open('/proc/self/io', 'r') as f:
+            for line in f:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def row_count(value):
+    """Rows of a DataFrame or list, else None"""
+    if isinstance(value, (pd.DataFrame, list)):
+        return len(value)
+    return None
+
+def write_metric(record, path=None):
+    """Append one metric record to the JSON lines file"""
+    path = path or METRICS_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+def write_stage_metric(stage, status, started_at, wall_seconds, **measures):
+    """Append the record of a stage timed by its caller, e.g. one of several run in parallel
+
+    measures: cpu_seconds, peak_rss_mb, rows_in, rows_out and bytes_read;
+    those not given are None.
+    """
+    record = dict.fromkeys(METRIC_COLUMNS)
+    record.update(measures)
+    record.update({
+        'metric_id': uuid.uuid4().hex,
+        'run_id': RUN_ID,
+        'task_id': TASK_ID,
+        'stage': stage,
+        'status': status,
+        'started_at': started_at.isoformat(),
+        'wall_seconds': wall_seconds
+    })
+    write_metric(record)
+
+def instrumented(func=None, table=None):
+    """Record wall time, CPU time, peak RSS, rows and bytes read of each call
+
+    rows_in is the length of a DataFrame or list first argument, rows_out
+    that of the result, or the row count of table on the connection passed
+    as first argument. Peak RSS is the process high-water mark when the call
+    ends. A metric that cannot be measured is None.
+    """
+    if func is None:
+        return functools.partial(instrumented, table=table)
+
+    stage = f"{func.__module__}.{func.__name__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started_at = datetime.now()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        read_start = bytes_read_so_far()
+        status = 'error'
+
+        try:
+            result = func(*args, **kwargs)
+            status = 'success'
+            return result
+        finally:
+            read_end = bytes_read_so_far()
+            rows_out = row_count(result) if status == 'success' else None
+            if table is not None and status == 'success':
+                rows_out = args[0].execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+            write_stage_metric(
+                stage, status, started_at, time.perf_counter() - wall_start,
+                cpu_seconds=time.process_time() - cpu_start,
+                peak_rss_mb=peak_rss_mb(),
+                rows_in=row_count(args[0]) if args else None,
+                rows_out=rows_out,
+                bytes_read=read_end - read_start if read_start is not None and read_end is not None else None
+            )
+
+    return wrapper
+
+def load_metrics_table(conn, path=None):
+    """Copy metric records not yet in the pipeline_metrics table from the JSON lines file"""
+    path = path or METRICS_PATH
+    columns = ", ".join(f"{name} {column_type}" for name, column_type in METRIC_COLUMNS.items())
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {METRICS_TABLE} ({columns})")
+
+    if not os.path.exists(path):
+        return 0
+
+    before = conn.execute(f"SELECT COUNT(*) FROM {METRICS_TABLE}").fetchone()[0]
+    conn.execute(f"""
+    INSERT INTO {METRICS_TABLE}
+    SELECT {', '.join(METRIC_COLUMNS)}
+    FROM read_json(?, format = 'newline_delimited', columns = {METRIC_COLUMNS!r})
+    WHERE metric_id NOT IN (SELECT metric_id FROM {METRICS_TABLE})
+    """, [path])
+    after = conn.execute(f"SELECT COUNT(*) FROM {METRICS_TABLE}").fetchone()[0]
+
+    print(f"Loaded {after - before} metric records into {METRICS_TABLE}")
+    return after - before
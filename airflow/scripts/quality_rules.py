@@ -0,0 +1,318 @@
+import hashlib
+import json
+from collections import defaultdict
+
+# Each rule is a dict:
+#   'name':       unique rule name, used as the report key
+#   'table':      table or named relation the rule scans
+#   'kind':       'count', 'ratio', 'distribution' or 'referential'
+#   'where':      row predicate ('count' and 'ratio')
+#   'column':     column to histogram ('distribution')
+#   'columns':    columns whose distinct values must exist in 'references' ('referential')
+#   'references': 'table.column' the values are looked up in ('referential')
+#   'warn'/'fail': optional thresholds; the rule warns or fails when its value exceeds them
+#
+# 'count' is the number of rows matching 'where', 'ratio' their percentage of
+# the relation, 'distribution' a {value: rows} histogram and 'referential' the
+# number of distinct values missing from the referenced column.
+
+GATE_ORDER = ['pass', 'warn', 'fail']
+
+# Per-match partial aggregates and the rule versions they were computed with
+QUALITY_PARTIALS_TABLE = 'quality_partials'
+QUALITY_RULE_STATE_TABLE = 'quality_rule_state'
+
+def rule_aggregate(rule, partial=False):
+    """Aggregate expression computing a rule's value in the relation scan
+
+    With partial, the expression is the mergeable per-match form: referential
+    rules return the missing values instead of their count.
+    """
+    kind = rule['kind']
+
+    if kind in ('count', 'ratio'):
+        return f"COUNT(*) FILTER (WHERE {rule['where']})"
+
+    if kind == 'distribution':
+        return f"HISTOGRAM({rule['column']})"
+
+    if kind == 'referential':
+        ref_table, ref_column = rule['references'].split('.', 1)
+        # NOT IN against the referenced values, de-duplicated across columns
+        missing_lists = [
+            f"COALESCE(LIST(DISTINCT {col}) FILTER (WHERE {col} IS NOT NULL AND {col} NOT IN "
+            f"(SELECT {ref_column} FROM {ref_table} WHERE {ref_column} IS NOT NULL)), [])"
+            for col in rule['columns']
+        ]
+        missing_values = f"LIST_DISTINCT(FLATTEN([{', '.join(missing_lists)}]))"
+        return missing_values if partial else f"LEN({missing_values})"
+
+    raise ValueError(f"Unknown rule kind for {rule['name']}: {kind}")
+
+def relation_source(table, relations):
+    """FROM clause for a table or a named relation"""
+    if table in relations:
+        return f"({relations[table]}) AS {table}"
+    return table
+
+def rules_by_table(rules):
+    """Group rules by the table or relation they scan, keeping rule order"""
+    grouped = defaultdict(list)
+    for rule in rules:
+        grouped[rule['table']].append(rule)
+    return grouped
+
+def compile_rules(rules, relations=None):
+    """Fuse the rules into one aggregate query per table or relation
+
+    Returns {table: (sql, [rules in select order])}. Each query selects the
+    relation row count followed by one aggregate per rule.
+    """
+    relations = relations or {}
+
+    queries = {}
+    for table, table_rules in rules_by_table(rules).items():
+        aggregates = ",\n            ".join(rule_aggregate(rule) for rule in table_rules)
+        sql = f"""
+        SELECT
+            COUNT(*),
+            {aggregates}
+        FROM {relation_source(table, relations)}
+        """
+        queries[table] = (sql, table_rules)
+
+    return queries
+
+def rule_value(rule, raw_value, total_rows):
+    """Convert a rule's aggregate output into its reported value"""
+    if rule['kind'] == 'ratio':
+        return (raw_value / total_rows * 100) if total_rows > 0 else 0
+    if rule['kind'] == 'distribution':
+        return dict(sorted((raw_value or {}).items()))
+    return raw_value
+
+def rule_status(rule, value):
+    """Grade a rule value against its thresholds"""
+    if rule['kind'] == 'distribution':
+        return 'pass'
+    if rule.get('fail') is not None and value > rule['fail']:
+        return 'fail'
+    if rule.get('warn') is not None and value > rule['warn']:
+        return 'warn'
+    return 'pass'
+
+def failed_results(table, table_rules, error):
+    """Results marking every rule of a relation that could not be scanned as failed"""
+    return {
+        rule['name']: {
+            'table': table, 'kind': rule['kind'], 'value': None,
+            'status': 'fail', 'error': str(error)
+        }
+        for rule in table_rules
+    }
+
+def graded_result(table, rule, raw_value, total_rows):
+    """Reported value and status of a rule from its aggregate output"""
+    value = rule_value(rule, raw_value, total_rows)
+    result = {
+        'table': table,
+        'kind': rule['kind'],
+        'value': value,
+        'status': rule_status(rule, value)
+    }
+    if rule['kind'] == 'ratio':
+        result['count'] = raw_value
+    return result
+
+def evaluate_rules(conn, rules, relations=None):
+    """Run the fused rule queries; return {rule name: result}
+
+    Each result has the rule's 'table', 'kind', 'value', 'status' and, for
+    ratios, the matching row 'count'. A relation that fails to scan marks all
+    of its rules as 'fail' with the error message.
+    """
+    results = {}
+
+    for table, (sql, table_rules) in compile_rules(rules, relations).items():
+        try:
+            row = conn.execute(sql).fetchone()
+        except Exception as e:
+            results.update(failed_results(table, table_rules, e))
+            continue
+
+        total_rows = row[0]
+        for rule, raw_value in zip(table_rules, row[1:]):
+            results[rule['name']] = graded_result(table, rule, raw_value, total_rows)
+
+    return results
+
+def quality_gate(results):
+    """Overall 'pass', 'warn' or 'fail' from the rule results"""
+    statuses = [result['status'] for result in results.values()]
+    return max(statuses, key=GATE_ORDER.index, default='pass')
+
+def rule_fingerprint(rule, relations):
+    """Fingerprint of what a rule's partial aggregates are computed from"""
+    digest = hashlib.sha256()
+    digest.update(relation_source(rule['table'], relations).encode('utf-8'))
+    digest.update(rule_aggregate(rule, partial=True).encode('utf-8'))
+    return digest.hexdigest()
+
+def partial_json_sql(rule):
+    """Per-match partial aggregate of a rule, serialized as JSON"""
+    aggregate = rule_aggregate(rule, partial=True)
+    if rule['kind'] == 'distribution':
+        # Map entries keep the value types that JSON object keys would lose
+        aggregate = f"MAP_ENTRIES({aggregate})"
+    return f"TO_JSON({aggregate})"
+
+def merge_partials(conn, rule):
+    """Merge a rule's stored per-match partials in SQL into (raw value, total rows)"""
+    matched_rows = "SUM(partial_value::BIGINT)" if rule['kind'] in ('count', 'ratio') else "NULL"
+    total_rows, matched_rows = conn.execute(f"""
+    SELECT COALESCE(SUM(total_rows), 0), {matched_rows}
+    FROM {QUALITY_PARTIALS_TABLE}
+    WHERE rule_name = ?
+    """, [rule['name']]).fetchone()
+
+    if rule['kind'] == 'distribution':
+        # Keys stay JSON so their original types survive the merge
+        counts = conn.execute(f"""
+        SELECT entry.key::VARCHAR, SUM(entry.value)
+        FROM {QUALITY_PARTIALS_TABLE},
+             UNNEST(from_json(partial_value, '[{{"key": "JSON", "value": "BIGINT"}}]')) AS entries(entry)
+        WHERE rule_name = ?
+        GROUP BY ALL
+        """, [rule['name']]).fetchall()
+        return {json.loads(key): int(rows) for key, rows in counts}, total_rows
+
+    if rule['kind'] == 'referential':
+        missing = conn.execute(f"""
+        SELECT COUNT(DISTINCT missing_value::VARCHAR)
+        FROM {QUALITY_PARTIALS_TABLE},
+             UNNEST(from_json(partial_value, '["JSON"]')) AS missing(missing_value)
+        WHERE rule_name = ?
+        """, [rule['name']]).fetchone()[0]
+        return missing, total_rows
+
+    return matched_rows or 0, total_rows
+
+def relation_has_match_id(conn, table, relations):
+    """Whether a table or relation has a match_id column to scope rules by"""
+    description = conn.execute(f"SELECT * FROM {relation_source(table, relations)} LIMIT 0").description
+    return 'match_id' in [col[0] for col in description]
+
+def refresh_rule_partials(conn, table, table_rules, relations, fingerprints, rescan_all):
+    """Recompute the partials of one relation's rules for quality_delta, or all matches"""
+    rule_names = list(fingerprints)
+    partials = ",\n            ".join(
+        f"{partial_json_sql(rule)} AS partial_{i}" for i, rule in enumerate(table_rules)
+    )
+    scope = "" if rescan_all else "WHERE match_id IN (SELECT match_id FROM quality_delta)"
+
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        conn.execute(f"""
+        CREATE OR REPLACE TEMPORARY TABLE quality_partials_staged AS
+        SELECT
+            match_id,
+            COUNT(*) AS total_rows,
+            {partials}
+        FROM {relation_source(table, relations)}
+        {scope}
+        GROUP BY match_id
+        """)
+
+        # Replace the partials of the rescanned matches
+        if rescan_all:
+            conn.execute(f"DELETE FROM {QUALITY_PARTIALS_TABLE} WHERE rule_name IN (SELECT UNNEST(?))",
+                         [rule_names])
+        else:
+            conn.execute(f"""
+            DELETE FROM {QUALITY_PARTIALS_TABLE}
+            WHERE rule_name IN (SELECT UNNEST(?))
+              AND match_id IN (SELECT match_id FROM quality_delta)
+            """, [rule_names])
+
+        for i, rule in enumerate(table_rules):
+            conn.execute(f"""
+            INSERT INTO {QUALITY_PARTIALS_TABLE}
+            SELECT ?, match_id, total_rows, partial_{i}, current_timestamp
+            FROM quality_partials_staged
+            """, [rule['name']])
+            conn.execute(
+                f"INSERT OR REPLACE INTO {QUALITY_RULE_STATE_TABLE} VALUES (?, ?, current_timestamp)",
+                [rule['name'], fingerprints[rule['name']]]
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def evaluate_rules_incremental(conn, rules, relations=None, match_ids=()):
+    """Evaluate rules, rescanning only the given match_ids where possible
+
+    Rules on a relation with a match_id column keep one partial aggregate per
+    match in quality_partials. Only the given (new, changed or removed)
+    matches are rescanned; the partials are then merged into the rule value
+    with one aggregate over quality_partials per rule.
+    A relation is rescanned in full when one of its rules is new or its
+    definition changed. Rules on relations without match_id are evaluated in
+    full. Returns results in the same form as evaluate_rules.
+    """
+    relations = relations or {}
+
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {QUALITY_PARTIALS_TABLE} (
+        rule_name VARCHAR,
+        match_id VARCHAR,
+        total_rows BIGINT,
+        partial_value VARCHAR,
+        updated_at TIMESTAMP
+    )
+    """)
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {QUALITY_RULE_STATE_TABLE} (
+        rule_name VARCHAR PRIMARY KEY,
+        rule_fingerprint VARCHAR,
+        updated_at TIMESTAMP
+    )
+    """)
+    conn.execute(
+        "CREATE OR REPLACE TEMPORARY TABLE quality_delta AS SELECT UNNEST(?::VARCHAR[]) AS match_id",
+        [[str(match_id) for match_id in match_ids]]
+    )
+    stored_fingerprints = dict(conn.execute(
+        f"SELECT rule_name, rule_fingerprint FROM {QUALITY_RULE_STATE_TABLE}"
+    ).fetchall())
+
+    results = {}
+    unscoped_rules = []
+
+    for table, table_rules in rules_by_table(rules).items():
+        try:
+            if not relation_has_match_id(conn, table, relations):
+                unscoped_rules.extend(table_rules)
+                continue
+
+            fingerprints = {rule['name']: rule_fingerprint(rule, relations) for rule in table_rules}
+            rescan_all = any(stored_fingerprints.get(name) != fingerprint
+                             for name, fingerprint in fingerprints.items())
+
+            refresh_rule_partials(conn, table, table_rules, relations, fingerprints, rescan_all)
+
+            for rule in table_rules:
+                raw_value, total_rows = merge_partials(conn, rule)
+                results[rule['name']] = graded_result(table, rule, raw_value, total_rows)
+
+        except Exception as e:
+            results.update(failed_results(table, table_rules, e))
+
+    results.update(evaluate_rules(conn, unscoped_rules, relations))
+
+    return {rule['name']: results[rule['name']] for rule in rules}
+
+def clear_rule_partials(conn):
+    """Drop the stored partials, so the next incremental run rescans every match"""
+    conn.execute(f"DROP TABLE IF EXISTS {QUALITY_PARTIALS_TABLE}")
+    conn.execute(f"DROP TABLE IF EXISTS {QUALITY_RULE_STATE_TABLE}")
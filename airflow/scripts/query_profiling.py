@@ -0,0 +1,173 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+def calling_function():
+    """'module.function' of the nearest caller outside this module"""
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_globals.get('__name__') == __name__:
+        frame = frame.f_back
+    if frame is None:
+        return 'unknown'
+    return f"{frame.f_globals.get('__name__')}.{frame.f_code.co_name}"
+
+def profile_operators(node):
+    """Flatten a DuckDB JSON profile tree into [(operator, seconds, rows)]"""
+    operators = []
+    for child in node.get('children', []):
+        # Key names differ between DuckDB versions
+        name = child.get('operator_type') or child.get('name')
+        seconds = child.get('operator_timing', child.get('timing', 0)) or 0
+        rows = child.get('operator_cardinality', child.get('cardinality', 0)) or 0
+        if name:
+            operators.append((name, seconds, rows))
+        operators.extend(profile_operators(child))
+    return operators
+
+class ProfiledConnection:
+    """DuckDB connection or cursor that profiles every statement it executes
+
+    Everything other than execute() and cursor() is passed through to the
+    wrapped connection, so results are fetched from it as usual.
+    """
+
+    def __init__(self, conn, profiler):
+        self.conn = conn
+        self.profiler = profiler
+        self.profile_path = os.path.join(profiler.profile_dir, f"{uuid.uuid4().hex}.json")
+        self.pending = None
+        conn.execute("SET enable_profiling = 'json'")
+        conn.execute(f"SET profiling_output = '{self.profile_path}'")
+        profiler.connections.append(self)
+
+    def execute(self, query, parameters=None):
+        self.collect()
+        function = calling_function()
+
+        start = time.perf_counter()
+        if parameters is None:
+            result = self.conn.execute(query)
+        else:
+            result = self.conn.execute(query, parameters)
+        self.pending = (function, query, time.perf_counter() - start)
+        return result
+
+    def collect(self):
+        """Record the previous statement
+
+        DuckDB writes the profile of a query once its whole result has been
+        fetched, so a statement is recorded when the next one starts or the
+        report is written, after fetching any rows the caller left.
+        """
+        if self.pending is None:
+            return
+        function, query, seconds = self.pending
+        self.pending = None
+
+        if not os.path.exists(self.profile_path):
+            try:
+                self.conn.fetchall()
+            except Exception:
+                pass
+
+        profile = None
+        if os.path.exists(self.profile_path):
+            with open(self.profile_path, 'r') as f:
+                profile = json.load(f)
+            os.remove(self.profile_path)
+        self.profiler.record(function, query, seconds, profile)
+
+    def cursor(self):
+        return ProfiledConnection(self.conn.cursor(), self.profiler)
+
+    def stop(self):
+        """Turn profiling off again, for connections that outlive the profiled step"""
+        self.collect()
+        self.conn.execute("PRAGMA disable_profiling")
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+class QueryProfiler:
+    """Collects a DuckDB JSON profile of every statement run on wrapped connections"""
+
+    def __init__(self, name):
+        self.name = name
+        self.profile_dir = tempfile.mkdtemp(prefix=f"duckdb_profile_{name}_")
+        self.statements = []
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def wrap(self, conn):
+        """Profile the statements of conn and of the cursors opened from it"""
+        return ProfiledConnection(conn, self)
+
+    def record(self, function, query, seconds, profile):
+        """Keep one statement's timing and operator breakdown
+
+        A query result is streamed as it is fetched, so its time is the larger
+        of the execute() call and the summed operator timings.
+        """
+        operator_seconds = defaultdict(float)
+        operator_rows = defaultdict(int)
+        for operator, operator_time, rows in profile_operators(profile or {}):
+            operator_seconds[operator] += operator_time
+            operator_rows[operator] += rows
+
+        statement = {
+            'function': function,
+            'sql': ' '.join(query.split()),
+            'seconds': max(seconds, sum(operator_seconds.values())),
+            'operators': {
+                operator: {'seconds': operator_seconds[operator], 'rows': operator_rows[operator]}
+                for operator in sorted(operator_seconds, key=operator_seconds.get, reverse=True)
+            }
+        }
+        with self.lock:
+            self.statements.append(statement)
+
+    def report(self, top_n=20):
+        """Top N slowest statements plus time per calling function and per operator"""
+        by_function = defaultdict(lambda: {'statements': 0, 'seconds': 0.0})
+        by_operator = defaultdict(float)
+        for statement in self.statements:
+            by_function[statement['function']]['statements'] += 1
+            by_function[statement['function']]['seconds'] += statement['seconds']
+            for operator, timing in statement['operators'].items():
+                by_operator[operator] += timing['seconds']
+
+        slowest = sorted(self.statements, key=lambda statement: statement['seconds'], reverse=True)[:top_n]
+        return {
+            'name': self.name,
+            'statements': len(self.statements),
+            'total_seconds': sum(statement['seconds'] for statement in self.statements),
+            'top_statements': slowest,
+            'by_function': dict(sorted(by_function.items(), key=lambda item: item[1]['seconds'], reverse=True)),
+            'by_operator': dict(sorted(by_operator.items(), key=lambda item: item[1], reverse=True))
+        }
+
+    def write_report(self, output_dir, top_n=20):
+        """Save the report as query_profile_<name>.json and print the slowest statements"""
+        for conn in self.connections:
+            conn.collect()
+        report = self.report(top_n)
+        report_path = os.path.join(output_dir, f"query_profile_{self.name}.json")
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+        print(f"Profiled {report['statements']} statements ({report['total_seconds']:.2f}s), slowest:")
+        for statement in report['top_statements'][:10]:
+            operators = ', '.join(
+                f"{operator} {timing['seconds']:.3f}s" for operator, timing in list(statement['operators'].items())[:3]
+            )
+            print(f"- {statement['seconds']:.3f}s {statement['function']}: {statement['sql'][:80]} [{operators}]")
+        print(f"Query profile saved to {report_path}")
+
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+        return report_path
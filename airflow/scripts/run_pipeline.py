@@ -0,0 +1,117 @@
+import argparse
+import time
+
+import corpus_cache
+import pipeline_metrics
+import sharding
+import step1_unzipping
+import step2_quality_assessment_pre
+import step3_unnesting
+import step4_quality_assessment_post
+import step5_added_features
+from duckdb_connection import configure_duckdb, connect_duckdb
+from pipeline_config import CONFIG
+
+# Paths from the pipeline config
+BASE_DIR = CONFIG['base_dir']
+DATA_DIR = CONFIG['data_dir']
+DB_PATH = CONFIG['db_path']
+
+def run_pipeline(incremental=False, pre_quality_gate=None, cache_json=True):
+    """Run steps 1-5 in this process, without Airflow
+
+    The steps share one DuckDB connection, and with cache_json each match
+    file is parsed once for both step 2 and step 3. Full runs load the parsed
+    tables straight from memory; incremental runs process only the archive
+    members changed since the last extraction, as the incremental DAG does.
+    The pre-quality and post-quality gates raise like their DAG tasks.
+
+    Returns {'steps': {step: result}, 'seconds': {step: seconds}}.
+    """
+    pre_quality_gate = pre_quality_gate or CONFIG['pre_quality_gate']
+    if cache_json:
+        corpus_cache.enable_cache()
+
+    results = {}
+    seconds = {}
+
+    def timed(step_name, step, *args, **kwargs):
+        start = time.time()
+        results[step_name] = step(*args, **kwargs)
+        seconds[step_name] = time.time() - start
+        print(f"{step_name} completed in {seconds[step_name]:.2f}s")
+        return results[step_name]
+
+    # Step 1
+    if incremental:
+        delta = timed('step1', step1_unzipping.extract_changed_members)
+        match_ids = sorted(set(delta['added'] + delta['changed'] + delta['removed']))
+        if not match_ids:
+            print("No changed matches, nothing to do")
+            step1_unzipping.commit_archive_state()
+            return {'steps': results, 'seconds': seconds}
+    else:
+        timed('step1', step1_unzipping.main)
+        match_ids = None
+
+    # Step 2
+    if incremental:
+        plan = sharding.plan_shards(match_ids=match_ids)
+        shard_profiles = [step2_quality_assessment_pre.profile_shard(**shard) for shard in plan]
+        summary = timed('step2', step2_quality_assessment_pre.merge_shard_profiles, shard_profiles, match_ids)
+    else:
+        summary = timed('step2', step2_quality_assessment_pre.main)
+    if pre_quality_gate == 'block' and summary['verdict'] == 'fail':
+        raise ValueError(f"Step 2 pre-quality gate failed: {summary}")
+
+    # Bulk-load settings for step 3, the usual ones from step 4 on
+    conn = connect_duckdb(DB_PATH, bulk_load=True)
+    try:
+        # Step 3
+        if incremental:
+            for shard in plan:
+                step3_unnesting.process_shard(**shard)
+            timed('step3', step3_unnesting.merge_shards, match_ids=match_ids, conn=conn)
+        else:
+            timed('step3', step3_unnesting.main, conn=conn)
+
+        # Step 4
+        configure_duckdb(conn, label=DB_PATH)
+        quality = timed('step4', step4_quality_assessment_post.main,
+                        incremental=incremental, match_ids=match_ids, conn=conn)
+        if quality.get('quality_gate') == 'fail' or quality['status'] == 'error':
+            raise ValueError(f"Step 4 quality gate failed: {quality}")
+
+        # Step 5
+        features = timed('step5', step5_added_features.main,
+                         incremental=incremental, match_ids=match_ids, conn=conn)
+        if features['status'] == 'error':
+            raise RuntimeError(f"Step 5 failed: {features['message']}")
+
+        # Later runs start from this archive only now that every step succeeded
+        step1_unzipping.commit_archive_state()
+
+    finally:
+        pipeline_metrics.load_metrics_table(conn)
+        conn.close()
+
+    print("Pipeline step timings:")
+    for step_name, step_seconds in seconds.items():
+        print(f"- {step_name}: {step_seconds:.2f}s")
+
+    return {'steps': results, 'seconds': seconds}
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the cricket pipeline in a single process')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only process archive members changed since the last extraction')
+    parser.add_argument('--pre-quality-gate', choices=['block', 'off'],
+                        default=CONFIG['pre_quality_gate'])
+    parser.add_argument('--no-cache', action='store_true', help='parse match files again in each step')
+    args = parser.parse_args()
+
+    run_pipeline(incremental=args.incremental, pre_quality_gate=args.pre_quality_gate,
+                 cache_json=not args.no_cache)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import hashlib
+import math
+import os
+import shutil
+from glob import glob
+
+from pipeline_config import CONFIG
+
+# Paths from the pipeline config
+BASE_DIR = CONFIG['base_dir']
+DATA_DIR = CONFIG['data_dir']
+EXTRACTED_DIR = CONFIG['extracted_dir']
+SHARD_DIR = CONFIG['shard_dir']
+
+# Shards are sized by file count, up to the number of parallel tasks wanted
+FILES_PER_SHARD = CONFIG['files_per_shard']
+MAX_SHARDS = CONFIG['max_shards']
+
+def shard_for_file(file_path, num_shards):
+    """Stable shard index of a JSON file, from a hash of its file name"""
+    digest = hashlib.md5(os.path.basename(file_path).encode('utf-8')).hexdigest()
+    return int(digest, 16) % num_shards
+
+def corpus_files(directory_path=None, match_ids=None):
+    """JSON files of the corpus, or only those of the given match_ids"""
+    json_files = glob(os.path.join(directory_path or EXTRACTED_DIR, '*.json'))
+    if match_ids is not None:
+        match_ids = set(str(match_id) for match_id in match_ids)
+        json_files = [path for path in json_files if os.path.basename(path).split('.')[0] in match_ids]
+    return json_files
+
+def shard_files(shard_index, num_shards, directory_path=None, match_ids=None):
+    """Sorted JSON files of the corpus that belong to one shard"""
+    json_files = corpus_files(directory_path, match_ids)
+    return sorted(path for path in json_files if shard_for_file(path, num_shards) == shard_index)
+
+def plan_shards(directory_path=None, files_per_shard=FILES_PER_SHARD, max_shards=MAX_SHARDS, match_ids=None):
+    """List the shards to process, one {'shard_index', 'num_shards'} per task
+
+    With match_ids, only those matches are processed and each shard also
+    gets the 'match_ids'; an empty list plans no shards at all. Also clears
+    the shard outputs of the previous run.
+    """
+    json_files = corpus_files(directory_path, match_ids)
+    if match_ids is None and not json_files:
+        raise FileNotFoundError(f"No JSON files found in {directory_path or EXTRACTED_DIR}")
+
+    shutil.rmtree(SHARD_DIR, ignore_errors=True)
+    os.makedirs(SHARD_DIR, exist_ok=True)
+
+    if match_ids is not None and not match_ids:
+        print("No changed matches to process")
+        return []
+
+    num_shards = max(1, min(max_shards, math.ceil(len(json_files) / files_per_shard)))
+
+    print(f"Planned {num_shards} shards for {len(json_files)} JSON files")
+    if match_ids is None:
+        return [{'shard_index': i, 'num_shards': num_shards} for i in range(num_shards)]
+    return [{'shard_index': i, 'num_shards': num_shards, 'match_ids': sorted(match_ids)} for i in range(num_shards)]
+
+def shard_output_dir(step_name, shard_index):
+    """Empty directory for one step's outputs of one shard"""
+    output_dir = os.path.join(SHARD_DIR, step_name, f"shard_{shard_index}")
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+    return output_dir
+
+def shard_output_paths(step_name, file_name):
+    """Paths of one output file across all shards of a step"""
+    return sorted(glob(os.path.join(SHARD_DIR, step_name, 'shard_*', file_name)))
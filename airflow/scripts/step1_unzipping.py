@@ -1,22 +1,146 @@
 import zipfile
 import os
-import duckdb
 import glob
+import hashlib
+import json
 
-# Set up paths relative to Airflow directory
-BASE_DIR = '/home/lohit/airflow'
-DATA_DIR = os.path.join(BASE_DIR, 'data')
-EXTRACTED_DIR = os.path.join(DATA_DIR, 'extracted_data_json')
+from duckdb_connection import connect_duckdb
+from pipeline_config import CONFIG
+from pipeline_metrics import instrumented
 
+# Paths from the pipeline config
+BASE_DIR = CONFIG['base_dir']
+DATA_DIR = CONFIG['data_dir']
+EXTRACTED_DIR = CONFIG['extracted_dir']
+ZIP_PATH = os.path.join(DATA_DIR, 'all_json.zip')
+
+# Members and signature of the archive last loaded by a successful run, and
+# of the archive being loaded by the current run until it succeeds
+ARCHIVE_MANIFEST_PATH = os.path.join(DATA_DIR, 'archive_manifest.json')
+ARCHIVE_WATCH_PATH = os.path.join(DATA_DIR, 'archive_watch.json')
+PENDING_ARCHIVE_PATH = os.path.join(DATA_DIR, 'archive_pending.json')
+
+def archive_members(zip_path=None):
+    """{member name: 'crc:size'} of the JSON files in the archive, read from its directory"""
+    zip_path = zip_path or ZIP_PATH
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        return {
+            info.filename: f"{info.CRC}:{info.file_size}"
+            for info in zip_ref.infolist() if info.filename.endswith('.json')
+        }
+
+def load_json_state(path):
+    """Saved state dict, or an empty one"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_json_state(path, state):
+    """Replace a saved state dict"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(temp_path, path)
+
+def archive_signature(zip_path=None, previous=None):
+    """{'mtime', 'size', 'sha256'} of the archive
+    
+    The file is only hashed again when its mtime or size differ from previous.
+    """
+    zip_path = zip_path or ZIP_PATH
+    stat = os.stat(zip_path)
+    previous = previous or {}
+    if previous.get('mtime') == stat.st_mtime and previous.get('size') == stat.st_size:
+        return previous
+    
+    digest = hashlib.sha256()
+    with open(zip_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha256': digest.hexdigest()}
+
+def archive_changed(zip_path=None):
+    """Whether the archive content differs from the one last loaded by a successful run"""
+    zip_path = zip_path or ZIP_PATH
+    if not os.path.exists(zip_path):
+        return False
+    
+    seen = load_json_state(ARCHIVE_WATCH_PATH)
+    signature = archive_signature(zip_path, seen)
+    return signature['sha256'] != seen.get('sha256')
+
+def stage_archive_state(members, zip_path=None):
+    """Keep the members and signature of the archive being extracted until the run succeeds"""
+    zip_path = zip_path or ZIP_PATH
+    signature = archive_signature(zip_path, load_json_state(ARCHIVE_WATCH_PATH))
+    save_json_state(PENDING_ARCHIVE_PATH, {'members': members, 'signature': signature})
+
+def commit_archive_state():
+    """Record the archive of the current run as loaded, once every step succeeded
+    
+    Until then, incremental runs extract the members changed since the last
+    successful run, and the watcher keeps seeing the archive as changed.
+    """
+    pending = load_json_state(PENDING_ARCHIVE_PATH)
+    if not pending:
+        print("No extracted archive to record")
+        return None
+    
+    save_json_state(ARCHIVE_MANIFEST_PATH, pending['members'])
+    save_json_state(ARCHIVE_WATCH_PATH, pending['signature'])
+    os.remove(PENDING_ARCHIVE_PATH)
+    print(f"Recorded archive with {len(pending['members'])} members as loaded")
+    return pending['signature']
+
+@instrumented
+def extract_changed_members(zip_path=None):
+    """Extract only the archive members added or changed since the last successful run
+    
+    JSON files of members removed from the archive are deleted. Returns the
+    delta manifest {'added', 'changed', 'removed'} as sorted match_id lists.
+    """
+    zip_path = zip_path or ZIP_PATH
+    if not os.path.exists(zip_path):
+        raise FileNotFoundError(f"Zip file not found at {zip_path}")
+    
+    os.makedirs(EXTRACTED_DIR, exist_ok=True)
+    
+    previous = load_json_state(ARCHIVE_MANIFEST_PATH)
+    current = archive_members(zip_path)
+    
+    added = sorted(name for name in current if name not in previous)
+    changed = sorted(name for name in current if name in previous and current[name] != previous[name])
+    removed = sorted(name for name in previous if name not in current)
+    
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        for name in added + changed:
+            zip_ref.extract(name, EXTRACTED_DIR)
+    
+    for name in removed:
+        extracted_path = os.path.join(EXTRACTED_DIR, name)
+        if os.path.exists(extracted_path):
+            os.remove(extracted_path)
+    
+    stage_archive_state(current, zip_path)
+    
+    def match_ids(names):
+        return [os.path.basename(name).split('.')[0] for name in names]
+    
+    delta = {'added': match_ids(added), 'changed': match_ids(changed), 'removed': match_ids(removed)}
+    print(f"Extracted {len(added)} added and {len(changed)} changed members, removed {len(removed)}")
+    return delta
+
+@instrumented
 def main():
     """Main function to extract zip file and set up database connection"""
     
     # Create DuckDB connection
     db_path = os.path.join(DATA_DIR, 'data_engineering_project.duckdb')
-    con = duckdb.connect(db_path)
+    con = connect_duckdb(db_path)
     
     # Extract zip file
-    zip_path = os.path.join(DATA_DIR, 'all_json.zip')
+    zip_path = ZIP_PATH
     
     if not os.path.exists(zip_path):
         raise FileNotFoundError(f"Zip file not found at {zip_path}")
@@ -29,6 +153,9 @@ def main():
     with zipfile.ZipFile(zip_path, 'r') as zip_ref:
         zip_ref.extractall(EXTRACTED_DIR)
     
+    # Later incremental runs extract only what changed since this one, once it succeeds
+    stage_archive_state(archive_members(zip_path), zip_path)
+    
     # Verify extraction
     extracted_files = glob.glob(os.path.join(EXTRACTED_DIR, '*.json'))
     print(f"Successfully extracted {len(extracted_files)} JSON files")
@@ -1,20 +1,28 @@
-import json
 import os
 from glob import glob
 import pandas as pd
 from collections import defaultdict, Counter
 import numpy as np
 
-# Set up paths relative to Airflow directory
-BASE_DIR = '/home/lohit/airflow'
-DATA_DIR = os.path.join(BASE_DIR, 'data')
-EXTRACTED_DIR = os.path.join(DATA_DIR, 'extracted_data_json')
+from corpus_cache import load_match_json
+from pipeline_config import CONFIG
+from pipeline_metrics import instrumented
+from sharding import shard_files, shard_output_dir, shard_output_paths
+
+# Paths from the pipeline config
+BASE_DIR = CONFIG['base_dir']
+DATA_DIR = CONFIG['data_dir']
+EXTRACTED_DIR = CONFIG['extracted_dir']
+
+# Pre-quality verdict: 'fail' above these shares of unreadable files or of
+# matches without innings, 'warn' when there are any
+MAX_ERROR_FILE_RATIO = 0.01
+MAX_NO_INNINGS_RATIO = 0.05
 
 def explore_json_structure(file_path):
     """Explore structure of a single JSON file"""
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+        data = load_match_json(file_path)
         
         structure_info = {
             'top_level_keys': list(data.keys()),
@@ -49,8 +57,7 @@ def get_deep_schema_profile(file_paths, max_files=1000):
             print(f"Processed {i}/{len(files_to_process)} files...")
             
         try:
-            with open(file_path, 'r') as f:
-                data = json.load(f)
+            data = load_match_json(file_path)
             
             # Track top-level keys
             top_level_schema[tuple(sorted(data.keys()))] += 1
@@ -75,6 +82,7 @@ def get_deep_schema_profile(file_paths, max_files=1000):
         'match_types': dict(match_types)
     }
 
+@instrumented
 def extract_match_metadata(file_paths, max_files=500):
     """Extract metadata from match files"""
     files_to_process = file_paths[:max_files] if len(file_paths) > max_files else file_paths
@@ -83,8 +91,7 @@ def extract_match_metadata(file_paths, max_files=500):
     
     for file_path in files_to_process:
         try:
-            with open(file_path, 'r') as f:
-                data = json.load(f)
+            data = load_match_json(file_path)
             
             match_id = os.path.basename(file_path).split('.')[0]
             meta = data.get('meta', {})
@@ -110,17 +117,18 @@ def extract_match_metadata(file_paths, max_files=500):
     
     return pd.DataFrame(metadata_list)
 
-def analyze_runs_and_overs(data_dir, max_files=500):
+def analyze_runs_and_overs(data_dir, max_files=500, json_files=None):
     """Analyze runs and overs distribution"""
-    json_files = glob(os.path.join(data_dir, '*.json'))[:max_files]
+    if json_files is None:
+        json_files = glob(os.path.join(data_dir, '*.json'))
+    json_files = json_files[:max_files]
     
     runs_per_delivery = []
     deliveries_per_over = defaultdict(list)
     
     for filename in json_files:
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                match_data = json.load(f)
+            match_data = load_match_json(filename)
             
             match_type = match_data.get('info', {}).get('match_type', 'unknown')
             
@@ -146,6 +154,110 @@ def analyze_runs_and_overs(data_dir, max_files=500):
         'overs_by_match_type': dict(deliveries_per_over)
     }
 
+def pre_quality_verdict(summary, allow_empty=False):
+    """'pass', 'warn' or 'fail' from a quality assessment summary
+    
+    allow_empty: an incremental run with nothing new to profile passes
+    """
+    files_processed = summary['files_processed']
+    matches = summary['matches_with_data']
+    if files_processed == 0 and allow_empty:
+        return 'pass'
+    if files_processed == 0 or matches == 0:
+        return 'fail'
+    
+    error_ratio = summary['files_with_errors'] / files_processed
+    no_innings_ratio = (matches - summary['matches_with_innings']) / matches
+    if error_ratio > MAX_ERROR_FILE_RATIO or no_innings_ratio > MAX_NO_INNINGS_RATIO:
+        return 'fail'
+    if error_ratio > 0 or no_innings_ratio > 0:
+        return 'warn'
+    return 'pass'
+
+@instrumented
+def profile_shard(shard_index, num_shards, match_ids=None):
+    """Profile every file of one corpus shard; return counts for merge_shard_profiles"""
+    shard_paths = shard_files(shard_index, num_shards, EXTRACTED_DIR, match_ids)
+    print(f"Profiling shard {shard_index + 1}/{num_shards}: {len(shard_paths)} files")
+    
+    schema_profile = get_deep_schema_profile(shard_paths, max_files=len(shard_paths))
+    metadata_df = extract_match_metadata(shard_paths, max_files=len(shard_paths))
+    analysis_results = analyze_runs_and_overs(EXTRACTED_DIR, max_files=len(shard_paths), json_files=shard_paths)
+    
+    output_dir = shard_output_dir('step2', shard_index)
+    if not metadata_df.empty:
+        metadata_df.to_csv(os.path.join(output_dir, 'cricket_match_metadata.csv'), index=False)
+    
+    # Plain string keys so the result can travel through XCom as JSON
+    return {
+        'shard_index': shard_index,
+        'total_files': len(shard_paths),
+        'files_processed': schema_profile['total_files'],
+        'error_count': schema_profile['error_count'],
+        'top_level_variations': {'|'.join(keys): count for keys, count in schema_profile['top_level_variations'].items()},
+        'match_types': schema_profile['match_types'],
+        'runs_distribution': {str(runs): count for runs, count in analysis_results['runs_distribution'].items()},
+        'matches_with_data': len(metadata_df),
+        'matches_with_innings': int(metadata_df['has_innings_data'].sum()) if not metadata_df.empty else 0
+    }
+
+@instrumented
+def merge_shard_profiles(shard_results, match_ids=None):
+    """Combine the shard profiles into the metadata CSV and one summary
+    
+    With match_ids, only the rows of those matches are replaced in the
+    existing metadata CSV, and the summary covers the profiled matches.
+    The verdict is then taken over the whole corpus in the CSV, so one bad
+    file in a small delta is not judged as a large share of the data.
+    """
+    top_level_variations = Counter()
+    match_types = Counter()
+    runs_distribution = Counter()
+    for result in shard_results:
+        top_level_variations.update(result['top_level_variations'])
+        match_types.update(result['match_types'])
+        runs_distribution.update(result['runs_distribution'])
+    
+    # Save metadata
+    metadata_parts = [pd.read_csv(path, dtype={'match_id': str}) for path in shard_output_paths('step2', 'cricket_match_metadata.csv')]
+    metadata_path = os.path.join(DATA_DIR, 'cricket_match_metadata.csv')
+    if match_ids is not None and os.path.exists(metadata_path):
+        previous_df = pd.read_csv(metadata_path, dtype={'match_id': str})
+        metadata_parts.insert(0, previous_df[~previous_df['match_id'].isin([str(m) for m in match_ids])])
+    metadata_df = pd.concat(metadata_parts, ignore_index=True) if metadata_parts else pd.DataFrame()
+    metadata_df.to_csv(metadata_path, index=False)
+    print(f"Saved metadata for {len(metadata_df)} matches to {metadata_path}")
+    
+    print(f"- Top-level schema variations: {len(top_level_variations)}")
+    print(f"- Most common runs per delivery: {runs_distribution.most_common(5)}")
+    
+    summary = {
+        'total_files': sum(result['total_files'] for result in shard_results),
+        'files_processed': sum(result['files_processed'] for result in shard_results),
+        'files_with_errors': sum(result['error_count'] for result in shard_results),
+        'match_types': len(match_types),
+        'matches_with_data': sum(result['matches_with_data'] for result in shard_results),
+        'matches_with_innings': sum(result['matches_with_innings'] for result in shard_results)
+    }
+    
+    verdict_summary = summary
+    if match_ids is not None and not metadata_df.empty:
+        # Unreadable files have no metadata row, so only this run's are known
+        verdict_summary = {
+            'files_processed': len(metadata_df) + summary['files_with_errors'],
+            'files_with_errors': summary['files_with_errors'],
+            'matches_with_data': len(metadata_df),
+            'matches_with_innings': int(metadata_df['has_innings_data'].astype(bool).sum())
+        }
+    summary['verdict'] = pre_quality_verdict(verdict_summary, allow_empty=match_ids is not None)
+    
+    print("Quality assessment summary:")
+    for key, value in summary.items():
+        print(f"- {key}: {value}")
+    
+    return summary
+
+@instrumented
 def main():
     """Main function for quality assessment"""
     print("Starting pre-wrangling quality assessment...")
@@ -194,10 +306,12 @@ def main():
     summary = {
         'total_files': len(all_files),
         'files_processed': schema_profile['total_files'],
+        'files_with_errors': schema_profile['error_count'],
         'match_types': len(schema_profile['match_types']),
         'matches_with_data': len(metadata_df),
         'matches_with_innings': len(metadata_df[metadata_df['has_innings_data'] == True])
     }
+    summary['verdict'] = pre_quality_verdict(summary)
     
     print("Quality assessment summary:")
     for key, value in summary.items():
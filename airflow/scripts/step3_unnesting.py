@@ -1,21 +1,46 @@
-import json
 import pandas as pd
 import os
 import glob
-import duckdb
 from datetime import datetime
 from collections import defaultdict, Counter
 
-# Set up paths relative to Airflow directory
-BASE_DIR = '/home/lohit/airflow'
-DATA_DIR = os.path.join(BASE_DIR, 'data')
-EXTRACTED_DIR = os.path.join(DATA_DIR, 'extracted_data_json')
+from corpus_cache import load_match_json
+from cricket_schema import PLAYER_NAMES_SQL, typed_select_sql
+from duckdb_connection import connect_duckdb
+from pipeline_config import CONFIG
+from pipeline_metrics import instrumented
+from name_resolution import build_name_mappings, carry_over_approvals, mapping_for
+from sharding import shard_files, shard_output_dir, shard_output_paths
+
+# Paths from the pipeline config
+BASE_DIR = CONFIG['base_dir']
+DATA_DIR = CONFIG['data_dir']
+EXTRACTED_DIR = CONFIG['extracted_dir']
+DB_PATH = CONFIG['db_path']
+BATCH_SIZE = CONFIG['batch_size']
+
+# Columns that canonical venue, city and team names are applied to at load time
+NAME_COLUMNS = {
+    'venue': [('matches', 'venue')],
+    'city': [('matches', 'city')],
+    'team': [
+        ('matches', 'team1'),
+        ('matches', 'team2'),
+        ('matches', 'toss_winner'),
+        ('matches', 'outcome_winner'),
+        ('innings', 'batting_team'),
+        ('innings', 'bowling_team')
+    ]
+}
 
 # Global dictionaries for player tracking
 player_name_to_id = {}
 player_id_to_names = defaultdict(list)
 next_synthetic_id = 1000000
 
+# Appearances of each (player_name, player_id) pair, for the player_names table
+player_name_occurrences = Counter()
+
 def get_player_id(player_name, player_registry):
     """Get or create player ID with enhanced handling"""
     global next_synthetic_id
@@ -29,22 +54,26 @@ def get_player_id(player_name, player_registry):
     if player_id is not None:
         player_id_to_names[player_id].append(player_name)
         player_name_to_id[player_name] = player_id
+        player_name_occurrences[(player_name, player_id)] += 1
         return player_id
     
     # If not in registry, check our global mapping
     if player_name in player_name_to_id:
         player_id = player_name_to_id[player_name]
         player_id_to_names[player_id].append(player_name)
+        player_name_occurrences[(player_name, player_id)] += 1
         return player_id
     
     # Create a new synthetic ID
     player_id = f"SYNTH_{next_synthetic_id}"
     player_name_to_id[player_name] = player_id
     player_id_to_names[player_id].append(player_name)
+    player_name_occurrences[(player_name, player_id)] += 1
     next_synthetic_id += 1
     
     return player_id
 
+@instrumented
 def extract_matches_table(data_list):
     """Extract matches table with enhanced player ID handling"""
     matches = []
@@ -110,6 +139,7 @@ def extract_matches_table(data_list):
     
     return pd.DataFrame(matches)
 
+@instrumented
 def extract_innings_table(data_list):
     """Extract innings table"""
     innings_rows = []
@@ -155,6 +185,7 @@ def extract_innings_table(data_list):
     
     return pd.DataFrame(innings_rows)
 
+@instrumented
 def extract_overs_table(data_list):
     """Extract overs table"""
     overs_rows = []
@@ -214,6 +245,7 @@ def extract_overs_table(data_list):
     
     return pd.DataFrame(overs_rows)
 
+@instrumented
 def extract_deliveries_table(data_list):
     """Extract deliveries table"""
     delivery_rows = []
@@ -309,6 +341,7 @@ def extract_deliveries_table(data_list):
     
     return pd.DataFrame(delivery_rows)
 
+@instrumented
 def extract_players_table(data_list):
     """Extract players table with name variations"""
     # First, gather all player name variations from registry
@@ -336,9 +369,24 @@ def extract_players_table(data_list):
     
     return pd.DataFrame(players_list)
 
-def process_cricket_json_in_batches(directory_path, batch_size=1000):
+@instrumented
+def extract_player_names_table():
+    """Extract player_names table: every name seen in the matches with its ID and appearances"""
+    player_names_list = [
+        {'player_name': player_name, 'player_id': player_id, 'occurrences': occurrences}
+        for (player_name, player_id), occurrences in player_name_occurrences.items()
+    ]
+    
+    return pd.DataFrame(player_names_list)
+
+def process_cricket_json_in_batches(directory_path, batch_size=1000, json_files=None):
     """Process JSON files in smaller batches to reduce memory usage"""
-    json_files = glob.glob(os.path.join(directory_path, '*.json'))
+    # Player IDs and name counts describe this corpus only, also when a
+    # long-lived process (the runner) processes several corpora
+    reset_player_tracking()
+    
+    if json_files is None:
+        json_files = glob.glob(os.path.join(directory_path, '*.json'))
     total_files = len(json_files)
     
     print(f"Processing {total_files} JSON files in batches of {batch_size}...")
@@ -361,10 +409,9 @@ def process_cricket_json_in_batches(directory_path, batch_size=1000):
         batch_data = []
         for json_file in batch_files:
             try:
-                with open(json_file, 'r') as f:
-                    data = json.load(f)
-                    data['match_id'] = os.path.basename(json_file).split('.')[0]
-                    batch_data.append(data)
+                data = load_match_json(json_file)
+                data['match_id'] = os.path.basename(json_file).split('.')[0]
+                batch_data.append(data)
             except Exception as e:
                 print(f"Error processing {json_file}: {e}")
         
@@ -418,16 +465,19 @@ def process_cricket_json_in_batches(directory_path, batch_size=1000):
         tables['deliveries'] = pd.concat(all_deliveries, ignore_index=True)
         print(f"Combined deliveries table: {len(tables['deliveries'])} rows")
     
+    # Names seen while extracting the batches, with the player IDs they resolved to
+    tables['player_names'] = extract_player_names_table()
+    print(f"Extracted player_names table: {len(tables['player_names'])} rows")
+    
     # Extract players table (only needs to be done once)
     # Use a sample of the data for player extraction to save memory
     sample_files = json_files[:min(5000, len(json_files))]  # Use first 5000 files for player registry
     sample_data = []
     for json_file in sample_files:
         try:
-            with open(json_file, 'r') as f:
-                data = json.load(f)
-                data['match_id'] = os.path.basename(json_file).split('.')[0]
-                sample_data.append(data)
+            data = load_match_json(json_file)
+            data['match_id'] = os.path.basename(json_file).split('.')[0]
+            sample_data.append(data)
         except:
             continue
     
@@ -437,61 +487,406 @@ def process_cricket_json_in_batches(directory_path, batch_size=1000):
     
     return tables
 
-def create_database_with_indexes(data_directory, db_name='cricket_analytics.db'):
-    """Create database with indexes using batch processing"""
-    cricket_data = process_cricket_json_in_batches(data_directory, batch_size=500)  # Smaller batches
+def create_table_indexes(conn, table_name):
+    """Create the lookup indexes of one table"""
+    if table_name == 'matches':
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_id ON {table_name}(match_id)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_date ON {table_name}(date)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_type ON {table_name}(match_type)")
+    
+    elif table_name == 'players':
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_id ON {table_name}(player_id)")
+    
+    elif table_name == 'player_names':
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_name ON {table_name}(player_name)")
+    
+    elif table_name == 'innings':
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_id ON {table_name}(innings_id)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_match ON {table_name}(match_id)")
+    
+    elif table_name == 'overs':
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_id ON {table_name}(over_id)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_innings ON {table_name}(innings_id)")
+    
+    elif table_name == 'deliveries':
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_id ON {table_name}(delivery_id)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_over ON {table_name}(over_id)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_innings ON {table_name}(innings_id)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_match ON {table_name}(match_id)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_batter ON {table_name}(batter_id)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_bowler ON {table_name}(bowler_id)")
+
+def create_database_with_indexes(data_directory, db_name=None, conn=None):
+    """Create database with indexes using batch processing
+    
+    The corpus is loaded through merge_shards as a single shard, so player
+    IDs and names are resolved as in a sharded run.
+    
+    conn: an open connection to the database to use instead of opening one
+    """
+    cricket_data = process_cricket_json_in_batches(data_directory, batch_size=BATCH_SIZE)  # Smaller batches
+    
+    return merge_shards(db_name=db_name, conn=conn, tables=cricket_data)
+
+# Player ID columns that hold shard-local synthetic IDs until merge_shards
+PLAYER_ID_COLUMNS = {
+    'matches': ['player_of_match_id'],
+    'deliveries': ['batter_id', 'bowler_id', 'non_striker_id', 'wicket_player_out_id', 'wicket_fielder_id']
+}
+
+def reset_player_tracking():
+    """Forget the players seen so far, so each corpus or shard starts from a clean state"""
+    global next_synthetic_id
+    
+    player_name_to_id.clear()
+    player_id_to_names.clear()
+    player_name_occurrences.clear()
+    next_synthetic_id = 1000000
+
+@instrumented
+def process_shard(shard_index, num_shards, match_ids=None):
+    """Extract one corpus shard into Parquet files for merge_shards"""
+    shard_paths = shard_files(shard_index, num_shards, EXTRACTED_DIR, match_ids)
+    print(f"Processing shard {shard_index + 1}/{num_shards}: {len(shard_paths)} files")
+    
+    # Names are resolved over the whole corpus in merge_shards
+    cricket_data = process_cricket_json_in_batches(EXTRACTED_DIR, batch_size=BATCH_SIZE, json_files=shard_paths)
     
-    db_path = os.path.join(DATA_DIR, db_name)
-    conn = duckdb.connect(db_path)
+    output_dir = shard_output_dir('step3', shard_index)
+    conn = connect_duckdb(bulk_load=True)
     
-    # Create tables and indexes
+    table_rows = {}
     for table_name, df in cricket_data.items():
         if df is not None and not df.empty:
             df = df.drop_duplicates()
+            output_path = os.path.join(output_dir, f"{table_name}.parquet")
+            conn.execute(f"COPY ({typed_select_sql(table_name, df.columns, 'df')}) TO '{output_path}' (FORMAT PARQUET)")
+            table_rows[table_name] = len(df)
+    
+    conn.close()
+    print(f"Shard {shard_index + 1}/{num_shards} written to {output_dir}: {table_rows}")
+    
+    return {'shard_index': shard_index, 'files': len(shard_paths), 'tables': table_rows}
+
+def shard_relation(table_name):
+    """read_parquet over every shard's file for a table, tagged with shard_index"""
+    paths = shard_output_paths('step3', f"{table_name}.parquet")
+    if not paths:
+        return None
+    return f"""(
+        SELECT * EXCLUDE (filename),
+               CAST(regexp_extract(filename, 'shard_(\\d+)', 1) AS INTEGER) AS shard_index
+        FROM read_parquet({paths!r}, union_by_name = true, filename = true)
+    )"""
+
+def carry_over_mappings(previous, name_mappings, name_counts_by_type):
+    """Add previous mappings of variants that no longer occur, pointed at current canonicals"""
+    if 'approved' not in previous:
+        # Written before mappings needed approval, when every one was applied
+        previous = previous.assign(approved=True)
+    # Unapproved mappings were never applied, so their variants are not replaced
+    previous = previous[previous['approved'].fillna(False).astype(bool)]
+    kept = []
+    for name_type, rows in previous.groupby('name_type'):
+        current = mapping_for(name_mappings, name_type)
+        present = name_counts_by_type.get(name_type, {})
+        rows = rows[~rows['variant'].isin(current) & ~rows['variant'].isin(list(present))].copy()
+        rows['canonical'] = rows['canonical'].map(lambda name: current.get(name, name))
+        kept.append(rows[rows['variant'] != rows['canonical']])
+    return pd.concat([name_mappings] + kept, ignore_index=True)
+
+def resolve_database_names(conn, keep_previous=False):
+    """Build name_mappings from the loaded tables and apply its approved mappings
+    
+    Mappings approved in the existing name_mappings table stay approved.
+    keep_previous: keep the mappings of variants that earlier runs already
+    replaced in the tables, so name_mappings still lists them
+    """
+    name_counts_by_type = {}
+    for name_type, columns in NAME_COLUMNS.items():
+        name_counts = Counter()
+        for table_name, column in columns:
+            name_counts.update(dict(conn.execute(
+                f"SELECT {column}, COUNT(*) FROM {table_name} WHERE {column} IS NOT NULL GROUP BY {column}"
+            ).fetchall()))
+        name_counts_by_type[name_type] = name_counts
+    
+    name_counts_by_type['player'] = dict(conn.execute(
+        "SELECT player_name, SUM(occurrences) FROM player_names GROUP BY player_name"
+    ).fetchall())
+    keys_by_type = {'player': dict(conn.execute(
+        "SELECT player_name, MIN(player_id) FROM player_names WHERE player_id NOT LIKE 'SYNTH_%' GROUP BY player_name"
+    ).fetchall())}
+    
+    name_mappings = build_name_mappings(name_counts_by_type, keys_by_type)
+    loaded_tables = {row[0] for row in conn.execute("SHOW TABLES").fetchall()}
+    if 'name_mappings' in loaded_tables:
+        previous = conn.execute("SELECT * FROM name_mappings").df()
+        name_mappings = carry_over_approvals(previous, name_mappings)
+        if keep_previous:
+            name_mappings = carry_over_mappings(previous, name_mappings, name_counts_by_type)
+    # Registered under another name, so an existing name_mappings table does not shadow it
+    conn.register('resolved_name_mappings', name_mappings)
+    conn.execute("CREATE OR REPLACE TABLE name_mappings AS SELECT * FROM resolved_name_mappings")
+    conn.unregister('resolved_name_mappings')
+    
+    applied = pd.DataFrame(
+        [(name_type, variant, canonical)
+         for name_type in NAME_COLUMNS
+         for variant, canonical in mapping_for(name_mappings, name_type).items()],
+        columns=['name_type', 'variant', 'canonical']
+    )
+    conn.register('applied_name_mappings', applied)
+    for name_type, columns in NAME_COLUMNS.items():
+        for table_name, column in columns:
+            conn.execute(f"""
+            UPDATE {table_name} SET {column} = m.canonical
+            FROM applied_name_mappings m
+            WHERE m.name_type = ? AND {table_name}.{column} = m.variant
+            """, [name_type])
+    conn.unregister('applied_name_mappings')
+    
+    return len(name_mappings)
+
+# Shard tables in dependency order; overs only reach match_id through innings
+MATCH_TABLES = ['matches', 'innings', 'overs', 'deliveries']
+
+def delete_match_rows(conn, match_ids):
+    """Delete the rows of the given matches from the match tables"""
+    conn.execute(
+        "CREATE OR REPLACE TEMPORARY TABLE replaced_matches AS SELECT UNNEST(?::VARCHAR[]) AS match_id",
+        [[str(match_id) for match_id in match_ids]]
+    )
+    conn.execute("DELETE FROM deliveries WHERE match_id IN (SELECT match_id FROM replaced_matches)")
+    conn.execute("""
+    DELETE FROM overs WHERE innings_id IN (
+        SELECT innings_id FROM innings WHERE match_id IN (SELECT match_id FROM replaced_matches)
+    )
+    """)
+    conn.execute("DELETE FROM innings WHERE match_id IN (SELECT match_id FROM replaced_matches)")
+    conn.execute("DELETE FROM matches WHERE match_id IN (SELECT match_id FROM replaced_matches)")
+
+@instrumented
+def merge_shards(db_name=None, match_ids=None, conn=None, tables=None):
+    """Load every shard's Parquet files into the database as the normalized tables
+    
+    Synthetic player IDs are minted per shard, so they are mapped to the
+    registry ID of the same name when another shard has one, or else to one
+    synthetic ID per name. The players table is rebuilt from the merged
+    player_names, and names are resolved over the whole corpus.
+    
+    With match_ids, the rows of those matches are replaced in the existing
+    tables instead (matches without a shard file are only deleted), and
+    players keep the IDs they already have in the database.
+    
+    conn: an open connection to the database to use instead of opening one
+    tables: {table_name: DataFrame} extracted in this process, loaded as the
+    only shard instead of the shard files
+    """
+    db_path = os.path.join(DATA_DIR, db_name) if db_name else DB_PATH
+    own_conn = conn is None
+    if own_conn:
+        conn = connect_duckdb(db_path, bulk_load=True)
+    in_transaction = False
+    
+    def relation_for(table_name):
+        if tables is None:
+            return shard_relation(table_name)
+        df = tables.get(table_name)
+        if df is None or df.empty:
+            return None
+        conn.register(f"extracted_{table_name}", df.drop_duplicates())
+        return f"(SELECT *, 0 AS shard_index FROM extracted_{table_name})"
+    
+    try:
+        loaded_tables = {row[0] for row in conn.execute("SHOW TABLES").fetchall()}
+        incremental = match_ids is not None and {'players', 'player_names', *MATCH_TABLES} <= loaded_tables
+        if match_ids is not None and not incremental:
+            print("No loaded tables to update, creating them from the shards")
+        
+        shard_player_names = relation_for('player_names') or """(
+            SELECT NULL::VARCHAR AS player_name, NULL::VARCHAR AS player_id,
+                   NULL::BIGINT AS occurrences, NULL::INTEGER AS shard_index
+            LIMIT 0
+        )"""
+        known_player_names = "player_names" if incremental else "(SELECT player_name, player_id FROM shard_player_names LIMIT 0)"
+        
+        conn.execute(f"CREATE OR REPLACE TEMPORARY TABLE shard_player_names AS SELECT * FROM {shard_player_names}")
+        conn.execute(f"""
+        CREATE OR REPLACE TEMPORARY TABLE shard_player_ids AS
+        WITH registered AS (
+            SELECT player_name, MIN(player_id) AS registry_id
+            FROM (
+                SELECT player_name, player_id FROM shard_player_names
+                UNION ALL
+                SELECT player_name, player_id FROM {known_player_names}
+            )
+            WHERE player_id NOT LIKE 'SYNTH_%'
+            GROUP BY player_name
+        ),
+        known_synthetic AS (
+            SELECT player_name, MIN(player_id) AS synthetic_id
+            FROM {known_player_names}
+            WHERE player_id LIKE 'SYNTH_%'
+            GROUP BY player_name
+        ),
+        new_synthetic AS (
+            SELECT 
+                player_name,
+                'SYNTH_' || CAST(
+                    (SELECT COALESCE(MAX(CAST(SUBSTR(synthetic_id, 7) AS BIGINT)), 999999) FROM known_synthetic)
+                    + ROW_NUMBER() OVER (ORDER BY player_name) AS VARCHAR
+                ) AS synthetic_id
+            FROM (SELECT DISTINCT player_name FROM shard_player_names WHERE player_id LIKE 'SYNTH_%')
+            WHERE player_name NOT IN (SELECT player_name FROM registered)
+              AND player_name NOT IN (SELECT player_name FROM known_synthetic)
+        )
+        SELECT 
+            n.shard_index,
+            n.player_id AS shard_player_id,
+            COALESCE(r.registry_id, k.synthetic_id, s.synthetic_id) AS player_id
+        FROM shard_player_names n
+        LEFT JOIN registered r ON r.player_name = n.player_name
+        LEFT JOIN known_synthetic k ON k.player_name = n.player_name
+        LEFT JOIN new_synthetic s ON s.player_name = n.player_name
+        WHERE n.player_id LIKE 'SYNTH_%'
+        """)
+        
+        # Registry players that do not appear in the loaded matches
+        registry_players = [
+            f"SELECT player_id, player_name FROM {relation}"
+            for relation in [relation_for('players'), "players" if incremental else None] if relation
+        ]
+        conn.execute(f"""
+        CREATE OR REPLACE TEMPORARY TABLE registry_players AS
+        SELECT player_id, MODE(player_name) AS player_name
+        FROM ({' UNION ALL '.join(registry_players) or 'SELECT NULL::VARCHAR AS player_id, NULL::VARCHAR AS player_name'})
+        WHERE player_id NOT LIKE 'SYNTH_%'
+        GROUP BY player_id
+        """)
+        
+        conn.execute("BEGIN TRANSACTION")
+        in_transaction = True
+        if incremental:
+            delete_match_rows(conn, match_ids)
+        
+        for table_name in MATCH_TABLES:
+            relation = relation_for(table_name)
+            if relation is None:
+                continue
             
-            conn.execute(f"DROP TABLE IF EXISTS {table_name}")
-            conn.execute(f"CREATE TABLE {table_name} AS SELECT * FROM df")
-            print(f"Created table: {table_name}")
-            
-            # Create indexes
-            if table_name == 'matches':
-                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_id ON {table_name}(match_id)")
-                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_date ON {table_name}(date)")
-                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_type ON {table_name}(match_type)")
-            
-            elif table_name == 'players':
-                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_id ON {table_name}(player_id)")
-            
-            elif table_name == 'innings':
-                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_id ON {table_name}(innings_id)")
-                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_match ON {table_name}(match_id)")
-            
-            elif table_name == 'overs':
-                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_id ON {table_name}(over_id)")
-                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_innings ON {table_name}(innings_id)")
+            id_columns = PLAYER_ID_COLUMNS.get(table_name, [])
+            # A column without any player in it is read as all-NULL INTEGER
+            joins = "\n".join(
+                f"LEFT JOIN shard_player_ids p{i} ON p{i}.shard_index = s.shard_index AND p{i}.shard_player_id = CAST(s.{col} AS VARCHAR)"
+                for i, col in enumerate(id_columns)
+            )
+            replaced = ", ".join(f"COALESCE(p{i}.player_id, CAST(s.{col} AS VARCHAR)) AS {col}" for i, col in enumerate(id_columns))
+            select_list = f"s.* EXCLUDE (shard_index) REPLACE ({replaced})" if id_columns else "s.* EXCLUDE (shard_index)"
             
-            elif table_name == 'deliveries':
-                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_id ON {table_name}(delivery_id)")
-                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_over ON {table_name}(over_id)")
-                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_innings ON {table_name}(innings_id)")
-                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_match ON {table_name}(match_id)")
-                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_batter ON {table_name}(batter_id)")
-                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_bowler ON {table_name}(bowler_id)")
-    
-    print(f"Successfully created database at {db_path}")
-    conn.close()
+            columns = [row[0] for row in conn.execute(f"DESCRIBE SELECT {select_list} FROM {relation} s {joins}").fetchall()]
+            merged = f"(SELECT {select_list} FROM {relation} s {joins}) AS merged"
+            if incremental:
+                conn.execute(f"INSERT INTO {table_name} BY NAME {typed_select_sql(table_name, columns, merged)}")
+                print(f"Replaced rows of table: {table_name}")
+            else:
+                conn.execute(f"CREATE OR REPLACE TABLE {table_name} AS {typed_select_sql(table_name, columns, merged)}")
+                print(f"Created table: {table_name}")
+        
+        if incremental:
+            # Occurrences of the replaced matches are not kept, so count them again
+            conn.execute("DELETE FROM player_names")
+            conn.execute(f"INSERT INTO player_names BY NAME {PLAYER_NAMES_SQL}")
+        else:
+            conn.execute("""
+            CREATE OR REPLACE TABLE player_names AS
+            SELECT n.player_name, COALESCE(p.player_id, n.player_id) AS player_id, CAST(SUM(n.occurrences) AS BIGINT) AS occurrences
+            FROM shard_player_names n
+            LEFT JOIN shard_player_ids p ON p.shard_index = n.shard_index AND p.shard_player_id = n.player_id
+            GROUP BY ALL
+            """)
+        print("Created table: player_names")
+        
+        players_sql = """
+        WITH ranked AS (
+            SELECT 
+                player_id,
+                player_name,
+                ROW_NUMBER() OVER (PARTITION BY player_id ORDER BY occurrences DESC, player_name) AS name_rank
+            FROM player_names
+        )
+        SELECT 
+            player_id,
+            MAX(player_name) FILTER (WHERE name_rank = 1) AS player_name,
+            STRING_AGG(player_name, ';' ORDER BY name_rank) FILTER (WHERE name_rank > 1) AS name_variations,
+            COUNT(*) AS variant_count
+        FROM ranked
+        GROUP BY player_id
+        UNION ALL
+        SELECT player_id, player_name, NULL, 1
+        FROM registry_players
+        WHERE player_id NOT IN (SELECT player_id FROM player_names)
+        """
+        if incremental:
+            # Keep the rows, and with them the career stats step 5 added to players
+            conn.execute(f"CREATE OR REPLACE TEMPORARY TABLE merged_players AS {players_sql}")
+            conn.execute("DELETE FROM players WHERE player_id NOT IN (SELECT player_id FROM merged_players)")
+            conn.execute("""
+            UPDATE players SET
+                player_name = m.player_name,
+                name_variations = m.name_variations,
+                variant_count = m.variant_count
+            FROM merged_players m
+            WHERE players.player_id = m.player_id
+            """)
+            conn.execute("""
+            INSERT INTO players BY NAME
+            SELECT * FROM merged_players
+            WHERE player_id NOT IN (SELECT player_id FROM players)
+            """)
+        else:
+            conn.execute(f"CREATE OR REPLACE TABLE players AS {players_sql}")
+        print("Created table: players")
+        
+        resolved = resolve_database_names(conn, keep_previous=incremental and 'name_mappings' in loaded_tables)
+        print(f"Resolved {resolved} name variants")
+        conn.execute("COMMIT")
+        in_transaction = False
+        
+        # A shared connection would keep these visible to the later steps
+        for temp_table in ['shard_player_names', 'shard_player_ids', 'registry_players', 'replaced_matches', 'merged_players']:
+            conn.execute(f"DROP TABLE IF EXISTS temp.{temp_table}")
+        
+        for table_name in MATCH_TABLES + ['player_names', 'players']:
+            create_table_indexes(conn, table_name)
+        
+        synthetic_players = conn.execute("SELECT COUNT(*) FROM players WHERE player_id LIKE 'SYNTH_%'").fetchone()[0]
+        print(f"Successfully merged shards into {db_path}")
+        
+    except Exception:
+        # Leave a shared connection usable, with the tables as they were
+        if in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    
+    finally:
+        for table_name in tables or {}:
+            conn.unregister(f"extracted_{table_name}")
+        if own_conn:
+            conn.close()
+    
+    return f"Database creation successful: {synthetic_players} synthetic player IDs"
 
-def main():
+@instrumented
+def main(conn=None):
     """Main function"""
     print("Starting data unnesting and database creation...")
     
     if not os.path.exists(EXTRACTED_DIR):
         raise FileNotFoundError(f"Extracted data directory not found: {EXTRACTED_DIR}")
     
-    create_database_with_indexes(EXTRACTED_DIR)
-    
-    synthetic_players = sum(1 for pid in player_id_to_names.keys() if str(pid).startswith('SYNTH_'))
-    print(f"Database creation completed. Created {synthetic_players} synthetic player IDs.")
+    result = create_database_with_indexes(EXTRACTED_DIR, conn=conn)
+    print(f"Database creation completed. {result}")
     
     return "Database creation successful"
 
@@ -1,11 +1,116 @@
-import duckdb
 import pandas as pd
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-# Set up paths relative to Airflow directory
-BASE_DIR = '/home/lohit/airflow'
-DATA_DIR = os.path.join(BASE_DIR, 'data')
-DB_PATH = os.path.join(DATA_DIR, 'cricket_analytics.db')
+from duckdb_connection import connect_duckdb, sql_literal
+from pipeline_config import CONFIG
+from pipeline_metrics import instrumented
+from query_profiling import QueryProfiler
+from cricket_schema import COLUMN_TYPES, PLAYER_NAMES_SQL, typed_select_sql
+from quality_rules import clear_rule_partials, evaluate_rules, evaluate_rules_incremental, quality_gate
+
+# Paths from the pipeline config
+BASE_DIR = CONFIG['base_dir']
+DATA_DIR = CONFIG['data_dir']
+DB_PATH = CONFIG['db_path']
+MAX_WORKERS = CONFIG['max_workers']
+
+# Column profiles cached per table version (see table_version)
+_profile_cache = {}
+
+NUMERIC_TYPE_PREFIXES = ('TINYINT', 'SMALLINT', 'INTEGER', 'BIGINT', 'HUGEINT', 'UTINYINT',
+                         'USMALLINT', 'UINTEGER', 'UBIGINT', 'FLOAT', 'DOUBLE', 'DECIMAL')
+
+def match_scope(conn, table_name, match_ids=None):
+    """WHERE clause restricting a table to match_ids
+    
+    Tables keyed by innings_id alone (overs) are scoped through innings. The
+    clause is empty without match_ids and for tables with neither column.
+    """
+    if match_ids is None:
+        return ""
+    key_columns = {row[0] for row in conn.execute(
+        "SELECT column_name FROM duckdb_columns() "
+        "WHERE schema_name = 'main' AND table_name = ? AND column_name IN ('match_id', 'innings_id')",
+        [table_name]
+    ).fetchall()}
+    
+    values = ", ".join(sql_literal(str(match_id)) for match_id in match_ids) or "NULL"
+    if 'match_id' in key_columns:
+        return f"WHERE match_id IN ({values})"
+    if 'innings_id' in key_columns:
+        return f"WHERE innings_id IN (SELECT innings_id FROM innings WHERE match_id IN ({values}))"
+    return ""
+
+def table_version(conn, table_name, match_ids=None):
+    """Identify a table version from catalog metadata and a content hash
+    
+    A rewrite (CREATE TABLE ... AS, DROP and RENAME) gets a new table oid and
+    a schema change changes the column list. UPDATEs, and a DELETE plus INSERT
+    of as many rows, only show in the hash of every row, which is one cheap
+    scan instead of the full profile. With match_ids, the version is that of
+    the rows of those matches.
+    """
+    table_row = conn.execute(
+        "SELECT table_oid, estimated_size FROM duckdb_tables() WHERE schema_name = 'main' AND table_name = ?",
+        [table_name]
+    ).fetchone()
+    columns = conn.execute(
+        "SELECT column_name, data_type FROM duckdb_columns() "
+        "WHERE schema_name = 'main' AND table_name = ? ORDER BY column_index",
+        [table_name]
+    ).fetchall()
+    scope = match_scope(conn, table_name, match_ids)
+    content = conn.execute(f"SELECT COUNT(*), SUM(HASH({table_name})) FROM {table_name} {scope}").fetchone()
+    return (table_name, table_row, tuple(columns), content, scope)
+
+def clear_profile_cache():
+    """Forget all cached column profiles"""
+    _profile_cache.clear()
+
+def profile_table(conn, table_name, match_ids=None):
+    """Profile every column of a table with a single aggregate query
+    
+    Returns {'rows': n, 'columns': {col: {'count', 'null_count', 'min', 'max',
+    'approx_distinct', 'mean'}}}; mean is None for non-numeric columns. With
+    match_ids, tables with a match_id column are profiled on those matches.
+    """
+    version = table_version(conn, table_name, match_ids)
+    if version in _profile_cache:
+        return _profile_cache[version]
+    
+    columns, scope = version[2], version[4]
+    expressions = ["COUNT(*)"]
+    for col, data_type in columns:
+        quoted = f'"{col}"'
+        mean = f"AVG({quoted})" if data_type.startswith(NUMERIC_TYPE_PREFIXES) else "NULL"
+        expressions.extend([
+            f"COUNT({quoted})",
+            f"MIN({quoted})",
+            f"MAX({quoted})",
+            f"APPROX_COUNT_DISTINCT({quoted})",
+            mean
+        ])
+    
+    row = conn.execute(f"SELECT {', '.join(expressions)} FROM {table_name} {scope}").fetchone()
+    total_rows = row[0]
+    
+    column_profiles = {}
+    for i, (col, _) in enumerate(columns):
+        count, min_val, max_val, approx_distinct, mean = row[1 + i * 5:6 + i * 5]
+        column_profiles[col] = {
+            'count': count,
+            'null_count': total_rows - count,
+            'min': min_val,
+            'max': max_val,
+            'approx_distinct': approx_distinct,
+            'mean': mean
+        }
+    
+    profile = {'rows': total_rows, 'columns': column_profiles}
+    _profile_cache[version] = profile
+    return profile
 
 def explore_table_structure(conn, table_name):
     """Explore table structure and basic stats"""
@@ -26,8 +131,8 @@ def explore_table_structure(conn, table_name):
         print(f"Error exploring table {table_name}: {e}")
         return None
 
-def analyze_column_ranges(conn):
-    """Analyze min and max values for numeric columns"""
+def analyze_column_ranges(conn, match_ids=None):
+    """Analyze min and max values for numeric columns, of match_ids only if given"""
     columns_to_analyze = {
         'deliveries': ['over_number', 'ball_number', 'batter_runs', 'extras', 'total_runs'],
         'innings': ['innings_number'],
@@ -38,84 +143,77 @@ def analyze_column_ranges(conn):
     results = []
     
     for table, columns in columns_to_analyze.items():
+        try:
+            column_profiles = profile_table(conn, table, match_ids)['columns']
+            error = None
+        except Exception as e:
+            column_profiles = {}
+            error = e
+        
         for col in columns:
-            try:
-                query = f"SELECT MIN({col}) as min_value, MAX({col}) as max_value FROM {table}"
-                result = conn.execute(query).fetchone()
-                min_val, max_val = result
-                
-                results.append({
-                    'Table': table,
-                    'Column': col,
-                    'Min Value': min_val,
-                    'Max Value': max_val
-                })
-            except Exception as e:
-                results.append({
-                    'Table': table,
-                    'Column': col,
-                    'Min Value': f"Error: {str(e)}",
-                    'Max Value': f"Error: {str(e)}"
-                })
+            if col in column_profiles:
+                min_val = column_profiles[col]['min']
+                max_val = column_profiles[col]['max']
+            else:
+                min_val = max_val = f"Error: {str(error) if error else f'column {col} not found'}"
+            
+            results.append({
+                'Table': table,
+                'Column': col,
+                'Min Value': min_val,
+                'Max Value': max_val
+            })
     
     return pd.DataFrame(results)
 
-def apply_type_conversions(conn):
-    """Apply data type conversions for optimization"""
-    type_conversions = {
-        'deliveries': {
-            'over_number': 'SMALLINT',
-            'ball_number': 'TINYINT',
-            'batter_runs': 'TINYINT',
-            'extras': 'TINYINT',
-            'total_runs': 'TINYINT',
-            'extras_value': 'TINYINT',
-            'is_wicket': 'BOOLEAN'
-        },
-        'innings': {
-            'innings_number': 'TINYINT'
-        },
-        'matches': {
-            'overs': 'DECIMAL(4,1)',
-            'outcome_by_runs': 'SMALLINT',
-            'outcome_by_wickets': 'TINYINT'
-        },
-        'overs': {
-            'over_number': 'SMALLINT',
-            'total_runs': 'TINYINT',
-            'wickets': 'TINYINT',
-            'num_deliveries': 'TINYINT'
-        }
-    }
+def verify_column_types(conn):
+    """Compare column types with the shared schema; return the mismatches"""
+    mismatches = []
+    
+    for table, columns in COLUMN_TYPES.items():
+        actual_types = dict(conn.execute(
+            "SELECT column_name, data_type FROM duckdb_columns() WHERE schema_name = 'main' AND table_name = ?",
+            [table]
+        ).fetchall())
+        
+        for col, expected_type in columns.items():
+            if col in actual_types and actual_types[col] != expected_type:
+                mismatches.append({
+                    'table': table,
+                    'column': col,
+                    'expected': expected_type,
+                    'actual': actual_types[col]
+                })
+    
+    return mismatches
+
+def apply_type_conversions(conn, mismatches=None):
+    """Convert columns whose type differs from the shared schema
+    
+    step3 creates the tables with these types, so this only rewrites tables
+    of databases built before that (or otherwise drifted).
+    """
+    if mismatches is None:
+        mismatches = verify_column_types(conn)
     
     conversions_applied = []
     
-    for table, columns in type_conversions.items():
+    for table in sorted({mismatch['table'] for mismatch in mismatches}):
         try:
             # Get current columns
             table_columns = conn.execute(f"PRAGMA table_info('{table}')").fetchall()
             column_names = [col[1] for col in table_columns]
             
-            # Create temporary table with new schema
+            # Create temporary table with the declared schema
             temp_table = f"{table}_temp"
-            create_temp_sql = f"CREATE TABLE {temp_table} AS SELECT "
-            
-            column_clauses = []
-            for col in column_names:
-                if col in columns:
-                    column_clauses.append(f"CAST({col} AS {columns[col]}) AS {col}")
-                    conversions_applied.append(f"{table}.{col} -> {columns[col]}")
-                else:
-                    column_clauses.append(col)
-            
-            create_temp_sql += ", ".join(column_clauses)
-            create_temp_sql += f" FROM {table}"
-            
-            # Execute conversion
-            conn.execute(create_temp_sql)
+            conn.execute(f"CREATE TABLE {temp_table} AS {typed_select_sql(table, column_names, table)}")
             conn.execute(f"DROP TABLE {table}")
             conn.execute(f"ALTER TABLE {temp_table} RENAME TO {table}")
             
+            conversions_applied.extend(
+                f"{table}.{mismatch['column']} -> {mismatch['expected']}"
+                for mismatch in mismatches if mismatch['table'] == table
+            )
             print(f"Converted table: {table}")
             
         except Exception as e:
@@ -123,31 +221,31 @@ def apply_type_conversions(conn):
     
     return conversions_applied
 
-def analyze_null_values(conn):
-    """Check for NULL values in each table"""
+def analyze_null_values(conn, match_ids=None):
+    """Check for NULL values in each table, in the rows of match_ids only if given"""
     tables = conn.execute("SELECT table_name FROM information_schema.tables WHERE table_schema='main'").fetchall()
     tables = [table[0] for table in tables]
     
     null_stats = {}
     
     for table in tables:
-        columns = conn.execute(f"PRAGMA table_info('{table}')").fetchall()
-        column_names = [col[1] for col in columns]
+        try:
+            profile = profile_table(conn, table, match_ids)
+        except Exception as e:
+            print(f"Error checking nulls in {table}: {e}")
+            continue
         
+        total_rows = profile['rows']
         table_stats = {}
-        total_rows = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
         
-        for col in column_names:
-            try:
-                null_count = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {col} IS NULL").fetchone()[0]
-                null_percentage = (null_count / total_rows) * 100 if total_rows > 0 else 0
-                
-                table_stats[col] = {
-                    'null_count': null_count,
-                    'null_percentage': null_percentage
-                }
-            except Exception as e:
-                print(f"Error checking nulls in {table}.{col}: {e}")
+        for col, col_profile in profile['columns'].items():
+            null_count = col_profile['null_count']
+            null_percentage = (null_count / total_rows) * 100 if total_rows > 0 else 0
+            
+            table_stats[col] = {
+                'null_count': null_count,
+                'null_percentage': null_percentage
+            }
         
         null_stats[table] = {
             'total_rows': total_rows,
@@ -156,134 +254,233 @@ def analyze_null_values(conn):
     
     return null_stats
 
-def cricket_domain_validation(conn):
-    """Perform cricket-specific data validation"""
-    validation_results = {}
-    
-    # Check for invalid batter runs (>7)
-    try:
-        invalid_runs_query = """
-        SELECT COUNT(*) as count_invalid
-        FROM deliveries
-        WHERE batter_runs > 7
-        """
-        invalid_runs = conn.execute(invalid_runs_query).fetchone()[0]
-        validation_results['invalid_batter_runs'] = invalid_runs
-    except Exception as e:
-        validation_results['invalid_batter_runs'] = f"Error: {e}"
+# Character classes the encoding audit looks for in non-ASCII values (RE2 syntax)
+ENCODING_PATTERNS = {
+    # UTF-8 read as Latin-1/CP1252 ("Ã©", "â€™") and the replacement character
+    'mojibake': r'Ã[\x{80}-\x{BF}]|Â[\x{80}-\x{BF}]|â€|\x{FFFD}'
+}
+
+# Values without control characters (C0 other than tab and newlines, DEL and
+# the C1 range U+0080-U+009F); an anchored full match is much cheaper than
+# searching for them
+NO_CONTROL_CHARS_PATTERN = r'[\x20-\x7E\t\n\r\x{A0}-\x{10FFFF}]*'
+
+ENCODING_SAMPLE_LIMIT = 5
+
+def audit_text_encoding(conn, sample_limit=ENCODING_SAMPLE_LIMIT, match_ids=None):
+    """Count suspicious characters in every VARCHAR column with one scan per table
     
-    # Check 7-run deliveries (should be rare but valid)
-    try:
-        seven_runs_query = """
-        SELECT COUNT(*) as count_7_runs,
-               (SELECT COUNT(*) FROM deliveries) as total_deliveries
-        FROM deliveries
-        WHERE batter_runs = 7
-        """
-        result = conn.execute(seven_runs_query).fetchone()
-        seven_runs, total_deliveries = result
-        seven_runs_pct = (seven_runs / total_deliveries * 100) if total_deliveries > 0 else 0
-        validation_results['seven_run_deliveries'] = {
-            'count': seven_runs,
-            'percentage': seven_runs_pct
-        }
-    except Exception as e:
-        validation_results['seven_run_deliveries'] = f"Error: {e}"
+    Returns {table: {column: {'values', 'non_ascii', 'control_chars',
+    'mojibake', 'not_nfc', 'samples': {issue: [values]}}}} for the columns
+    with at least one issue; samples hold at most sample_limit values each.
+    With match_ids, tables with a match_id column are audited on those matches.
+    """
+    # Base tables only: duckdb_columns() also lists the catalog views and user views
+    varchar_columns = conn.execute("""
+    SELECT c.table_name, c.column_name
+    FROM duckdb_columns() c
+    JOIN duckdb_tables() t
+      ON t.database_name = c.database_name AND t.schema_name = c.schema_name AND t.table_name = c.table_name
+    WHERE c.schema_name = 'main' AND c.data_type = 'VARCHAR' AND NOT c.internal
+    ORDER BY c.table_name, c.column_index
+    """).fetchall()
     
-    # Check for matches where actual overs exceed declared limit
-    try:
-        exceeded_overs_query = """
-        WITH match_overs AS (
-            SELECT 
-                m.match_id,
-                m.match_type,
-                m.overs as declared_overs,
-                MAX(o.over_number) + 1 as max_over_number
-            FROM 
-                matches m
-            JOIN 
-                innings i ON m.match_id = i.match_id
-            JOIN 
-                overs o ON i.innings_id = o.innings_id
-            WHERE
-                m.overs IS NOT NULL AND
-                m.match_type IN ('ODI', 'T20', 'IT20', 'ODM', 'T20M')
-            GROUP BY 
-                m.match_id, m.match_type, m.overs
-        )
-        SELECT COUNT(*)
-        FROM match_overs
-        WHERE max_over_number > declared_overs * 1.1
-        """
-        exceeded_count = conn.execute(exceeded_overs_query).fetchone()[0]
-        validation_results['matches_exceeded_overs'] = exceeded_count
-    except Exception as e:
-        validation_results['matches_exceeded_overs'] = f"Error: {e}"
+    columns_by_table = {}
+    for table, col in varchar_columns:
+        columns_by_table.setdefault(table, []).append(col)
     
-    # Check over length distribution
-    try:
-        over_length_query = """
-        SELECT 
-            num_deliveries,
-            COUNT(*) as over_count
-        FROM overs
-        GROUP BY num_deliveries
-        ORDER BY num_deliveries
-        """
-        over_lengths = conn.execute(over_length_query).fetchall()
-        validation_results['over_length_distribution'] = dict(over_lengths)
-    except Exception as e:
-        validation_results['over_length_distribution'] = f"Error: {e}"
+    audit = {}
     
-    return validation_results
-
-def check_player_consistency(conn):
-    """Check player ID and name consistency"""
-    try:
-        # Check for players with missing IDs
-        missing_ids_query = """
-        WITH all_player_names AS (
-            SELECT DISTINCT batter as player_name FROM deliveries WHERE batter IS NOT NULL
-            UNION
-            SELECT DISTINCT bowler FROM deliveries WHERE bowler IS NOT NULL
-            UNION
-            SELECT DISTINCT non_striker FROM deliveries WHERE non_striker IS NOT NULL
-            UNION
-            SELECT DISTINCT wicket_player_out FROM deliveries WHERE wicket_player_out IS NOT NULL
-        )
-        SELECT COUNT(*)
-        FROM all_player_names apn
-        LEFT JOIN players p ON apn.player_name = p.player_name
-        WHERE p.player_id IS NULL
-        """
-        missing_ids = conn.execute(missing_ids_query).fetchone()[0]
-        
-        # Check for players with multiple IDs
-        multiple_ids_query = """
-        SELECT COUNT(DISTINCT player_id)
-        FROM players
-        GROUP BY player_name
-        HAVING COUNT(DISTINCT player_id) > 1
-        """
-        multiple_ids_result = conn.execute(multiple_ids_query).fetchall()
-        multiple_ids = len(multiple_ids_result)
-        
-        # Count synthetic IDs
-        synthetic_ids_query = """
-        SELECT COUNT(*)
-        FROM players
-        WHERE player_id LIKE 'SYNTH_%'
-        """
-        synthetic_ids = conn.execute(synthetic_ids_query).fetchone()[0]
+    for table, columns in columns_by_table.items():
+        issues = ['non_ascii', 'control_chars'] + list(ENCODING_PATTERNS) + ['not_nfc']
+        aggregates = []
+        for col in columns:
+            quoted = f'"{col}"'
+            # Byte and character lengths only differ for non-ASCII values, and
+            # only those need the costlier checks
+            non_ascii = f"strlen({quoted}) <> length({quoted})"
+            predicates = {
+                'non_ascii': non_ascii,
+                'control_chars': f"NOT regexp_full_match({quoted}, '{NO_CONTROL_CHARS_PATTERN}')",
+                'not_nfc': f"{non_ascii} AND nfc_normalize({quoted}) <> {quoted}"
+            }
+            for issue, pattern in ENCODING_PATTERNS.items():
+                predicates[issue] = f"{non_ascii} AND regexp_matches({quoted}, '{pattern}')"
+            
+            aggregates.append(f"COUNT({quoted})")
+            aggregates.extend(f"COUNT(*) FILTER (WHERE {predicates[issue]})" for issue in issues)
+            aggregates.extend(f"MIN({quoted}, {sample_limit}) FILTER (WHERE {predicates[issue]})" for issue in issues)
         
-        return {
-            'players_missing_ids': missing_ids,
-            'players_with_multiple_ids': multiple_ids,
-            'synthetic_player_ids': synthetic_ids
-        }
+        try:
+            row = conn.execute(
+                f"SELECT {', '.join(aggregates)} FROM {table} {match_scope(conn, table, match_ids)}"
+            ).fetchone()
+        except Exception as e:
+            print(f"Error auditing encoding in {table}: {e}")
+            continue
         
-    except Exception as e:
-        return {'error': str(e)}
+        width = 1 + 2 * len(issues)
+        for i, col in enumerate(columns):
+            values = row[i * width:(i + 1) * width]
+            counts = dict(zip(issues, values[1:1 + len(issues)]))
+            if not any(counts.values()):
+                continue
+            
+            samples = {
+                issue: sorted(set(issue_samples))
+                for issue, issue_samples in zip(issues, values[1 + len(issues):])
+                if issue_samples
+            }
+            audit.setdefault(table, {})[col] = dict(values=values[0], **counts, samples=samples)
+    
+    return audit
+
+# Relations that rules can scan in addition to the tables
+QUALITY_RELATIONS = {
+    # Highest over bowled in limited-overs matches against the declared overs
+    'match_overs': """
+    SELECT 
+        m.match_id,
+        m.match_type,
+        m.overs as declared_overs,
+        MAX(o.over_number) + 1 as max_over_number
+    FROM 
+        matches m
+    JOIN 
+        innings i ON m.match_id = i.match_id
+    JOIN 
+        overs o ON i.innings_id = o.innings_id
+    WHERE
+        m.overs IS NOT NULL AND
+        m.match_type IN ('ODI', 'T20', 'IT20', 'ODM', 'T20M')
+    GROUP BY 
+        m.match_id, m.match_type, m.overs
+    """,
+    'over_lengths': """
+    SELECT i.match_id, o.num_deliveries
+    FROM overs o
+    LEFT JOIN innings i ON o.innings_id = i.innings_id
+    """,
+    'player_name_ids': """
+    SELECT player_name, COUNT(DISTINCT player_id) as player_ids
+    FROM players
+    GROUP BY player_name
+    """
+}
+
+# Rules sharing a table are evaluated together in one scan, see quality_rules
+QUALITY_RULES = [
+    {
+        'name': 'invalid_batter_runs',
+        'table': 'deliveries',
+        'kind': 'count',
+        'where': 'batter_runs > 7',
+        'fail': 0
+    },
+    {
+        # 7-run deliveries should be rare but are valid
+        'name': 'seven_run_deliveries',
+        'table': 'deliveries',
+        'kind': 'ratio',
+        'where': 'batter_runs = 7',
+        'warn': 0.1
+    },
+    {
+        'name': 'players_missing_ids',
+        'table': 'player_names',
+        'kind': 'referential',
+        'columns': ['player_name'],
+        'references': 'players.player_name',
+        'warn': 0
+    },
+    {
+        'name': 'player_ids_missing_from_players',
+        'table': 'player_names',
+        'kind': 'referential',
+        'columns': ['player_id'],
+        'references': 'players.player_id',
+        'warn': 0
+    },
+    {
+        'name': 'matches_exceeded_overs',
+        'table': 'match_overs',
+        'kind': 'count',
+        'where': 'max_over_number > declared_overs * 1.1',
+        'warn': 0
+    },
+    {
+        'name': 'over_length_distribution',
+        'table': 'over_lengths',
+        'kind': 'distribution',
+        'column': 'num_deliveries'
+    },
+    {
+        'name': 'players_with_multiple_ids',
+        'table': 'player_name_ids',
+        'kind': 'count',
+        'where': 'player_ids > 1',
+        'warn': 0
+    },
+    {
+        'name': 'synthetic_player_ids',
+        'table': 'players',
+        'kind': 'count',
+        'where': "player_id LIKE 'SYNTH_%'"
+    }
+]
+
+def ensure_player_names(conn):
+    """Build player_names from deliveries and matches if step3 did not create it"""
+    exists = conn.execute(
+        "SELECT COUNT(*) FROM duckdb_tables() WHERE schema_name = 'main' AND table_name = 'player_names'"
+    ).fetchone()[0] > 0
+    if exists:
+        return False
+    
+    conn.execute(f"CREATE TABLE player_names AS {PLAYER_NAMES_SQL}")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_player_names_name ON player_names(player_name)")
+    return True
+
+# match_ids the stored rule partials were last brought up to date with
+QUALITY_MATCHES_TABLE = 'quality_matches'
+
+def run_quality_rules(conn, delta_match_ids=None):
+    """Evaluate the cricket data-quality rules
+    
+    With delta_match_ids, rules on relations with a match_id only rescan those
+    matches and merge the stored partials of the others.
+    """
+    if delta_match_ids is None:
+        return evaluate_rules(conn, QUALITY_RULES, QUALITY_RELATIONS)
+    return evaluate_rules_incremental(conn, QUALITY_RULES, QUALITY_RELATIONS, delta_match_ids)
+
+def quality_delta_match_ids(conn, match_ids=None):
+    """New and removed match_ids since the last step 4 run, plus match_ids"""
+    state_exists = conn.execute(
+        "SELECT COUNT(*) FROM duckdb_tables() WHERE schema_name = 'main' AND table_name = ?",
+        [QUALITY_MATCHES_TABLE]
+    ).fetchone()[0] > 0
+    
+    if state_exists:
+        delta = conn.execute(f"""
+        (SELECT match_id FROM matches EXCEPT SELECT match_id FROM {QUALITY_MATCHES_TABLE})
+        UNION
+        (SELECT match_id FROM {QUALITY_MATCHES_TABLE} EXCEPT SELECT match_id FROM matches)
+        """).fetchall()
+    else:
+        delta = conn.execute("SELECT DISTINCT match_id FROM matches").fetchall()
+    
+    delta_match_ids = {row[0] for row in delta}
+    delta_match_ids.update(str(match_id) for match_id in match_ids or [])
+    return sorted(delta_match_ids)
+
+def record_quality_matches(conn):
+    """Remember which match_ids have been validated"""
+    conn.execute(f"""
+    CREATE OR REPLACE TABLE {QUALITY_MATCHES_TABLE} AS
+    SELECT DISTINCT match_id, current_timestamp AS validated_at
+    FROM matches
+    """)
 
 def generate_summary_report(conn):
     """Generate overall summary report"""
@@ -328,14 +525,69 @@ def generate_summary_report(conn):
     
     return summary
 
-def main():
-    """Main function for post-wrangling quality assessment"""
+# Checks that run after the type conversions, keyed by report name
+VALIDATION_CHECKS = {
+    'null_analysis': analyze_null_values,
+    'encoding_audit': audit_text_encoding,
+    'quality_rules': run_quality_rules,
+    'summary': generate_summary_report
+}
+
+def run_validation_checks(conn, checks=None, max_workers=MAX_WORKERS):
+    """Run independent checks concurrently, one cursor each
+    
+    Returns {'checks': {name: {'status', 'seconds', 'result' or 'error'}},
+    'total_seconds'}.
+    """
+    if checks is None:
+        # Player consistency rules read the player_names dimension from step3
+        if ensure_player_names(conn):
+            print("player_names table was missing, built it from deliveries")
+        
+        checks = VALIDATION_CHECKS
+    
+    def run_check(item):
+        name, check = item
+        cursor = conn.cursor()
+        start = time.perf_counter()
+        try:
+            outcome = {'status': 'success', 'result': check(cursor)}
+        except Exception as e:
+            outcome = {'status': 'error', 'error': str(e)}
+        finally:
+            cursor.close()
+        outcome['seconds'] = time.perf_counter() - start
+        return name, outcome
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        results = dict(executor.map(run_check, checks.items()))
+    
+    return {
+        'checks': results,
+        'total_seconds': time.perf_counter() - start
+    }
+
+@instrumented
+def main(incremental=False, match_ids=None, conn=None):
+    """Main function for post-wrangling quality assessment
+    
+    incremental: scope the data-quality rules, null analysis, encoding audit
+                 and column ranges to matches added or removed since the
+                 last run, plus any given match_ids
+    conn:        an open connection to the database to use instead of opening one
+    """
     print("Starting post-wrangling quality assessment...")
     
-    if not os.path.exists(DB_PATH):
-        raise FileNotFoundError(f"Database not found: {DB_PATH}")
+    own_conn = conn is None
+    if own_conn:
+        if not os.path.exists(DB_PATH):
+            raise FileNotFoundError(f"Database not found: {DB_PATH}")
+        conn = connect_duckdb(DB_PATH)
     
-    conn = duckdb.connect(DB_PATH)
+    profiler = QueryProfiler('step4') if CONFIG['query_profiling'] else None
+    if profiler:
+        conn = profiler.wrap(conn)
     
     try:
         # Get list of tables
@@ -351,19 +603,58 @@ def main():
                 table_info[table_name] = info
                 print(f"Table {table_name}: {info['rows']} rows, {info['columns']} columns")
         
+        # Incremental runs check the rows of new, changed and removed matches
+        delta_match_ids = quality_delta_match_ids(conn, match_ids) if incremental else None
+        
         # Analyze column ranges
         print("Analyzing column ranges...")
-        range_analysis = analyze_column_ranges(conn)
+        range_analysis = analyze_column_ranges(conn, delta_match_ids)
         print(f"Analyzed {len(range_analysis)} columns")
         
-        # Apply type conversions
-        print("Applying type conversions...")
-        conversions = apply_type_conversions(conn)
+        # Verify column types set by step3
+        print("Verifying column types...")
+        type_mismatches = verify_column_types(conn)
+        if type_mismatches:
+            print(f"{len(type_mismatches)} columns differ from the declared schema, converting...")
+            conversions = apply_type_conversions(conn, type_mismatches)
+        else:
+            conversions = []
         print(f"Applied {len(conversions)} type conversions")
         
-        # Analyze NULL values
-        print("Analyzing NULL values...")
-        null_analysis = analyze_null_values(conn)
+        # Player consistency rules read the player_names dimension from step3
+        if ensure_player_names(conn):
+            print("player_names table was missing, built it from deliveries")
+        
+        checks = VALIDATION_CHECKS
+        if incremental:
+            print(f"Validating {len(delta_match_ids)} new or changed matches incrementally")
+            checks = dict(VALIDATION_CHECKS,
+                          null_analysis=lambda cursor: analyze_null_values(cursor, delta_match_ids),
+                          encoding_audit=lambda cursor: audit_text_encoding(cursor, match_ids=delta_match_ids),
+                          quality_rules=lambda cursor: run_quality_rules(cursor, delta_match_ids))
+        
+        # Run the checks concurrently
+        print("Running validation checks...")
+        validation_report = run_validation_checks(conn, checks)
+        
+        for name, check in validation_report['checks'].items():
+            if check['status'] == 'error':
+                raise RuntimeError(f"Validation check {name} failed: {check['error']}")
+            print(f"- {name}: {check['seconds']:.2f}s")
+        print(f"Validation checks finished in {validation_report['total_seconds']:.2f}s")
+        
+        null_analysis = validation_report['checks']['null_analysis']['result']
+        rule_results = validation_report['checks']['quality_rules']['result']
+        gate = quality_gate(rule_results)
+        
+        # A full run leaves the stored partials stale, so the next incremental
+        # run rebuilds them while checking only the matches added since
+        if not incremental:
+            clear_rule_partials(conn)
+        record_quality_matches(conn)
+        summary = validation_report['checks']['summary']['result']
+        
+        encoding_audit = validation_report['checks']['encoding_audit']['result']
         
         # Print NULL summary
         for table, stats in null_analysis.items():
@@ -372,24 +663,15 @@ def main():
             if columns_with_nulls > 0:
                 print(f"Table {table}: {columns_with_nulls} columns have NULL values")
         
-        # Cricket domain validation
-        print("Performing cricket-specific validation...")
-        validation_results = cricket_domain_validation(conn)
+        print("Encoding audit:")
+        for table, columns in encoding_audit.items():
+            for col, stats in columns.items():
+                print(f"- {table}.{col}: {stats['non_ascii']} non-ASCII, {stats['control_chars']} control, "
+                      f"{stats['mojibake']} mojibake, {stats['not_nfc']} not NFC")
         
-        print("Validation results:")
-        for key, value in validation_results.items():
-            print(f"- {key}: {value}")
-        
-        # Player consistency check
-        print("Checking player consistency...")
-        player_consistency = check_player_consistency(conn)
-        
-        print("Player consistency results:")
-        for key, value in player_consistency.items():
-            print(f"- {key}: {value}")
-        
-        # Generate summary report
-        summary = generate_summary_report(conn)
+        print(f"Quality rules (gate: {gate}):")
+        for name, result in rule_results.items():
+            print(f"- {name}: {result['value']} [{result['status']}]")
         
         print("\nSummary Report:")
         print(f"- Total matches: {summary.get('matches_count', 0)}")
@@ -408,19 +690,26 @@ def main():
             for table, info in table_info.items():
                 f.write(f"- {table}: {info['rows']} rows, {info['columns']} columns\n")
             
-            f.write(f"\nType Conversions Applied: {len(conversions)}\n")
+            f.write(f"\nColumn Type Mismatches: {len(type_mismatches)}\n")
+            f.write(f"Type Conversions Applied: {len(conversions)}\n")
             
-            f.write("\nValidation Results:\n")
-            for key, value in validation_results.items():
-                f.write(f"- {key}: {value}\n")
+            f.write("\nEncoding Audit:\n")
+            for table, columns in encoding_audit.items():
+                for col, stats in columns.items():
+                    f.write(f"- {table}.{col}: {stats}\n")
             
-            f.write("\nPlayer Consistency:\n")
-            for key, value in player_consistency.items():
-                f.write(f"- {key}: {value}\n")
+            f.write(f"\nQuality Rules (gate: {gate}):\n")
+            for name, result in rule_results.items():
+                f.write(f"- {name}: {result['value']} [{result['status']}]\n")
             
             f.write(f"\nSummary:\n")
             for key, value in summary.items():
                 f.write(f"- {key}: {value}\n")
+            
+            f.write("\nValidation Check Latency:\n")
+            for name, check in validation_report['checks'].items():
+                f.write(f"- {name}: {check['seconds']:.3f}s\n")
+            f.write(f"- total: {validation_report['total_seconds']:.3f}s\n")
         
         print(f"Summary saved to {summary_path}")
         
@@ -428,6 +717,8 @@ def main():
             'status': 'success',
             'tables_processed': len(table_names),
             'conversions_applied': len(conversions),
+            'quality_gate': gate,
+            'check_seconds': {name: check['seconds'] for name, check in validation_report['checks'].items()},
             'summary': summary
         }
         
@@ -436,7 +727,11 @@ def main():
         return {'status': 'error', 'message': str(e)}
     
     finally:
-        conn.close()
+        if profiler:
+            profiler.write_report(DATA_DIR, CONFIG['profile_top_n'])
+            conn.stop()
+        if own_conn:
+            conn.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
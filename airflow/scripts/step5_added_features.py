@@ -1,434 +1,580 @@
-import duckdb
 import pandas as pd
 import os
 
-# Set up paths relative to Airflow directory
-BASE_DIR = '/home/lohit/airflow'
-DATA_DIR = os.path.join(BASE_DIR, 'data')
-DB_PATH = os.path.join(DATA_DIR, 'cricket_analytics.db')
+from duckdb_connection import connect_duckdb
+from pipeline_config import CONFIG
+from pipeline_metrics import instrumented, write_stage_metric
+from query_profiling import QueryProfiler
+from feature_registry import apply_features, execute_feature_graph, feature_columns_by_table
 
-def add_deliveries_features(conn):
-    """Add calculated features to deliveries table"""
-    deliveries_updates = [
-        # Add new columns
-        "ALTER TABLE deliveries ADD COLUMN IF NOT EXISTS boundary_type VARCHAR;",
-        "ALTER TABLE deliveries ADD COLUMN IF NOT EXISTS is_dot_ball BOOLEAN;",
-        "ALTER TABLE deliveries ADD COLUMN IF NOT EXISTS cumulative_runs_in_innings INTEGER;",
-        "ALTER TABLE deliveries ADD COLUMN IF NOT EXISTS ball_in_over INTEGER;",
-        
-        # Update boundary_type and is_dot_ball
-        """
-        UPDATE deliveries SET
-          boundary_type = CASE
-            WHEN batter_runs = 4 THEN 'four'
-            WHEN batter_runs = 6 THEN 'six'
-            ELSE NULL
-          END,
-          is_dot_ball = CASE 
-            WHEN total_runs = 0 THEN TRUE 
-            ELSE FALSE 
-          END;
-        """,
-        
-        # Update cumulative_runs_in_innings
-        """
-        UPDATE deliveries SET
-          cumulative_runs_in_innings = t.cum_runs
-        FROM (
-          SELECT 
-            delivery_id, 
-            SUM(total_runs) OVER (
-              PARTITION BY innings_id 
-              ORDER BY over_number, ball_number
-            ) AS cum_runs
-          FROM deliveries
-        ) t
-        WHERE deliveries.delivery_id = t.delivery_id;
-        """,
-        
-        # Update ball_in_over
-        """
-        UPDATE deliveries SET
-          ball_in_over = t.ball_num
-        FROM (
-          SELECT 
-            delivery_id, 
-            ROW_NUMBER() OVER (
-              PARTITION BY over_id 
-              ORDER BY ball_number
-            ) AS ball_num
-          FROM deliveries
-        ) t
-        WHERE deliveries.delivery_id = t.delivery_id;
-        """
-    ]
-    
-    for sql in deliveries_updates:
-        conn.execute(sql)
+# Paths from the pipeline config
+BASE_DIR = CONFIG['base_dir']
+DATA_DIR = CONFIG['data_dir']
+DB_PATH = CONFIG['db_path']
+MAX_WORKERS = CONFIG['max_workers']
+
+def player_delivery_roles_view_sql():
+    """SQL creating a view with one row per (delivery, player, role)"""
+    return """
+    CREATE OR REPLACE TEMPORARY VIEW player_delivery_roles AS
+    SELECT match_id, innings_id, batter_id AS player_id, 'batter' AS role,
+           batter_runs, total_runs, is_wicket, wicket_kind
+    FROM deliveries
+    WHERE batter_id IS NOT NULL
+    UNION ALL
+    SELECT match_id, innings_id, bowler_id AS player_id, 'bowler' AS role,
+           batter_runs, total_runs, is_wicket, wicket_kind
+    FROM deliveries
+    WHERE bowler_id IS NOT NULL
+    UNION ALL
+    SELECT match_id, innings_id, non_striker_id AS player_id, 'non_striker' AS role,
+           batter_runs, total_runs, is_wicket, wicket_kind
+    FROM deliveries
+    WHERE non_striker_id IS NOT NULL
+    """
+
+def create_player_delivery_roles_view(conn):
+    """Create a view with one row per (delivery, player, role)"""
+    conn.execute(player_delivery_roles_view_sql())
+
+def players_stats_select():
+    """SELECT producing one row of player statistics per players.player_id
     
-    print("Added features to deliveries table")
+    Reads the player_delivery_roles view. Players without deliveries keep the
+    values the per-column subqueries used to give them (0 for counts, NULL
+    otherwise).
+    """
+    return """
+    WITH role_stats AS (
+        SELECT 
+            player_id,
+            COUNT(DISTINCT match_id) AS total_matches_played,
+            SUM(batter_runs) FILTER (WHERE role = 'batter') AS runs_scored,
+            COUNT(*) FILTER (WHERE role = 'batter') AS balls_faced,
+            COUNT(*) FILTER (WHERE role = 'bowler' 
+                             AND is_wicket = 1 
+                             AND wicket_kind IN ('bowled', 'caught', 'lbw', 'stumped', 'hit wicket')) AS wickets_taken,
+            SUM(total_runs) FILTER (WHERE role = 'bowler') AS runs_conceded,
+            COUNT(*) FILTER (WHERE role = 'bowler') AS balls_bowled
+        FROM player_delivery_roles
+        GROUP BY player_id
+    ),
+    innings_batting AS (
+        SELECT 
+            player_id,
+            SUM(batter_runs) AS innings_runs
+        FROM player_delivery_roles
+        WHERE role = 'batter'
+        GROUP BY match_id, innings_id, player_id
+    ),
+    batting_milestones AS (
+        SELECT 
+            player_id,
+            MAX(innings_runs) AS highest_score,
+            COUNT(*) FILTER (WHERE innings_runs >= 50 AND innings_runs < 100) AS half_centuries,
+            COUNT(*) FILTER (WHERE innings_runs >= 100) AS centuries
+        FROM innings_batting
+        GROUP BY player_id
+    )
+    SELECT 
+        p.player_id,
+        COALESCE(r.total_matches_played, 0) AS total_matches_played,
+        r.runs_scored AS total_runs_scored,
+        r.runs_scored * 100.0 / NULLIF(r.balls_faced, 0) AS batting_strike_rate,
+        COALESCE(r.wickets_taken, 0) AS total_wickets_taken,
+        r.runs_conceded * 6.0 / NULLIF(r.balls_bowled, 0) AS bowling_economy_rate,
+        b.highest_score,
+        COALESCE(b.half_centuries, 0) AS half_centuries,
+        COALESCE(b.centuries, 0) AS centuries
+    FROM players p
+    LEFT JOIN role_stats r ON r.player_id = p.player_id
+    LEFT JOIN batting_milestones b ON b.player_id = p.player_id
+    """
 
-def add_innings_features(conn):
-    """Add calculated features to innings table"""
-    innings_updates = [
-        # Add new columns
-        "ALTER TABLE innings ADD COLUMN IF NOT EXISTS total_runs INTEGER;",
-        "ALTER TABLE innings ADD COLUMN IF NOT EXISTS total_wickets INTEGER;",
-        "ALTER TABLE innings ADD COLUMN IF NOT EXISTS run_rate DOUBLE;",
-        "ALTER TABLE innings ADD COLUMN IF NOT EXISTS boundary_count INTEGER;",
-        "ALTER TABLE innings ADD COLUMN IF NOT EXISTS dot_ball_percentage DOUBLE;",
-        "ALTER TABLE innings ADD COLUMN IF NOT EXISTS powerplay_runs INTEGER;",
-        
-        # Update total_runs
-        """
-        UPDATE innings SET
-        total_runs = (SELECT SUM(total_runs) 
-                     FROM deliveries 
-                     WHERE deliveries.innings_id = innings.innings_id);
-        """,
-        
-        # Update total_wickets
-        """
-        UPDATE innings SET
-        total_wickets = (SELECT SUM(CASE WHEN is_wicket = 1 THEN 1 ELSE 0 END) 
+# Feature registry: see feature_registry.py for the entry format. Features of
+# a table are listed in the order their columns are added to it.
+FEATURES = [
+    # Deliveries features
+    {
+        # All four columns come from one windowed projection over deliveries,
+        # merged back on rowid instead of a self-join on delivery_id
+        'name': 'delivery_features',
+        'table': 'deliveries',
+        'columns': {
+            'boundary_type': 'VARCHAR',
+            'is_dot_ball': 'BOOLEAN',
+            'cumulative_runs_in_innings': 'INTEGER',
+            'ball_in_over': 'INTEGER'
+        },
+        'sql': [
+            """
+            UPDATE deliveries SET
+              boundary_type = t.boundary_type,
+              is_dot_ball = t.is_dot_ball,
+              cumulative_runs_in_innings = t.cum_runs,
+              ball_in_over = t.ball_num
+            FROM (
+              SELECT 
+                rowid AS row_id,
+                CASE
+                  WHEN batter_runs = 4 THEN 'four'
+                  WHEN batter_runs = 6 THEN 'six'
+                  ELSE NULL
+                END AS boundary_type,
+                CASE 
+                  WHEN total_runs = 0 THEN TRUE 
+                  ELSE FALSE 
+                END AS is_dot_ball,
+                SUM(total_runs) OVER (
+                  PARTITION BY innings_id 
+                  ORDER BY over_number, ball_number
+                ) AS cum_runs,
+                ROW_NUMBER() OVER (
+                  PARTITION BY over_id 
+                  ORDER BY ball_number
+                ) AS ball_num
+              FROM deliveries
+            ) t
+            WHERE deliveries.rowid = t.row_id;
+            """
+        ],
+        'depends_on': ['deliveries.batter_runs', 'deliveries.total_runs', 'deliveries.innings_id',
+                       'deliveries.over_id', 'deliveries.over_number', 'deliveries.ball_number']
+    },
+    
+    # Innings features
+    {
+        'name': 'innings_total_runs',
+        'table': 'innings',
+        'columns': {'total_runs': 'INTEGER'},
+        'sql': [
+            """
+            UPDATE innings SET
+            total_runs = (SELECT SUM(total_runs) 
                          FROM deliveries 
                          WHERE deliveries.innings_id = innings.innings_id);
-        """,
-        
-        # Update run_rate
-        """
-        UPDATE innings SET
-        run_rate = (SELECT SUM(total_runs) FROM deliveries WHERE deliveries.innings_id = innings.innings_id) /
-                  NULLIF((SELECT MAX(over_number) + (MAX(ball_number)*1.0/6) 
-                          FROM deliveries 
-                          WHERE deliveries.innings_id = innings.innings_id), 0);
-        """,
-        
-        # Update boundary_count
-        """
-        UPDATE innings SET
-        boundary_count = (SELECT COUNT(*) 
-                         FROM deliveries 
-                         WHERE deliveries.innings_id = innings.innings_id 
-                         AND (batter_runs = 4 OR batter_runs = 6));
-        """,
-        
-        # Update dot_ball_percentage
-        """
-        UPDATE innings SET
-        dot_ball_percentage = (SELECT COUNT(*) * 100.0 / NULLIF(COUNT(*), 0)
+            """
+        ],
+        'depends_on': ['innings.innings_id', 'deliveries.innings_id', 'deliveries.total_runs']
+    },
+    {
+        'name': 'innings_total_wickets',
+        'table': 'innings',
+        'columns': {'total_wickets': 'INTEGER'},
+        'sql': [
+            """
+            UPDATE innings SET
+            total_wickets = (SELECT SUM(CASE WHEN is_wicket = 1 THEN 1 ELSE 0 END) 
+                             FROM deliveries 
+                             WHERE deliveries.innings_id = innings.innings_id);
+            """
+        ],
+        'depends_on': ['innings.innings_id', 'deliveries.innings_id', 'deliveries.is_wicket']
+    },
+    {
+        'name': 'innings_run_rate',
+        'table': 'innings',
+        'columns': {'run_rate': 'DOUBLE'},
+        'sql': [
+            """
+            UPDATE innings SET
+            run_rate = (SELECT SUM(total_runs) FROM deliveries WHERE deliveries.innings_id = innings.innings_id) /
+                      NULLIF((SELECT MAX(over_number) + (MAX(ball_number)*1.0/6) 
                               FROM deliveries 
-                              WHERE deliveries.innings_id = innings.innings_id 
-                              AND total_runs = 0);
-        """,
-        
-        # Update powerplay_runs
-        """
-        UPDATE innings SET
-        powerplay_runs = (SELECT SUM(d.total_runs)
-                          FROM deliveries d
-                          JOIN overs o ON d.over_id = o.over_id
-                          WHERE d.innings_id = innings.innings_id
-                          AND innings.powerplay_start_over IS NOT NULL 
-                          AND innings.powerplay_end_over IS NOT NULL
-                          AND o.over_number >= innings.powerplay_start_over
-                          AND o.over_number <= innings.powerplay_end_over);
-        """
-    ]
+                              WHERE deliveries.innings_id = innings.innings_id), 0);
+            """
+        ],
+        'depends_on': ['innings.innings_id', 'deliveries.innings_id', 'deliveries.total_runs',
+                       'deliveries.over_number', 'deliveries.ball_number']
+    },
+    {
+        'name': 'innings_boundary_count',
+        'table': 'innings',
+        'columns': {'boundary_count': 'INTEGER'},
+        'sql': [
+            """
+            UPDATE innings SET
+            boundary_count = (SELECT COUNT(*) 
+                             FROM deliveries 
+                             WHERE deliveries.innings_id = innings.innings_id 
+                             AND (batter_runs = 4 OR batter_runs = 6));
+            """
+        ],
+        'depends_on': ['innings.innings_id', 'deliveries.innings_id', 'deliveries.batter_runs']
+    },
+    {
+        'name': 'innings_dot_ball_percentage',
+        'table': 'innings',
+        'columns': {'dot_ball_percentage': 'DOUBLE'},
+        'sql': [
+            """
+            UPDATE innings SET
+            dot_ball_percentage = (SELECT COUNT(*) * 100.0 / NULLIF(COUNT(*), 0)
+                                  FROM deliveries 
+                                  WHERE deliveries.innings_id = innings.innings_id 
+                                  AND total_runs = 0);
+            """
+        ],
+        'depends_on': ['innings.innings_id', 'deliveries.innings_id', 'deliveries.total_runs']
+    },
+    {
+        'name': 'innings_powerplay_runs',
+        'table': 'innings',
+        'columns': {'powerplay_runs': 'INTEGER'},
+        'sql': [
+            """
+            UPDATE innings SET
+            powerplay_runs = (SELECT SUM(d.total_runs)
+                              FROM deliveries d
+                              JOIN overs o ON d.over_id = o.over_id
+                              WHERE d.innings_id = innings.innings_id
+                              AND innings.powerplay_start_over IS NOT NULL 
+                              AND innings.powerplay_end_over IS NOT NULL
+                              AND o.over_number >= innings.powerplay_start_over
+                              AND o.over_number <= innings.powerplay_end_over);
+            """
+        ],
+        'depends_on': ['innings.innings_id', 'innings.powerplay_start_over', 'innings.powerplay_end_over',
+                       'deliveries.innings_id', 'deliveries.over_id', 'deliveries.total_runs',
+                       'overs.over_id', 'overs.over_number']
+    },
     
-    for sql in innings_updates:
-        conn.execute(sql)
+    # Matches features
+    {
+        'name': 'match_result',
+        'table': 'matches',
+        'columns': {'match_result': 'VARCHAR'},
+        'sql': [
+            """
+            UPDATE matches SET
+            match_result = CASE
+                WHEN outcome_winner IS NULL THEN 'No Result'
+                WHEN outcome_winner = team1 THEN team1 || ' won'
+                WHEN outcome_winner = team2 THEN team2 || ' won'
+                ELSE 'Tie'
+            END;
+            """
+        ],
+        'depends_on': ['matches.outcome_winner', 'matches.team1', 'matches.team2']
+    },
+    {
+        'name': 'match_margin_description',
+        'table': 'matches',
+        'columns': {'margin_description': 'VARCHAR'},
+        'sql': [
+            """
+            UPDATE matches SET
+            margin_description = CASE
+                WHEN outcome_by_runs > 0 THEN outcome_by_runs || ' runs'
+                WHEN outcome_by_wickets > 0 THEN outcome_by_wickets || ' wickets'
+                WHEN outcome_method IS NOT NULL THEN outcome_method
+                ELSE NULL
+            END;
+            """
+        ],
+        'depends_on': ['matches.outcome_by_runs', 'matches.outcome_by_wickets', 'matches.outcome_method']
+    },
+    {
+        # Team that bats second
+        'name': 'match_chasing_team',
+        'table': 'matches',
+        'columns': {'chasing_team': 'VARCHAR'},
+        'sql': [
+            """
+            UPDATE matches SET
+            chasing_team = (SELECT bowling_team
+                           FROM innings
+                           WHERE innings.match_id = matches.match_id
+                           AND innings_number = 1
+                           LIMIT 1);
+            """
+        ],
+        'depends_on': ['matches.match_id', 'innings.match_id', 'innings.innings_number', 'innings.bowling_team']
+    },
+    {
+        # Team that bats first
+        'name': 'match_setting_team',
+        'table': 'matches',
+        'columns': {'setting_team': 'VARCHAR'},
+        'sql': [
+            """
+            UPDATE matches SET
+            setting_team = (SELECT batting_team
+                           FROM innings
+                           WHERE innings.match_id = matches.match_id
+                           AND innings_number = 1
+                           LIMIT 1);
+            """
+        ],
+        'depends_on': ['matches.match_id', 'innings.match_id', 'innings.innings_number', 'innings.batting_team']
+    },
+    
+    # Overs features
+    {
+        # One projection over overs: a single GROUP BY over_id aggregate of
+        # deliveries, a single innings join for the powerplay range and the
+        # cumulative windows, merged back on rowid
+        'name': 'over_features',
+        'table': 'overs',
+        'columns': {
+            'run_rate': 'DOUBLE',
+            'is_powerplay': 'BOOLEAN',
+            'boundaries_in_over': 'INTEGER',
+            'dot_balls_in_over': 'INTEGER',
+            'cumulative_runs_in_innings': 'INTEGER',
+            'cumulative_wickets_in_innings': 'INTEGER'
+        },
+        'sql': [
+            """
+            UPDATE overs SET
+            run_rate = t.run_rate,
+            is_powerplay = t.is_powerplay,
+            boundaries_in_over = t.boundaries_in_over,
+            dot_balls_in_over = t.dot_balls_in_over,
+            cumulative_runs_in_innings = t.cum_runs,
+            cumulative_wickets_in_innings = t.cum_wickets
+            FROM (
+                WITH delivery_counts AS (
+                    SELECT 
+                        over_id,
+                        COUNT(*) FILTER (WHERE batter_runs = 4 OR batter_runs = 6) AS boundaries_in_over,
+                        COUNT(*) FILTER (WHERE total_runs = 0) AS dot_balls_in_over
+                    FROM deliveries
+                    GROUP BY over_id
+                )
+                SELECT 
+                    o.rowid AS row_id,
+                    o.total_runs * 1.0 / CASE WHEN o.num_deliveries > 0 THEN o.num_deliveries / 6.0 ELSE 1 END AS run_rate,
+                    CASE
+                        WHEN o.over_number >= i.powerplay_start_over
+                        AND o.over_number <= i.powerplay_end_over
+                        THEN TRUE
+                        ELSE FALSE
+                    END AS is_powerplay,
+                    COALESCE(dc.boundaries_in_over, 0) AS boundaries_in_over,
+                    COALESCE(dc.dot_balls_in_over, 0) AS dot_balls_in_over,
+                    SUM(o.total_runs) OVER (PARTITION BY o.innings_id ORDER BY o.over_number) AS cum_runs,
+                    SUM(o.wickets) OVER (PARTITION BY o.innings_id ORDER BY o.over_number) AS cum_wickets
+                FROM overs o
+                LEFT JOIN innings i ON i.innings_id = o.innings_id
+                LEFT JOIN delivery_counts dc ON dc.over_id = o.over_id
+            ) t
+            WHERE overs.rowid = t.row_id;
+            """
+        ],
+        'depends_on': ['overs.over_id', 'overs.innings_id', 'overs.over_number', 'overs.total_runs',
+                       'overs.num_deliveries', 'overs.wickets', 'innings.innings_id',
+                       'innings.powerplay_start_over', 'innings.powerplay_end_over',
+                       'deliveries.over_id', 'deliveries.batter_runs', 'deliveries.total_runs']
+    },
     
+    # Players features
+    {
+        # All statistics in one pass over the role view and one per-innings
+        # batting aggregate, merged into players with a single UPDATE.
+        # batting_average, bowling_average and the per-format match counts
+        # are reserved columns that are not filled yet.
+        'name': 'player_career_stats',
+        'table': 'players',
+        'columns': {
+            'total_matches_played': 'INTEGER',
+            'total_runs_scored': 'INTEGER',
+            'batting_strike_rate': 'DOUBLE',
+            'total_wickets_taken': 'INTEGER',
+            'bowling_economy_rate': 'DOUBLE',
+            'batting_average': 'DOUBLE',
+            'bowling_average': 'DOUBLE',
+            'highest_score': 'INTEGER',
+            'half_centuries': 'INTEGER',
+            'centuries': 'INTEGER',
+            'test_matches': 'INTEGER',
+            'odi_matches': 'INTEGER',
+            't20_matches': 'INTEGER'
+        },
+        'sql': [
+            player_delivery_roles_view_sql(),
+            f"""
+            UPDATE players SET
+                total_matches_played = s.total_matches_played,
+                total_runs_scored = s.total_runs_scored,
+                batting_strike_rate = s.batting_strike_rate,
+                total_wickets_taken = s.total_wickets_taken,
+                bowling_economy_rate = s.bowling_economy_rate,
+                highest_score = s.highest_score,
+                half_centuries = s.half_centuries,
+                centuries = s.centuries
+            FROM ({players_stats_select()}) s
+            WHERE players.player_id = s.player_id;
+            """
+        ],
+        'depends_on': ['players.player_id', 'deliveries.match_id', 'deliveries.innings_id',
+                       'deliveries.batter_id', 'deliveries.bowler_id', 'deliveries.non_striker_id',
+                       'deliveries.batter_runs', 'deliveries.total_runs', 'deliveries.is_wicket',
+                       'deliveries.wicket_kind']
+    }
+]
+
+# Feature columns added by step5 per table, in the order the ALTER TABLE path adds them
+FEATURE_COLUMNS = feature_columns_by_table(FEATURES)
+
+def table_features(table_name):
+    """Registry entries that add columns to table_name"""
+    return [feature for feature in FEATURES if feature['table'] == table_name]
+
+@instrumented(table='deliveries')
+def add_deliveries_features(conn):
+    """Add calculated features to deliveries table"""
+    apply_features(conn, table_features('deliveries'))
+    print("Added features to deliveries table")
+
+@instrumented(table='innings')
+def add_innings_features(conn):
+    """Add calculated features to innings table"""
+    apply_features(conn, table_features('innings'))
     print("Added features to innings table")
 
+@instrumented(table='matches')
 def add_matches_features(conn):
     """Add calculated features to matches table"""
-    matches_updates = [
-        # Add new columns
-        "ALTER TABLE matches ADD COLUMN IF NOT EXISTS match_result VARCHAR;",
-        "ALTER TABLE matches ADD COLUMN IF NOT EXISTS margin_description VARCHAR;",
-        "ALTER TABLE matches ADD COLUMN IF NOT EXISTS chasing_team VARCHAR;",
-        "ALTER TABLE matches ADD COLUMN IF NOT EXISTS setting_team VARCHAR;",
-        
-        # Update match_result
-        """
-        UPDATE matches SET
-        match_result = CASE
-            WHEN outcome_winner IS NULL THEN 'No Result'
-            WHEN outcome_winner = team1 THEN team1 || ' won'
-            WHEN outcome_winner = team2 THEN team2 || ' won'
-            ELSE 'Tie'
-        END;
-        """,
-        
-        # Update margin_description
-        """
-        UPDATE matches SET
-        margin_description = CASE
-            WHEN outcome_by_runs > 0 THEN outcome_by_runs || ' runs'
-            WHEN outcome_by_wickets > 0 THEN outcome_by_wickets || ' wickets'
-            WHEN outcome_method IS NOT NULL THEN outcome_method
-            ELSE NULL
-        END;
-        """,
-        
-        # Update chasing_team (team that bats second)
-        """
-        UPDATE matches SET
-        chasing_team = (SELECT bowling_team
-                       FROM innings
-                       WHERE innings.match_id = matches.match_id
-                       AND innings_number = 1
-                       LIMIT 1);
-        """,
-        
-        # Update setting_team (team that bats first)
-        """
-        UPDATE matches SET
-        setting_team = (SELECT batting_team
-                       FROM innings
-                       WHERE innings.match_id = matches.match_id
-                       AND innings_number = 1
-                       LIMIT 1);
-        """
-    ]
-    
-    for sql in matches_updates:
-        conn.execute(sql)
-    
+    apply_features(conn, table_features('matches'))
     print("Added features to matches table")
 
+@instrumented(table='overs')
 def add_overs_features(conn):
     """Add calculated features to overs table"""
-    overs_updates = [
-        # Add new columns
-        "ALTER TABLE overs ADD COLUMN IF NOT EXISTS run_rate DOUBLE;",
-        "ALTER TABLE overs ADD COLUMN IF NOT EXISTS is_powerplay BOOLEAN;",
-        "ALTER TABLE overs ADD COLUMN IF NOT EXISTS boundaries_in_over INTEGER;",
-        "ALTER TABLE overs ADD COLUMN IF NOT EXISTS dot_balls_in_over INTEGER;",
-        "ALTER TABLE overs ADD COLUMN IF NOT EXISTS cumulative_runs_in_innings INTEGER;",
-        "ALTER TABLE overs ADD COLUMN IF NOT EXISTS cumulative_wickets_in_innings INTEGER;",
-        
-        # Update run_rate
-        """
-        UPDATE overs SET
-        run_rate = total_runs * 1.0 / CASE WHEN num_deliveries > 0 THEN num_deliveries / 6.0 ELSE 1 END;
-        """,
-        
-        # Update is_powerplay
-        """
-        UPDATE overs SET
-        is_powerplay = CASE
-            WHEN over_number >= (SELECT powerplay_start_over FROM innings WHERE innings.innings_id = overs.innings_id 
-                              AND powerplay_start_over IS NOT NULL)
-            AND over_number <= (SELECT powerplay_end_over FROM innings WHERE innings.innings_id = overs.innings_id
-                             AND powerplay_end_over IS NOT NULL)
-            THEN TRUE
-            ELSE FALSE
-        END;
-        """,
-        
-        # Update boundaries_in_over
-        """
-        UPDATE overs SET
-        boundaries_in_over = (SELECT COUNT(*)
-                              FROM deliveries
-                              WHERE deliveries.over_id = overs.over_id
-                              AND (batter_runs = 4 OR batter_runs = 6));
-        """,
-        
-        # Update dot_balls_in_over
-        """
-        UPDATE overs SET
-        dot_balls_in_over = (SELECT COUNT(*)
-                             FROM deliveries
-                             WHERE deliveries.over_id = overs.over_id
-                             AND total_runs = 0);
-        """
-    ]
-    
-    # Execute basic updates first
-    for sql in overs_updates:
-        conn.execute(sql)
-    
-    # Handle cumulative values with temporary table
-    cumulative_updates = [
-        """
-        CREATE TEMPORARY TABLE temp_cumulative AS
-        SELECT 
-            over_id,
-            SUM(total_runs) OVER (PARTITION BY innings_id ORDER BY over_number) AS cum_runs,
-            SUM(wickets) OVER (PARTITION BY innings_id ORDER BY over_number) AS cum_wickets
-        FROM overs;
-        """,
-        
-        """
-        UPDATE overs SET
-        cumulative_runs_in_innings = temp_cumulative.cum_runs,
-        cumulative_wickets_in_innings = temp_cumulative.cum_wickets
-        FROM temp_cumulative
-        WHERE overs.over_id = temp_cumulative.over_id;
-        """,
-        
-        "DROP TABLE IF EXISTS temp_cumulative;"
-    ]
-    
-    for sql in cumulative_updates:
-        conn.execute(sql)
-    
+    apply_features(conn, table_features('overs'))
     print("Added features to overs table")
 
+@instrumented(table='players')
 def add_players_features(conn):
     """Add calculated features to players table"""
-    # Group 1: Add all columns first
-    players_columns = [
-        "ALTER TABLE players ADD COLUMN IF NOT EXISTS total_matches_played INTEGER;",
-        "ALTER TABLE players ADD COLUMN IF NOT EXISTS total_runs_scored INTEGER;",
-        "ALTER TABLE players ADD COLUMN IF NOT EXISTS batting_strike_rate DOUBLE;",
-        "ALTER TABLE players ADD COLUMN IF NOT EXISTS total_wickets_taken INTEGER;",
-        "ALTER TABLE players ADD COLUMN IF NOT EXISTS bowling_economy_rate DOUBLE;",
-        "ALTER TABLE players ADD COLUMN IF NOT EXISTS batting_average DOUBLE;",
-        "ALTER TABLE players ADD COLUMN IF NOT EXISTS bowling_average DOUBLE;",
-        "ALTER TABLE players ADD COLUMN IF NOT EXISTS highest_score INTEGER;",
-        "ALTER TABLE players ADD COLUMN IF NOT EXISTS half_centuries INTEGER;",
-        "ALTER TABLE players ADD COLUMN IF NOT EXISTS centuries INTEGER;",
-        "ALTER TABLE players ADD COLUMN IF NOT EXISTS test_matches INTEGER;",
-        "ALTER TABLE players ADD COLUMN IF NOT EXISTS odi_matches INTEGER;",
-        "ALTER TABLE players ADD COLUMN IF NOT EXISTS t20_matches INTEGER;"
-    ]
-    
-    for sql in players_columns:
-        conn.execute(sql)
-    
-    # Group 2: Basic statistics updates (limit to essential ones for Airflow performance)
-    players_basic_updates = [
-        # Total matches played
-        """
-        UPDATE players SET
-        total_matches_played = (
-            SELECT COUNT(DISTINCT match_id) 
-            FROM deliveries 
-            WHERE batter_id = players.player_id 
-            OR bowler_id = players.player_id 
-            OR non_striker_id = players.player_id
-        );
-        """,
-        
-        # Total runs scored
-        """
-        UPDATE players SET
-        total_runs_scored = (
-            SELECT SUM(batter_runs) 
-            FROM deliveries 
-            WHERE batter_id = players.player_id
-        );
-        """,
-        
-        # Batting strike rate
-        """
-        UPDATE players SET
-        batting_strike_rate = (
-            SELECT SUM(batter_runs) * 100.0 / NULLIF(COUNT(*), 0)
-            FROM deliveries 
-            WHERE batter_id = players.player_id
-        );
-        """,
-        
-        # Total wickets taken
-        """
-        UPDATE players SET
-        total_wickets_taken = (
-            SELECT COUNT(*) 
-            FROM deliveries 
-            WHERE bowler_id = players.player_id 
-            AND is_wicket = 1 
-            AND wicket_kind IN ('bowled', 'caught', 'lbw', 'stumped', 'hit wicket')
-        );
-        """,
-        
-        # Bowling economy rate
-        """
-        UPDATE players SET
-        bowling_economy_rate = (
-            SELECT SUM(total_runs) * 6.0 / NULLIF(COUNT(*), 0)
-            FROM deliveries 
-            WHERE bowler_id = players.player_id
-        );
-        """
-    ]
+    apply_features(conn, table_features('players'))
+    print("Added features to players table")
+
+@instrumented
+def add_features_registry(conn, max_workers=MAX_WORKERS, skip_unchanged=True):
+    """Add every registered feature in dependency order, in parallel where possible
+    
+    Each feature gets its own metric record, with the rows of its table as
+    rows_out, since features of one level run at the same time.
+    """
+    results = execute_feature_graph(conn, FEATURES, max_workers=max_workers,
+                                    skip_unchanged=skip_unchanged)
     
-    for sql in players_basic_updates:
-        conn.execute(sql)
+    table_rows = {}
+    for feature in FEATURES:
+        table_name = feature['table']
+        if table_name not in table_rows:
+            table_rows[table_name] = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        result = results[feature['name']]
+        status = 'success' if result['status'] == 'ran' else result['status']
+        write_stage_metric(f"{__name__}.feature.{feature['name']}", status, result['started_at'],
+                           result['seconds'], rows_out=table_rows[table_name])
     
-    # Group 3: More complex calculations (essential ones only)
-    players_complex_updates = [
-        # Highest score
-        """
-        UPDATE players SET
-        highest_score = (
-            WITH innings_runs AS (
-                SELECT 
-                    batter_id,
-                    SUM(batter_runs) AS total_runs
-                FROM deliveries
-                GROUP BY match_id, innings_id, batter_id
-            )
-            SELECT MAX(total_runs)
-            FROM innings_runs
-            WHERE batter_id = players.player_id
-        );
-        """,
-        
-        # Half centuries
-        """
-        UPDATE players SET
-        half_centuries = (
-            WITH innings_runs AS (
-                SELECT 
-                    batter_id,
-                    SUM(batter_runs) AS total_runs
-                FROM deliveries
-                GROUP BY match_id, innings_id, batter_id
-            )
-            SELECT COUNT(*)
-            FROM innings_runs
-            WHERE batter_id = players.player_id
-            AND total_runs >= 50 
-            AND total_runs < 100
-        );
-        """,
-        
-        # Centuries
-        """
-        UPDATE players SET
-        centuries = (
-            WITH innings_runs AS (
-                SELECT 
-                    batter_id,
-                    SUM(batter_runs) AS total_runs
-                FROM deliveries
-                GROUP BY match_id, innings_id, batter_id
-            )
-            SELECT COUNT(*)
-            FROM innings_runs
-            WHERE batter_id = players.player_id
-            AND total_runs >= 100
-        );
-        """
-    ]
+    for name, result in results.items():
+        if result['status'] == 'skipped':
+            print(f"- {name}: skipped (inputs unchanged)")
+        else:
+            print(f"- {name}: {result['seconds']:.2f}s")
     
-    for sql in players_complex_updates:
-        conn.execute(sql)
+    ran = sum(1 for result in results.values() if result['status'] == 'ran')
+    print(f"Added features: {ran} computed, {len(results) - ran} skipped")
     
-    print("Added features to players table")
+    return results
 
-def create_player_match_stats_table(conn):
-    """Create comprehensive player match statistics table"""
+def create_player_match_stats_table(conn, build_path='unpivot'):
+    """Create comprehensive player match statistics table
+    
+    build_path='unpivot' aggregates the player_delivery_roles view, so each
+    delivery is expanded into its (match_id, player_id, role) rows once.
+    build_path='legacy' keeps the original deliveries x players IN-join.
+    Both produce identical output.
+    """
     
     # Drop table if exists
     conn.execute("DROP TABLE IF EXISTS player_match_stats")
     
-    player_match_stats_sql = """
+    if build_path == 'unpivot':
+        create_player_delivery_roles_view(conn)
+        player_match_stats_sql = f"CREATE TABLE player_match_stats AS {player_match_stats_select()}"
+    elif build_path == 'legacy':
+        player_match_stats_sql = _player_match_stats_legacy_sql()
+    else:
+        raise ValueError(f"Unknown player_match_stats build path: {build_path}")
+    
+    print("Creating player_match_stats table - this may take some time...")
+    conn.execute(player_match_stats_sql)
+    
+    # Add indexes
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pms_match_id ON player_match_stats(match_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pms_player_id ON player_match_stats(player_id)")
+    
+    print("Successfully created player_match_stats table")
+
+def player_match_stats_select(roles_relation='player_delivery_roles'):
+    """SELECT building player_match_stats rows from the unpivoted role view"""
+    # player_team matches the legacy rule: team1 if the player batted in an
+    # innings where team1 was the batting team, otherwise team2.
+    return f"""
+    SELECT 
+        r.match_id,
+        m.date,
+        m.venue,
+        m.match_type,
+        m.team1,
+        m.team2,
+        p.player_id,
+        p.player_name,
+        CASE 
+            WHEN BOOL_OR(r.role = 'batter' AND i.batting_team = m.team1)
+            THEN m.team1
+            ELSE m.team2
+        END AS player_team,
+        
+        -- Batting stats
+        COUNT(DISTINCT CASE WHEN r.role = 'batter' THEN r.innings_id END) AS innings_batted,
+        SUM(CASE WHEN r.role = 'batter' THEN 1 ELSE 0 END) AS balls_faced,
+        SUM(CASE WHEN r.role = 'batter' THEN r.batter_runs ELSE 0 END) AS runs_scored,
+        SUM(CASE WHEN r.role = 'batter' AND r.batter_runs = 4 THEN 1 ELSE 0 END) AS fours,
+        SUM(CASE WHEN r.role = 'batter' AND r.batter_runs = 6 THEN 1 ELSE 0 END) AS sixes,
+        
+        -- Bowling stats
+        SUM(CASE WHEN r.role = 'bowler' THEN 1 ELSE 0 END) AS balls_bowled,
+        SUM(CASE WHEN r.role = 'bowler' THEN r.total_runs ELSE 0 END) AS runs_conceded,
+        SUM(CASE WHEN r.role = 'bowler' AND r.is_wicket = 1 
+            THEN 1 ELSE 0 END) AS wickets_taken,
+        
+        -- Performance flags
+        CASE WHEN SUM(CASE WHEN r.role = 'batter' THEN r.batter_runs ELSE 0 END) >= 50 
+             AND SUM(CASE WHEN r.role = 'batter' THEN r.batter_runs ELSE 0 END) < 100 
+             THEN TRUE ELSE FALSE END AS is_half_century,
+        
+        CASE WHEN SUM(CASE WHEN r.role = 'batter' THEN r.batter_runs ELSE 0 END) >= 100 
+             THEN TRUE ELSE FALSE END AS is_century,
+        
+        CASE WHEN SUM(CASE WHEN r.role = 'bowler' AND r.is_wicket = 1 
+                            THEN 1 ELSE 0 END) >= 5 
+             THEN TRUE ELSE FALSE END AS is_five_wicket_haul,
+        
+        -- Match result for player
+        CASE WHEN m.player_of_match_id = p.player_id THEN TRUE ELSE FALSE END AS is_player_of_match
+        
+    FROM 
+        {roles_relation} r
+    JOIN 
+        matches m ON r.match_id = m.match_id
+    JOIN 
+        players p ON p.player_id = r.player_id
+    LEFT JOIN 
+        innings i ON i.innings_id = r.innings_id
+    GROUP BY 
+        r.match_id, m.date, m.venue, m.match_type, m.team1, m.team2, 
+        p.player_id, p.player_name, m.player_of_match_id
+    """
+
+def _player_match_stats_legacy_sql():
+    """Build player_match_stats with the original IN-join over deliveries"""
+    return """
     CREATE TABLE player_match_stats AS
     SELECT 
         d.match_id,
@@ -485,15 +631,457 @@ def create_player_match_stats_table(conn):
         d.match_id, m.date, m.venue, m.match_type, m.team1, m.team2, 
         p.player_id, p.player_name, m.player_of_match_id
     """
+
+def ctas_feature_select(table_name):
+    """SELECT building the enriched table in one pass
     
-    print("Creating player_match_stats table - this may take some time...")
-    conn.execute(player_match_stats_sql)
+    The SELECT reads the base table as `base` and yields one expression per
+    FEATURE_COLUMNS entry, named after the column. `{base_columns}` is filled
+    in with the non-feature columns of the current table, and `{deliveries}`,
+    `{innings}`, ... with the relations from feature_relations().
+    """
+    feature_selects = {
+        'deliveries': """
+        SELECT {base_columns},
+            CASE
+                WHEN base.batter_runs = 4 THEN 'four'
+                WHEN base.batter_runs = 6 THEN 'six'
+                ELSE NULL
+            END AS boundary_type,
+            CASE WHEN base.total_runs = 0 THEN TRUE ELSE FALSE END AS is_dot_ball,
+            SUM(base.total_runs) OVER (
+                PARTITION BY base.innings_id
+                ORDER BY base.over_number, base.ball_number
+            ) AS cumulative_runs_in_innings,
+            ROW_NUMBER() OVER (
+                PARTITION BY base.over_id
+                ORDER BY base.ball_number
+            ) AS ball_in_over
+        FROM {deliveries} base
+        """,
+        
+        'innings': """
+        WITH delivery_stats AS (
+            SELECT 
+                innings_id,
+                SUM(total_runs) AS total_runs,
+                SUM(CASE WHEN is_wicket = 1 THEN 1 ELSE 0 END) AS total_wickets,
+                MAX(over_number) + (MAX(ball_number)*1.0/6) AS overs_bowled,
+                COUNT(*) FILTER (WHERE batter_runs = 4 OR batter_runs = 6) AS boundary_count,
+                COUNT(*) FILTER (WHERE total_runs = 0) AS dot_balls
+            FROM {deliveries}
+            GROUP BY innings_id
+        ),
+        powerplay AS (
+            SELECT 
+                d.innings_id,
+                SUM(d.total_runs) AS powerplay_runs
+            FROM {deliveries} d
+            JOIN {overs} o ON d.over_id = o.over_id
+            JOIN {innings} i ON d.innings_id = i.innings_id
+            WHERE i.powerplay_start_over IS NOT NULL 
+            AND i.powerplay_end_over IS NOT NULL
+            AND o.over_number >= i.powerplay_start_over
+            AND o.over_number <= i.powerplay_end_over
+            GROUP BY d.innings_id
+        )
+        SELECT {base_columns},
+            ds.total_runs AS total_runs,
+            ds.total_wickets AS total_wickets,
+            ds.total_runs / NULLIF(ds.overs_bowled, 0) AS run_rate,
+            COALESCE(ds.boundary_count, 0) AS boundary_count,
+            ds.dot_balls * 100.0 / NULLIF(ds.dot_balls, 0) AS dot_ball_percentage,
+            pp.powerplay_runs AS powerplay_runs
+        FROM {innings} base
+        LEFT JOIN delivery_stats ds ON ds.innings_id = base.innings_id
+        LEFT JOIN powerplay pp ON pp.innings_id = base.innings_id
+        """,
+        
+        'matches': """
+        WITH first_innings AS (
+            SELECT 
+                match_id,
+                FIRST(batting_team) AS batting_team,
+                FIRST(bowling_team) AS bowling_team
+            FROM {innings}
+            WHERE innings_number = 1
+            GROUP BY match_id
+        )
+        SELECT {base_columns},
+            CASE
+                WHEN base.outcome_winner IS NULL THEN 'No Result'
+                WHEN base.outcome_winner = base.team1 THEN base.team1 || ' won'
+                WHEN base.outcome_winner = base.team2 THEN base.team2 || ' won'
+                ELSE 'Tie'
+            END AS match_result,
+            CASE
+                WHEN base.outcome_by_runs > 0 THEN base.outcome_by_runs || ' runs'
+                WHEN base.outcome_by_wickets > 0 THEN base.outcome_by_wickets || ' wickets'
+                WHEN base.outcome_method IS NOT NULL THEN base.outcome_method
+                ELSE NULL
+            END AS margin_description,
+            fi.bowling_team AS chasing_team,
+            fi.batting_team AS setting_team
+        FROM {matches} base
+        LEFT JOIN first_innings fi ON fi.match_id = base.match_id
+        """,
+        
+        'overs': """
+        WITH delivery_counts AS (
+            SELECT 
+                over_id,
+                COUNT(*) FILTER (WHERE batter_runs = 4 OR batter_runs = 6) AS boundaries_in_over,
+                COUNT(*) FILTER (WHERE total_runs = 0) AS dot_balls_in_over
+            FROM {deliveries}
+            GROUP BY over_id
+        )
+        SELECT {base_columns},
+            base.total_runs * 1.0 / CASE WHEN base.num_deliveries > 0 THEN base.num_deliveries / 6.0 ELSE 1 END AS run_rate,
+            CASE
+                WHEN base.over_number >= i.powerplay_start_over
+                AND base.over_number <= i.powerplay_end_over
+                THEN TRUE
+                ELSE FALSE
+            END AS is_powerplay,
+            COALESCE(dc.boundaries_in_over, 0) AS boundaries_in_over,
+            COALESCE(dc.dot_balls_in_over, 0) AS dot_balls_in_over,
+            SUM(base.total_runs) OVER (PARTITION BY base.innings_id ORDER BY base.over_number) AS cumulative_runs_in_innings,
+            SUM(base.wickets) OVER (PARTITION BY base.innings_id ORDER BY base.over_number) AS cumulative_wickets_in_innings
+        FROM {overs} base
+        LEFT JOIN {innings} i ON i.innings_id = base.innings_id
+        LEFT JOIN delivery_counts dc ON dc.over_id = base.over_id
+        """,
+        
+        'players': f"""
+        SELECT {{base_columns}},
+            s.total_matches_played,
+            s.total_runs_scored,
+            s.batting_strike_rate,
+            s.total_wickets_taken,
+            s.bowling_economy_rate,
+            NULL AS batting_average,
+            NULL AS bowling_average,
+            s.highest_score,
+            s.half_centuries,
+            s.centuries,
+            NULL AS test_matches,
+            NULL AS odi_matches,
+            NULL AS t20_matches
+        FROM {{players}} base
+        LEFT JOIN ({players_stats_select()}) s ON s.player_id = base.player_id
+        """
+    }
     
-    # Add indexes
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_pms_match_id ON player_match_stats(match_id)")
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_pms_player_id ON player_match_stats(player_id)")
+    return feature_selects[table_name]
+
+def swap_table(conn, table_name, select_sql):
+    """Build select_sql into a staging table and atomically swap it in for table_name"""
+    staging_table = f"{table_name}__ctas"
     
-    print("Successfully created player_match_stats table")
+    # Indexes are dropped with the old table, so recreate them on the new one
+    index_sqls = [row[0] for row in conn.execute(
+        "SELECT sql FROM duckdb_indexes() WHERE table_name = ? AND sql IS NOT NULL",
+        [table_name]
+    ).fetchall()]
+    
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {staging_table}")
+        conn.execute(f"CREATE TABLE {staging_table} AS {select_sql}")
+        conn.execute(f"DROP TABLE {table_name}")
+        conn.execute(f"ALTER TABLE {staging_table} RENAME TO {table_name}")
+        for index_sql in index_sqls:
+            conn.execute(index_sql)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def feature_relations(changed_only=False):
+    """Relation SQL for each table the feature SELECTs read
+    
+    With changed_only, every relation is limited to the rows of the match_ids
+    in the changed_matches temporary table.
+    """
+    if not changed_only:
+        return {table: table for table in ['deliveries', 'innings', 'matches', 'overs', 'players']}
+    
+    in_changed = "match_id IN (SELECT match_id FROM changed_matches)"
+    return {
+        'deliveries': f"(SELECT * FROM deliveries WHERE {in_changed})",
+        'innings': f"(SELECT * FROM innings WHERE {in_changed})",
+        'matches': f"(SELECT * FROM matches WHERE {in_changed})",
+        'overs': f"(SELECT * FROM overs WHERE innings_id IN (SELECT innings_id FROM innings WHERE {in_changed}))",
+        'players': 'players'
+    }
+
+def feature_projection_sql(table_name, base_columns, relations):
+    """SELECT of base_columns plus every feature column of table_name"""
+    feature_columns = FEATURE_COLUMNS[table_name]
+    
+    feature_sql = ctas_feature_select(table_name).format(
+        base_columns=", ".join(f"base.{col}" for col in base_columns),
+        **relations
+    )
+    
+    # Cast to the same types the ALTER TABLE path declares
+    return f"""
+    SELECT {", ".join(base_columns)},
+        {", ".join(f"CAST({col} AS {col_type}) AS {col}" for col, col_type in feature_columns.items())}
+    FROM ({feature_sql}) enriched
+    """
+
+def materialize_features_ctas(conn, table_name):
+    """Rebuild table_name with its features using CREATE TABLE ... AS SELECT"""
+    feature_columns = FEATURE_COLUMNS[table_name]
+    
+    # Leave out feature columns from a previous run so they are recomputed
+    table_columns = conn.execute(f"PRAGMA table_info('{table_name}')").fetchall()
+    base_columns = [col[1] for col in table_columns if col[1] not in feature_columns]
+    
+    select_sql = feature_projection_sql(table_name, base_columns, feature_relations())
+    
+    swap_table(conn, table_name, select_sql)
+    print(f"Added features to {table_name} table (CTAS)")
+
+@instrumented
+def add_features_ctas(conn):
+    """Add features to every table with one CTAS and swap per table"""
+    create_player_delivery_roles_view(conn)
+    
+    for table_name in ['deliveries', 'innings', 'matches', 'overs', 'players']:
+        print(f"Adding features to {table_name} table...")
+        materialize_features_ctas(conn, table_name)
+
+# Incremental feature maintenance
+
+MATCH_STATE_TABLE = 'feature_matches'
+
+# Row key of each match-scoped table
+TABLE_KEYS = {
+    'deliveries': 'delivery_id',
+    'innings': 'innings_id',
+    'matches': 'match_id',
+    'overs': 'over_id'
+}
+
+def table_exists(conn, table_name):
+    """Check whether a table exists in the main schema"""
+    return conn.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = 'main' AND table_name = ?",
+        [table_name]
+    ).fetchone()[0] > 0
+
+def player_match_totals_select(roles_relation='player_delivery_roles'):
+    """SELECT of per-(player, match) partial sums that career stats merge from"""
+    return f"""
+    WITH match_roles AS (
+        SELECT 
+            player_id,
+            match_id,
+            SUM(batter_runs) FILTER (WHERE role = 'batter') AS runs_scored,
+            COUNT(*) FILTER (WHERE role = 'batter') AS balls_faced,
+            COUNT(*) FILTER (WHERE role = 'bowler' 
+                             AND is_wicket = 1 
+                             AND wicket_kind IN ('bowled', 'caught', 'lbw', 'stumped', 'hit wicket')) AS wickets_taken,
+            SUM(total_runs) FILTER (WHERE role = 'bowler') AS runs_conceded,
+            COUNT(*) FILTER (WHERE role = 'bowler') AS balls_bowled
+        FROM {roles_relation}
+        GROUP BY player_id, match_id
+    ),
+    innings_batting AS (
+        SELECT 
+            player_id,
+            match_id,
+            SUM(batter_runs) AS innings_runs
+        FROM {roles_relation}
+        WHERE role = 'batter'
+        GROUP BY match_id, innings_id, player_id
+    ),
+    match_batting AS (
+        SELECT 
+            player_id,
+            match_id,
+            MAX(innings_runs) AS highest_score,
+            COUNT(*) FILTER (WHERE innings_runs >= 50 AND innings_runs < 100) AS half_centuries,
+            COUNT(*) FILTER (WHERE innings_runs >= 100) AS centuries
+        FROM innings_batting
+        GROUP BY player_id, match_id
+    )
+    SELECT 
+        r.player_id,
+        r.match_id,
+        r.runs_scored,
+        r.balls_faced,
+        r.wickets_taken,
+        r.runs_conceded,
+        r.balls_bowled,
+        b.highest_score,
+        COALESCE(b.half_centuries, 0) AS half_centuries,
+        COALESCE(b.centuries, 0) AS centuries
+    FROM match_roles r
+    LEFT JOIN match_batting b ON b.player_id = r.player_id AND b.match_id = r.match_id
+    """
+
+def refresh_player_match_totals(conn):
+    """Rebuild player_match_totals for every match"""
+    create_player_delivery_roles_view(conn)
+    conn.execute(f"CREATE OR REPLACE TABLE player_match_totals AS {player_match_totals_select()}")
+
+def record_processed_matches(conn):
+    """Remember which match_ids the current features cover"""
+    conn.execute(f"""
+    CREATE OR REPLACE TABLE {MATCH_STATE_TABLE} AS
+    SELECT DISTINCT match_id, current_timestamp AS processed_at
+    FROM matches
+    """)
+
+def stage_changed_matches(conn, match_ids=None):
+    """Fill the changed_matches temp table with new, removed and given match_ids"""
+    conn.execute(f"""
+    CREATE OR REPLACE TEMPORARY TABLE changed_matches AS
+    (SELECT match_id FROM matches EXCEPT SELECT match_id FROM {MATCH_STATE_TABLE})
+    UNION
+    (SELECT match_id FROM {MATCH_STATE_TABLE} EXCEPT SELECT match_id FROM matches)
+    """)
+    
+    if match_ids:
+        conn.execute(
+            "INSERT INTO changed_matches SELECT UNNEST(?) EXCEPT SELECT match_id FROM changed_matches",
+            [[str(match_id) for match_id in match_ids]]
+        )
+    
+    return conn.execute("SELECT COUNT(*) FROM changed_matches").fetchone()[0]
+
+def update_features_for_changed_matches(conn, table_name):
+    """Recompute table_name's features for rows of changed matches only"""
+    key = TABLE_KEYS[table_name]
+    select_sql = feature_projection_sql(table_name, [key], feature_relations(changed_only=True))
+    assignments = ", ".join(f"{col} = s.{col}" for col in FEATURE_COLUMNS[table_name])
+    
+    conn.execute(f"""
+    UPDATE {table_name} SET {assignments}
+    FROM ({select_sql}) s
+    WHERE {table_name}.{key} = s.{key}
+    """)
+
+def update_player_career_stats_for_changed_matches(conn):
+    """Merge per-match partial sums of changed matches into players"""
+    roles_relation = "(SELECT * FROM player_delivery_roles WHERE match_id IN (SELECT match_id FROM changed_matches))"
+    
+    # Players in the old or new version of a changed match need new totals
+    conn.execute("""
+    CREATE OR REPLACE TEMPORARY TABLE touched_players AS
+    SELECT player_id FROM player_match_totals
+    WHERE match_id IN (SELECT match_id FROM changed_matches)
+    """)
+    conn.execute("DELETE FROM player_match_totals WHERE match_id IN (SELECT match_id FROM changed_matches)")
+    conn.execute(f"INSERT INTO player_match_totals {player_match_totals_select(roles_relation)}")
+    conn.execute("""
+    INSERT INTO touched_players
+    SELECT player_id FROM player_match_totals
+    WHERE match_id IN (SELECT match_id FROM changed_matches)
+    """)
+    # Players step 3 added since the last run, e.g. registry-only ones, have no stats yet
+    conn.execute("INSERT INTO touched_players SELECT player_id FROM players WHERE total_matches_played IS NULL")
+    
+    conn.execute("""
+    UPDATE players SET
+        total_matches_played = s.total_matches_played,
+        total_runs_scored = s.total_runs_scored,
+        batting_strike_rate = s.batting_strike_rate,
+        total_wickets_taken = s.total_wickets_taken,
+        bowling_economy_rate = s.bowling_economy_rate,
+        highest_score = s.highest_score,
+        half_centuries = s.half_centuries,
+        centuries = s.centuries
+    FROM (
+        WITH career AS (
+            SELECT 
+                player_id,
+                COUNT(*) AS total_matches_played,
+                SUM(runs_scored) AS runs_scored,
+                SUM(balls_faced) AS balls_faced,
+                SUM(wickets_taken) AS wickets_taken,
+                SUM(runs_conceded) AS runs_conceded,
+                SUM(balls_bowled) AS balls_bowled,
+                MAX(highest_score) AS highest_score,
+                SUM(half_centuries) AS half_centuries,
+                SUM(centuries) AS centuries
+            FROM player_match_totals
+            WHERE player_id IN (SELECT player_id FROM touched_players)
+            GROUP BY player_id
+        )
+        SELECT 
+            p.player_id,
+            COALESCE(c.total_matches_played, 0) AS total_matches_played,
+            c.runs_scored AS total_runs_scored,
+            c.runs_scored * 100.0 / NULLIF(c.balls_faced, 0) AS batting_strike_rate,
+            COALESCE(c.wickets_taken, 0) AS total_wickets_taken,
+            c.runs_conceded * 6.0 / NULLIF(c.balls_bowled, 0) AS bowling_economy_rate,
+            c.highest_score,
+            COALESCE(c.half_centuries, 0) AS half_centuries,
+            COALESCE(c.centuries, 0) AS centuries
+        FROM players p
+        LEFT JOIN career c ON c.player_id = p.player_id
+        WHERE p.player_id IN (SELECT player_id FROM touched_players)
+    ) s
+    WHERE players.player_id = s.player_id
+    """)
+
+def upsert_player_match_stats_for_changed_matches(conn):
+    """Replace player_match_stats rows of changed matches"""
+    roles_relation = "(SELECT * FROM player_delivery_roles WHERE match_id IN (SELECT match_id FROM changed_matches))"
+    
+    conn.execute("DELETE FROM player_match_stats WHERE match_id IN (SELECT match_id FROM changed_matches)")
+    conn.execute(f"INSERT INTO player_match_stats {player_match_stats_select(roles_relation)}")
+
+@instrumented
+def add_features_incremental(conn, match_ids=None):
+    """Recompute features only for new, removed or explicitly given match_ids
+    
+    Returns False without changing anything when a full run is needed: on the
+    first run, after step3 rebuilt a table (feature columns are missing), or
+    when the incremental state tables do not exist yet.
+    """
+    for table_name in [MATCH_STATE_TABLE, 'player_match_totals', 'player_match_stats']:
+        if not table_exists(conn, table_name):
+            print(f"No {table_name} table yet - running full feature engineering")
+            return False
+    
+    for table_name, feature_columns in FEATURE_COLUMNS.items():
+        table_columns = conn.execute(f"PRAGMA table_info('{table_name}')").fetchall()
+        if not set(feature_columns) <= {col[1] for col in table_columns}:
+            print(f"Feature columns missing from {table_name} - running full feature engineering")
+            return False
+    
+    changed_count = stage_changed_matches(conn, match_ids)
+    if changed_count == 0:
+        print("No new or changed matches - features are up to date")
+        return True
+    
+    print(f"Updating features for {changed_count} new or changed matches...")
+    create_player_delivery_roles_view(conn)
+    
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        for table_name in TABLE_KEYS:
+            update_features_for_changed_matches(conn, table_name)
+            print(f"Updated {table_name} features for changed matches")
+        
+        update_player_career_stats_for_changed_matches(conn)
+        print("Merged changed matches into players career stats")
+        
+        upsert_player_match_stats_for_changed_matches(conn)
+        print("Upserted player_match_stats rows for changed matches")
+        
+        record_processed_matches(conn)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    
+    return True
 
 def verify_features(conn):
     """Verify that features were added successfully"""
@@ -517,34 +1105,57 @@ def verify_features(conn):
     
     return verification_results
 
-def main():
-    """Main function for feature engineering"""
+@instrumented
+def main(materialization='update', max_workers=MAX_WORKERS, skip_unchanged=True,
+         incremental=False, match_ids=None, conn=None):
+    """Main function for feature engineering
+    
+    materialization='update' adds feature columns with ALTER TABLE and fills
+    them in place with UPDATE statements, running the feature registry in
+    dependency order on up to max_workers cursors and skipping features whose
+    inputs are unchanged when skip_unchanged is set. materialization='ctas'
+    rebuilds each table once with CREATE TABLE ... AS SELECT and swaps it in.
+    
+    With incremental, only matches added or removed since the last run, plus
+    any match_ids given, are recomputed. It falls back to a full run when the
+    incremental state is missing. conn is an open connection to the database
+    to use instead of opening one.
+    """
     print("Starting feature engineering...")
     
-    if not os.path.exists(DB_PATH):
-        raise FileNotFoundError(f"Database not found: {DB_PATH}")
+    if materialization not in ('update', 'ctas'):
+        raise ValueError(f"Unknown feature materialization mode: {materialization}")
     
-    conn = duckdb.connect(DB_PATH)
+    if incremental and materialization != 'update':
+        raise ValueError("Incremental feature engineering requires materialization='update'")
+    
+    own_conn = conn is None
+    if own_conn:
+        if not os.path.exists(DB_PATH):
+            raise FileNotFoundError(f"Database not found: {DB_PATH}")
+        conn = connect_duckdb(DB_PATH)
+    
+    profiler = QueryProfiler('step5') if CONFIG['query_profiling'] else None
+    if profiler:
+        conn = profiler.wrap(conn)
     
     try:
-        # Add features to each table
-        print("Adding features to deliveries table...")
-        add_deliveries_features(conn)
-        
-        print("Adding features to innings table...")
-        add_innings_features(conn)
-        
-        print("Adding features to matches table...")
-        add_matches_features(conn)
+        updated_incrementally = incremental and add_features_incremental(conn, match_ids)
         
-        print("Adding features to overs table...")
-        add_overs_features(conn)
-        
-        print("Adding features to players table...")
-        add_players_features(conn)
-        
-        print("Creating player match statistics table...")
-        create_player_match_stats_table(conn)
+        if not updated_incrementally:
+            # Add features to each table
+            if materialization == 'ctas':
+                add_features_ctas(conn)
+            else:
+                print("Adding features from the feature registry...")
+                add_features_registry(conn, max_workers=max_workers, skip_unchanged=skip_unchanged)
+            
+            print("Creating player match statistics table...")
+            create_player_match_stats_table(conn)
+            
+            # State for later incremental runs
+            refresh_player_match_totals(conn)
+            record_processed_matches(conn)
         
         # Verify features
         print("Verifying feature engineering...")
@@ -575,7 +1186,11 @@ def main():
         return {'status': 'error', 'message': str(e)}
     
     finally:
-        conn.close()
+        if profiler:
+            profiler.write_report(DATA_DIR, CONFIG['profile_top_n'])
+            conn.stop()
+        if own_conn:
+            conn.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+
+# The pipeline scripts import each other as top-level modules, as in the DAGs
+AIRFLOW_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(AIRFLOW_DIR, 'scripts'))
+sys.path.insert(0, os.path.join(AIRFLOW_DIR, 'benchmarks'))
+
+import pipeline_metrics
+
+@pytest.fixture(autouse=True)
+def metrics_path(tmp_path, monkeypatch):
+    """Keep the metric records of instrumented calls out of the data directory"""
+    path = str(tmp_path / 'pipeline_metrics.jsonl')
+    monkeypatch.setattr(pipeline_metrics, 'METRICS_PATH', path)
+    return path
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Point every step at a temporary data directory, with extracted files in extracted_data_json"""
+    import sharding
+    import step1_unzipping
+    import step2_quality_assessment_pre
+    import step3_unnesting
+    import step4_quality_assessment_post
+    import step5_added_features
+
+    path = tmp_path / 'data'
+    extracted_dir = path / 'extracted_data_json'
+    extracted_dir.mkdir(parents=True)
+    paths = {
+        'DATA_DIR': str(path),
+        'EXTRACTED_DIR': str(extracted_dir),
+        'DB_PATH': str(path / 'cricket_analytics.db'),
+        'SHARD_DIR': str(path / 'shards')
+    }
+    for module in [sharding, step1_unzipping, step2_quality_assessment_pre, step3_unnesting,
+                   step4_quality_assessment_post, step5_added_features]:
+        for name, value in paths.items():
+            if hasattr(module, name):
+                monkeypatch.setattr(module, name, value)
+    monkeypatch.setattr(step3_unnesting, 'BATCH_SIZE', 7)
+    return path
@@ -0,0 +1,27 @@
+import duckdb
+
+import sharding
+import step3_unnesting
+
+def load_step3(conn, match_ids=None, files_per_shard=10):
+    """Run the sharded step 3 over the extracted files, as the DAG does"""
+    for shard in sharding.plan_shards(files_per_shard=files_per_shard, match_ids=match_ids):
+        step3_unnesting.process_shard(**shard)
+    return step3_unnesting.merge_shards(match_ids=match_ids, conn=conn)
+
+def table_differences(conn_a, conn_b, table_name, digits=9, where=''):
+    """Rows of a table that only one of the two connections has
+
+    Columns are compared by name, and doubles to the given number of digits.
+    """
+    columns = sorted(conn_a.execute(f"DESCRIBE {table_name}").fetchall())
+    expressions = [
+        f"ROUND({name}, {digits}) AS {name}" if column_type in ('DOUBLE', 'FLOAT') else name
+        for name, column_type, *_ in columns
+    ]
+    query = f"SELECT {', '.join(expressions)} FROM {table_name} {where}"
+    df_a = conn_a.execute(query).df()
+    df_b = conn_b.execute(query).df()
+    return duckdb.sql("""
+    SELECT COUNT(*) FROM ((FROM df_a EXCEPT ALL FROM df_b) UNION ALL (FROM df_b EXCEPT ALL FROM df_a))
+    """).fetchone()[0]
@@ -0,0 +1,70 @@
+import os
+import zipfile
+
+import pytest
+
+import step1_unzipping
+from generate_corpus import DEFAULT_SETTINGS, generate_corpus
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    """Data directory paths of step 1, and a function writing all_json.zip from match files"""
+    corpus_dir = tmp_path / 'corpus'
+    generate_corpus(str(corpus_dir), 12, dict(DEFAULT_SETTINGS, malformed_rate=0), workers=1)
+
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    for name, value in {
+        'DATA_DIR': data_dir,
+        'EXTRACTED_DIR': data_dir / 'extracted_data_json',
+        'ZIP_PATH': data_dir / 'all_json.zip',
+        'ARCHIVE_MANIFEST_PATH': data_dir / 'archive_manifest.json',
+        'ARCHIVE_WATCH_PATH': data_dir / 'archive_watch.json',
+        'PENDING_ARCHIVE_PATH': data_dir / 'archive_pending.json'
+    }.items():
+        monkeypatch.setattr(step1_unzipping, name, str(value))
+
+    def write_archive(members):
+        """members: {file name: JSON text}"""
+        with zipfile.ZipFile(step1_unzipping.ZIP_PATH, 'w') as zip_ref:
+            for name, text in sorted(members.items()):
+                zip_ref.writestr(name, text)
+
+    files = {name: (corpus_dir / name).read_text() for name in sorted(os.listdir(corpus_dir))}
+    return files, write_archive
+
+def extracted_files():
+    extracted_dir = step1_unzipping.EXTRACTED_DIR
+    return {name: open(os.path.join(extracted_dir, name)).read() for name in os.listdir(extracted_dir)}
+
+def test_incremental_extraction_matches_full_extraction(archive):
+    files, write_archive = archive
+    names = sorted(files)
+    first = {name: files[name] for name in names[:8]}
+    second = {name: files[name] for name in names[3:]}
+    changed = names[5]
+    second[changed] = second[changed].replace('"season"', '"season" ', 1)
+
+    write_archive(first)
+    step1_unzipping.main()
+    step1_unzipping.commit_archive_state()
+    assert not step1_unzipping.archive_changed()
+
+    write_archive(second)
+    assert step1_unzipping.archive_changed()
+    delta = step1_unzipping.extract_changed_members()
+    match_id = lambda name: name.split('.')[0]
+    assert delta == {
+        'added': [match_id(name) for name in names[8:]],
+        'changed': [match_id(changed)],
+        'removed': [match_id(name) for name in names[:3]]
+    }
+    assert extracted_files() == second
+
+    # The run failed before it was recorded: the next run gets the same delta
+    assert step1_unzipping.archive_changed()
+    assert step1_unzipping.extract_changed_members() == delta
+
+    step1_unzipping.commit_archive_state()
+    assert not step1_unzipping.archive_changed()
+    assert step1_unzipping.extract_changed_members() == {'added': [], 'changed': [], 'removed': []}
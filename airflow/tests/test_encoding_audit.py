@@ -0,0 +1,27 @@
+import duckdb
+import pandas as pd
+
+from step4_quality_assessment_post import audit_text_encoding
+
+def test_control_characters_include_c1():
+    conn = duckdb.connect()
+    players = pd.DataFrame({'player_name': [
+        'JP Duminy',
+        'Rassie van der Dussen',
+        'Kagiso\x85Rabada',     # NEL, a C1 control left over from CP1252 text
+        'Tab\tand\nnewline',
+        'Mpho\x07Bell',
+        'Zo\xeb\xa0W\xe9ber'      # no-break space, the first character after C1
+    ]})
+    conn.execute("CREATE TABLE players AS SELECT * FROM players")
+
+    column = audit_text_encoding(conn)['players']['player_name']
+    assert column['control_chars'] == 2
+    assert sorted(column['samples']['control_chars']) == ['Kagiso\x85Rabada', 'Mpho\x07Bell']
+
+def test_only_base_tables_are_audited():
+    conn = duckdb.connect()
+    conn.execute("CREATE TABLE players AS SELECT 'Kagiso\x85Rabada' AS player_name")
+    conn.execute("CREATE VIEW player_view AS SELECT * FROM players")
+
+    assert list(audit_text_encoding(conn)) == ['players']
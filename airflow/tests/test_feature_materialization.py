@@ -0,0 +1,27 @@
+import duckdb
+
+import step5_added_features
+from generate_corpus import DEFAULT_SETTINGS, generate_corpus
+from helpers import load_step3, table_differences
+
+TABLES = ['matches', 'innings', 'overs', 'deliveries', 'players', 'player_match_stats']
+
+def test_ctas_swap_matches_update_path(data_dir):
+    settings = dict(DEFAULT_SETTINGS, registry_coverage=0.8, malformed_rate=0)
+    generate_corpus(str(data_dir / 'extracted_data_json'), 20, settings, workers=1)
+
+    update = duckdb.connect()
+    load_step3(update)
+    assert step5_added_features.main(conn=update)['status'] == 'success'
+
+    ctas = duckdb.connect()
+    load_step3(ctas)
+    assert step5_added_features.main(materialization='ctas', conn=ctas)['status'] == 'success'
+
+    for table_name in TABLES:
+        update_columns = {row[:2] for row in update.execute(f"DESCRIBE {table_name}").fetchall()}
+        ctas_columns = {row[:2] for row in ctas.execute(f"DESCRIBE {table_name}").fetchall()}
+        assert update_columns == ctas_columns, table_name
+        assert table_differences(update, ctas, table_name) == 0, table_name
+    # The staging tables of the swap are gone
+    assert not ctas.execute("SELECT table_name FROM duckdb_tables() WHERE suffix(table_name, '__ctas')").fetchall()
@@ -0,0 +1,61 @@
+import json
+import os
+import shutil
+
+import duckdb
+import pytest
+
+import step5_added_features
+from generate_corpus import DEFAULT_SETTINGS, generate_corpus
+from helpers import load_step3, table_differences
+
+TABLES = ['matches', 'innings', 'overs', 'deliveries', 'players', 'player_names', 'player_match_stats']
+
+@pytest.fixture
+def corpus(tmp_path):
+    """Match files of a generated corpus with every player registered, by file name"""
+    corpus_dir = tmp_path / 'corpus'
+    generate_corpus(str(corpus_dir), 30, dict(DEFAULT_SETTINGS, registry_coverage=1.0, malformed_rate=0), workers=1)
+    return {name: corpus_dir / name for name in sorted(os.listdir(corpus_dir))}
+
+def test_incremental_step3_and_step5_match_a_full_run(corpus, data_dir, monkeypatch):
+    extracted_dir = data_dir / 'extracted_data_json'
+    names = sorted(corpus)
+    for name in names[:24]:
+        shutil.copy(corpus[name], extracted_dir / name)
+
+    conn = duckdb.connect()
+    load_step3(conn)
+    assert step5_added_features.main(conn=conn)['status'] == 'success'
+
+    # Three matches removed, six added and one with a different first delivery
+    for name in names[:3]:
+        os.remove(extracted_dir / name)
+    for name in names[24:]:
+        shutil.copy(corpus[name], extracted_dir / name)
+    changed = names[10]
+    data = json.loads((extracted_dir / changed).read_text())
+    data['innings'][0]['overs'][0]['deliveries'][0]['runs'] = {'batter': 6, 'extras': 0, 'total': 6}
+    (extracted_dir / changed).write_text(json.dumps(data))
+    match_ids = sorted(name.split('.')[0] for name in names[:3] + names[24:] + [changed])
+
+    incremental_results = []
+    add_features_incremental = step5_added_features.add_features_incremental
+    def record_incremental(*args, **kwargs):
+        incremental_results.append(add_features_incremental(*args, **kwargs))
+        return incremental_results[-1]
+    monkeypatch.setattr(step5_added_features, 'add_features_incremental', record_incremental)
+
+    load_step3(conn, match_ids)
+    result = step5_added_features.main(incremental=True, match_ids=match_ids, conn=conn)
+    assert result['status'] == 'success'
+    assert incremental_results == [True]
+
+    full = duckdb.connect()
+    load_step3(full)
+    assert step5_added_features.main(conn=full)['status'] == 'success'
+
+    for table_name in TABLES:
+        # Incremental runs keep the registry-only players of removed matches
+        where = "WHERE player_id IN (SELECT player_id FROM player_names)" if table_name == 'players' else ''
+        assert table_differences(conn, full, table_name, where=where) == 0, table_name
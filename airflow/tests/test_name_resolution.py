@@ -0,0 +1,70 @@
+import duckdb
+import pandas as pd
+
+from name_resolution import build_name_mappings, carry_over_approvals, mapping_for
+from step3_unnesting import resolve_database_names
+
+NEAR_MISS_NAMES = {
+    'team': {'Western Province': 12, 'Eastern Province': 9, 'Western province': 2},
+    'venue': {
+        'Western Australia Cricket Association Ground': 30,
+        'South Australia Cricket Association Ground': 5,
+        "Western Australia Cricket Association Ground, Perth": 4
+    }
+}
+
+def test_near_miss_names_are_unapproved_candidates():
+    mappings = build_name_mappings(NEAR_MISS_NAMES)
+    rows = {(row.variant, row.canonical): row.approved for row in mappings.itertuples()}
+
+    assert rows[('Western province', 'Western Province')]
+    assert rows[("Western Australia Cricket Association Ground, Perth",
+                 'Western Australia Cricket Association Ground')]
+    assert not rows[('Eastern Province', 'Western Province')]
+    assert not rows[('South Australia Cricket Association Ground',
+                     'Western Australia Cricket Association Ground')]
+
+    assert mapping_for(mappings, 'team') == {'Western province': 'Western Province'}
+    assert 'South Australia Cricket Association Ground' not in mapping_for(mappings, 'venue')
+
+def test_approved_candidates_are_applied_with_their_spellings():
+    name_counts = {'team': {'Western Province': 12, 'Westren Province': 20, 'Westren province': 1}}
+    mappings = build_name_mappings(name_counts)
+    assert mapping_for(mappings, 'team') == {'Westren province': 'Westren Province'}
+
+    reviewed = mappings.copy()
+    reviewed['approved'] = True
+    mappings = carry_over_approvals(reviewed, build_name_mappings(name_counts))
+    assert mapping_for(mappings, 'team') == {
+        'Westren province': 'Westren Province',
+        'Western Province': 'Westren Province'
+    }
+
+def test_database_keeps_near_misses_until_approved():
+    conn = duckdb.connect()
+    matches = pd.DataFrame({
+        'match_id': ['1', '2', '3'],
+        'venue': ['Newlands', 'Newlands', 'Newlands'],
+        'city': ['Cape Town'] * 3,
+        'team1': ['Western Province', 'Western Province', 'Western province'],
+        'team2': ['Eastern Province'] * 3,
+        'toss_winner': ['Western Province'] * 3,
+        'outcome_winner': ['Western Province'] * 3
+    })
+    innings = pd.DataFrame({'batting_team': ['Western Province'], 'bowling_team': ['Eastern Province']})
+    player_names = pd.DataFrame({'player_name': ['A Player'], 'player_id': ['p1'], 'occurrences': [1]})
+    for name, df in [('matches', matches), ('innings', innings), ('player_names', player_names)]:
+        conn.execute(f"CREATE TABLE {name} AS SELECT * FROM df")
+
+    resolve_database_names(conn)
+    teams = {row[0] for row in conn.execute("SELECT team1 FROM matches UNION SELECT team2 FROM matches").fetchall()}
+    assert teams == {'Western Province', 'Eastern Province'}
+    assert conn.execute(
+        "SELECT approved FROM name_mappings WHERE variant = 'Eastern Province'"
+    ).fetchone() == (False,)
+
+    # A reviewer approves the candidate; the next resolution applies it
+    conn.execute("UPDATE name_mappings SET approved = true WHERE variant = 'Eastern Province'")
+    resolve_database_names(conn)
+    teams = {row[0] for row in conn.execute("SELECT team1 FROM matches UNION SELECT team2 FROM matches").fetchall()}
+    assert teams == {'Western Province'}
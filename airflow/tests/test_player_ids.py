@@ -0,0 +1,56 @@
+import json
+
+import duckdb
+
+import sharding
+import step3_unnesting
+
+def write_match(extracted_dir, match_id, date, registry):
+    """Write a one-over match between A Batter, B Bowler and C Runner, registering only `registry`"""
+    delivery = {'batter': 'A Batter', 'bowler': 'B Bowler', 'non_striker': 'C Runner',
+                'runs': {'batter': 1, 'extras': 0, 'total': 1}}
+    match = {
+        'meta': {'data_version': '1.1.0'},
+        'info': {
+            'dates': [date],
+            'match_type': 'T20',
+            'teams': ['North', 'South'],
+            'players': {'North': ['A Batter', 'C Runner'], 'South': ['B Bowler']},
+            'registry': {'people': registry},
+            'venue': 'Test Ground'
+        },
+        'innings': [{'team': 'North', 'overs': [{'over': 0, 'deliveries': [delivery] * 6}]}]
+    }
+    (extracted_dir / f"{match_id}.json").write_text(json.dumps(match))
+
+def load_player_ids(conn):
+    players = dict(conn.execute("SELECT player_name, player_id FROM players").fetchall())
+    deliveries = set(conn.execute(
+        "SELECT DISTINCT match_id, batter_id, bowler_id, non_striker_id FROM deliveries"
+    ).fetchall())
+    return players, deliveries
+
+def test_unregistered_appearances_share_the_registry_id(data_dir):
+    """A name registered in any match gets its registry ID everywhere; a never
+    registered name gets one synthetic ID, in single-process and sharded loads"""
+    extracted_dir = data_dir / 'extracted_data_json'
+    write_match(extracted_dir, '1001', '2020-01-01', {'B Bowler': 'b0000001'})
+    write_match(extracted_dir, '1002', '2020-01-02', {'A Batter': 'a0000001', 'B Bowler': 'b0000001'})
+
+    expected_players = {'A Batter': 'a0000001', 'B Bowler': 'b0000001', 'C Runner': 'SYNTH_1000000'}
+    expected_deliveries = {
+        ('1001', 'a0000001', 'b0000001', 'SYNTH_1000000'),
+        ('1002', 'a0000001', 'b0000001', 'SYNTH_1000000')
+    }
+
+    single = duckdb.connect()
+    step3_unnesting.create_database_with_indexes(str(extracted_dir), conn=single)
+    assert load_player_ids(single) == (expected_players, expected_deliveries)
+
+    sharded = duckdb.connect()
+    plan = sharding.plan_shards(str(extracted_dir), files_per_shard=1)
+    assert len(plan) == 2
+    for shard in plan:
+        step3_unnesting.process_shard(**shard)
+    step3_unnesting.merge_shards(conn=sharded)
+    assert load_player_ids(sharded) == (expected_players, expected_deliveries)
@@ -0,0 +1,102 @@
+import json
+import os
+import shutil
+
+import duckdb
+import pytest
+
+import step4_quality_assessment_post
+from generate_corpus import DEFAULT_SETTINGS, generate_corpus
+from helpers import load_step3
+from quality_rules import compile_rules, evaluate_rules
+from step4_quality_assessment_post import QUALITY_RELATIONS, QUALITY_RULES
+
+@pytest.fixture
+def loaded(data_dir):
+    """A step 3 database of a generated corpus with some invalid and 7-run deliveries"""
+    settings = dict(DEFAULT_SETTINGS, registry_coverage=0.6, malformed_rate=0)
+    generate_corpus(str(data_dir / 'extracted_data_json'), 12, settings, workers=1)
+    conn = duckdb.connect()
+    load_step3(conn)
+    conn.execute("UPDATE deliveries SET batter_runs = 8 WHERE over_number = 0 AND ball_number = 1")
+    conn.execute("UPDATE deliveries SET batter_runs = 7 WHERE over_number = 1 AND ball_number = 2")
+    return conn
+
+def test_fused_rules_match_one_query_per_rule(loaded):
+    queries = compile_rules(QUALITY_RULES, QUALITY_RELATIONS)
+    assert len(queries) == len({rule['table'] for rule in QUALITY_RULES})
+
+    fused = evaluate_rules(loaded, QUALITY_RULES, QUALITY_RELATIONS)
+    for rule in QUALITY_RULES:
+        assert fused[rule['name']] == evaluate_rules(loaded, [rule], QUALITY_RELATIONS)[rule['name']], rule['name']
+
+    # The hand-written checks the rules replaced
+    deliveries = loaded.execute("SELECT COUNT(*) FROM deliveries").fetchone()[0]
+    invalid, seven = loaded.execute("""
+    SELECT COUNT(*) FILTER (WHERE batter_runs > 7), COUNT(*) FILTER (WHERE batter_runs = 7) FROM deliveries
+    """).fetchone()
+    assert invalid > 0 and seven > 0
+    assert fused['invalid_batter_runs']['value'] == invalid
+    assert fused['invalid_batter_runs']['status'] == 'fail'
+    assert fused['seven_run_deliveries']['value'] == pytest.approx(seven / deliveries * 100)
+    assert fused['over_length_distribution']['value'] == dict(loaded.execute("""
+    SELECT num_deliveries, COUNT(*) FROM overs GROUP BY num_deliveries ORDER BY num_deliveries
+    """).fetchall())
+    assert fused['players_missing_ids']['value'] == loaded.execute("""
+    SELECT COUNT(DISTINCT player_name) FROM player_names
+    WHERE player_name NOT IN (SELECT player_name FROM players)
+    """).fetchone()[0]
+    assert fused['synthetic_player_ids']['value'] == loaded.execute(
+        "SELECT COUNT(*) FROM players WHERE player_id LIKE 'SYNTH_%'"
+    ).fetchone()[0]
+
+def test_incremental_rules_match_a_full_evaluation(data_dir, tmp_path, monkeypatch):
+    corpus_dir = tmp_path / 'corpus'
+    generate_corpus(str(corpus_dir), 20, dict(DEFAULT_SETTINGS, malformed_rate=0), workers=1)
+    names = sorted(os.listdir(corpus_dir))
+    extracted_dir = data_dir / 'extracted_data_json'
+    for name in names[:14]:
+        shutil.copy(corpus_dir / name, extracted_dir / name)
+
+    conn = duckdb.connect()
+    load_step3(conn)
+    assert step4_quality_assessment_post.main(conn=conn)['status'] == 'success'
+
+    rule_results = []
+    run_quality_rules = step4_quality_assessment_post.run_quality_rules
+    def record_rule_results(cursor, delta_match_ids=None):
+        assert delta_match_ids is not None
+        rule_results.append(run_quality_rules(cursor, delta_match_ids))
+        return rule_results[-1]
+    monkeypatch.setattr(step4_quality_assessment_post, 'run_quality_rules', record_rule_results)
+
+    # The first incremental run rebuilds the partials that the full run cleared,
+    # the second one rescans its delta only
+    changed = names[5]
+    data = json.loads((corpus_dir / changed).read_text())
+    data['innings'][0]['overs'][0]['deliveries'][0]['runs'] = {'batter': 8, 'extras': 0, 'total': 8}
+    deltas = [
+        (names[:2], names[14:17], None),
+        (names[2:3], names[17:], changed)
+    ]
+    for removed, added, changed_name in deltas:
+        for name in removed:
+            os.remove(extracted_dir / name)
+        for name in added:
+            shutil.copy(corpus_dir / name, extracted_dir / name)
+        if changed_name:
+            (extracted_dir / changed_name).write_text(json.dumps(data))
+        match_ids = sorted(name.split('.')[0] for name in removed + added + [changed_name] if name)
+
+        load_step3(conn, match_ids)
+        result = step4_quality_assessment_post.main(incremental=True, match_ids=match_ids, conn=conn)
+        assert result['status'] == 'success'
+        assert rule_results[-1] == evaluate_rules(conn, QUALITY_RULES, QUALITY_RELATIONS)
+
+    assert len(rule_results) == 2
+    assert rule_results[-1]['invalid_batter_runs']['value'] == 1
+    # Removed matches leave no partials behind
+    assert conn.execute("""
+    SELECT match_id FROM quality_partials WHERE rule_name = 'invalid_batter_runs'
+    EXCEPT SELECT match_id FROM deliveries
+    """).fetchall() == []
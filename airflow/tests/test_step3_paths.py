@@ -0,0 +1,32 @@
+import duckdb
+import pytest
+
+import sharding
+import step3_unnesting
+from generate_corpus import DEFAULT_SETTINGS, generate_corpus
+from helpers import table_differences
+
+TABLES = ['matches', 'innings', 'overs', 'deliveries', 'players', 'player_names', 'name_mappings']
+
+@pytest.fixture
+def corpus(data_dir):
+    """A generated corpus in which the same players are registered in some matches only"""
+    extracted_dir = data_dir / 'extracted_data_json'
+    settings = dict(DEFAULT_SETTINGS, registry_coverage=0.6, malformed_rate=0)
+    generate_corpus(str(extracted_dir), 40, settings, workers=1)
+    return extracted_dir
+
+def test_single_process_and_sharded_loads_match(corpus):
+    single = duckdb.connect()
+    step3_unnesting.create_database_with_indexes(str(corpus), conn=single)
+
+    sharded = duckdb.connect()
+    plan = sharding.plan_shards(str(corpus), files_per_shard=10)
+    assert len(plan) > 1
+    for shard in plan:
+        step3_unnesting.process_shard(**shard)
+    step3_unnesting.merge_shards(conn=sharded)
+
+    assert single.execute("SELECT COUNT(*) FROM players WHERE player_id LIKE 'SYNTH_%'").fetchone()[0] > 0
+    for table_name in TABLES:
+        assert table_differences(single, sharded, table_name) == 0, table_name